@@ -22,103 +22,237 @@
 import pandas as pd
 import numpy as np
 import logging 
-import pyodbc
 import re 
+import os
+from connection_manager import ConnectionManager
+from backends import backend_for
+from snapshot_cache import SnapshotCache, file_content_hash
+from null_mask import NullMaskIndex
+from compact_dtypes import compact_frame, memory_bytes, read_compact
+from report_writer import StreamingReportWriter
+from metrics_export import write_metrics
+from accumulators import (NullCountAccumulator, PairCountAccumulator, ValueCountAccumulator,
+                          count_pairs, fill_na)
 
 class Completeness:
+
+    # Range export tables and the fields pulled from them, in report order
+    LAB_TABLE = 'Laboratory Information (system)'
+    LAB_FIELDS = [
+        'ACCESSIONNUMBER',
+        'ORDERRESULTSTATUS',
+        'OBSERVATIONRESULTSTATUS',
+        'SPECCOLLECTEDDATE',
+        'SPECRECEIVEDDATE',
+        'RESULTDATE',
+        'TESTCODE',
+        'RESULTTEXT',
+        'OrganismCode',
+        'ResultedOrganism',
+        'ABNORMALFLAG',
+        'REFERENCERANGE',
+        'SPECIMENSOURCE',
+        'PROVIDERNAME',
+        'PROVIDERADDRESS',
+        'PROVIDERCITY',
+        'PROVIDERSTATE',
+        'PROVIDERZIP',
+        'PROVIDERPHONE',
+        'FACILITYADDRESS',
+        'FACILITYCITY',
+        'FACILITYSTATE',
+        'FACILITYZIP',
+        'FACILITYPHONE',
+        'FACILITYNAME',
+        'PERFORMINGFACILITYID',
+        'IncidentID',
+        'RESULT'
+    ]
+    DEMO_TABLE = 'Disease Incident Export'
+    DEMO_FIELDS = [
+        'Last_Name',
+        'First_Name',
+        'DOB',
+        'Street_Address',
+        'City',
+        'State',
+        'Zip',
+        'Home_Telephone',
+        'Race',
+        'Ethnicity',
+        'Sex',
+        'Incident_ID'
+    ]
+    # fields whose column in the export has a different name
+    FIELD_SOURCES = {'Race': 'Reported_Race'}
+    # column of each table the test centers are matched against, pulled along with the fields
+    CENTER_COLUMNS = {LAB_TABLE: 'HL7FILENAME', DEMO_TABLE: 'Laboratory'}
+    # columns in the query results that are not report fields
+    ATTRIBUTION_COLUMNS = ['HL7FILENAME', 'Laboratory', 'test_center']
+    # low-cardinality fields, loaded as category (see compact_dtypes.py)
+    CATEGORY_FIELDS = [
+        'ORDERRESULTSTATUS',
+        'OBSERVATIONRESULTSTATUS',
+        'ABNORMALFLAG',
+        'PROVIDERSTATE',
+        'FACILITYSTATE',
+        'RESULT',
+        'State',
+        'Race',
+        'Ethnicity',
+        'Sex'
+    ]
+    # fields loaded as datetime64
+    DATE_FIELDS = ['SPECCOLLECTEDDATE', 'SPECRECEIVEDDATE', 'RESULTDATE']
+    # rows per chunk when a whole query result is read with compact dtypes, see read_query()
+    READ_CHUNKSIZE = 100000
+    # fields each report stage reads, by table, see stage_df()
+    STAGE_COLUMNS = {
+        'race_ethnicity': {DEMO_TABLE: ['Ethnicity', 'Race']},
+        'resulted_organism_abflag': {LAB_TABLE: ['ABNORMALFLAG', 'ResultedOrganism']},
+        'result_abflag': {LAB_TABLE: ['ABNORMALFLAG', 'RESULT']},
+        'blank_reference_range': {LAB_TABLE: ['RESULTTEXT', 'REFERENCERANGE']}
+    }
+    # report card sheets after CompletenessReport, with the table each one shows
+    REPORT_SHEETS = [
+        ('Race_Ethnicity', 'race_ethnicity'),
+        ('ResultedOrganism_AbNormalFlag', 'resulted_organism_abflag'),
+        ('Result_AbFlag', 'result_abflag'),
+        ('Blank_ReferenceRange', 'blank_reference_range')
+    ]
+
     def __init__(
             self,
             lab_name,
             file_name,
             folder_path,
-            test_center_1, 
+            test_center_1 = None, 
             test_center_2 = None,
             test_center_3 = None,
             test_center_4 = None,
-            test_center_5 = None
+            test_center_5 = None,
+            test_centers = None,
+            snapshot_dir = 'range_export_snapshots',
+            snapshot_max_bytes = 1024 ** 3,
+            aggregate_pushdown = False,
+            chunksize = None,
+            backend = None,
+            compact_dtypes = True,
+            streaming_excel = False,
+            metrics_format = None,
+            metrics_dir = None,
+            write_excel = True
     ):
         self.lab_name = lab_name
         self.file_name = file_name
         self.folder_path = folder_path
-        self.test1 = test_center_1
-        self.test2 = test_center_2
-        self.test3 = test_center_3
-        self.test4 = test_center_4
-        self.test5 = test_center_5
+        # any number of test centers; test_center_1..5 are still accepted for older callers
+        legacy_centers = [test_center_1, test_center_2, test_center_3, test_center_4, test_center_5]
+        self.test_centers = list(test_centers or []) + [c for c in legacy_centers if c is not None]
+        if not self.test_centers:
+            raise ValueError('At least one test center is needed')
+        # one pattern matching every center, longest first so 'Palomar Medical' beats 'Palomar'
+        self._center_pattern = re.compile(
+            '(' + '|'.join(re.escape(c) for c in sorted(self.test_centers, key=len, reverse=True)) + ')',
+            re.IGNORECASE
+        )
+        self._center_names = {center.lower(): center for center in reversed(self.test_centers)}
+
+        # compute the completeness sheet with COUNT queries, see completeness_report()
+        self.aggregate_pushdown = aggregate_pushdown
+        # read the export in chunks of this many rows instead of all at once, see query_chunks()
+        self.chunksize = chunksize
+        # load categories, dates and Arrow strings instead of Python objects, see read_query()
+        self.compact_dtypes = compact_dtypes
+        # write the report card in constant memory, see write_report_streaming()
+        self.streaming_excel = streaming_excel
+        # also (or only) write the tables as 'parquet' or 'ndjson' files, see publish_report()
+        if not write_excel and not metrics_format:
+            raise ValueError('write_excel=False needs a metrics_format, nothing would be written')
+        self.metrics_format = metrics_format
+        self.metrics_dir = metrics_dir
+        self.write_excel = write_excel
+
+        # per-run memo of materialized query results, see query_df()
+        self._query_cache = {}
+        # packed null masks of those results, see null_mask()
+        self._null_masks = {}
+
+        # columnar snapshots of query results shared across runs, see query_df()
+        # (snapshot_dir=None turns them off)
+        self.snapshots = SnapshotCache(snapshot_dir, snapshot_max_bytes) if snapshot_dir else None
+        self._export_hash = None
+
+        # where the tables of the export are read from, see backends.py (Access by default)
+        self.backend = backend_for(os.path.join(folder_path, file_name), backend)
+        # one lazily opened, reused connection to the export, see database_connection()
+        self.connection = ConnectionManager(
+            connect=self.backend.connect,
+            health_check=self.backend.health_check
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Closes the managed database connection. The object can still be used afterwards; the 
+        next query will reconnect.
+        """
+
+        self.connection.close()
 
     def database_connection(self):
         """
-        Establishes a connection to the database using the provided folder path and file name.
+        Returns the managed connection to the database using the provided folder path and file name.
+        The connection is opened on first use, reused by every later query and re-opened if it 
+        fails its health check. Call close() (or use the object as a context manager) to release it.
 
         :return: A tuple containing the connection object and the cursor object.
         :rtype: tuple
         """
 
-        pyodbc.lowercase = False
-        conn = pyodbc.connect(
-            r"Driver={Microsoft Access Driver (*.mdb, *.accdb)};" +
-            fr"Dbq={self.folder_path}\{self.file_name}")
-        cursor = conn.cursor()
-        return conn, cursor
-    
-    def tstRangeQuery_lab(self):
+        return self.connection.get_connection()
+
+    def tstRangeQuery_lab(self, columns=None):
         """
         Generates a SQL query to retrieve specific fields from the 'Laboratory Information (system)'
         table based on the provided HL7 filenames.
 
+        Args:
+            columns (list, optional): Only select these fields (see project_fields()), defaults 
+                to every lab field.
+
         Returns:
             str: The SQL query string.
         """
 
         query = f'''
         SELECT 
-            ACCESSIONNUMBER,
-            ORDERRESULTSTATUS, 
-            OBSERVATIONRESULTSTATUS,
-            SPECCOLLECTEDDATE,
-            SPECRECEIVEDDATE, 
-            RESULTDATE,
-            TESTCODE, 
-            RESULTTEXT, 
-            OrganismCode,
-            ResultedOrganism,
-            ABNORMALFLAG,
-            REFERENCERANGE,
-            SPECIMENSOURCE,
-            PROVIDERNAME,
-            PROVIDERADDRESS,
-            PROVIDERCITY,
-            PROVIDERSTATE,
-            PROVIDERZIP,
-            PROVIDERPHONE,
-            FACILITYADDRESS,
-            FACILITYCITY,
-            FACILITYSTATE,
-            FACILITYZIP,
-            FACILITYPHONE, 
-            FACILITYNAME,
-            PERFORMINGFACILITYID, 
-            IncidentID,
-            RESULT
+            {self._select_list(self.project_fields(self.LAB_FIELDS, columns))},
+            {self.CENTER_COLUMNS[self.LAB_TABLE]}
         FROM 
-            [Laboratory Information (system)]
+            [{self.LAB_TABLE}]
         WHERE 
-            HL7FILENAME LIKE '%{self.test1}%' 
-            OR HL7FILENAME LIKE '%{self.test2}%'
-            OR HL7FILENAME LIKE '%{self.test3}%'
-            OR HL7FILENAME LIKE '%{self.test4}%'
-            OR HL7FILENAME LIKE '%{self.test5}%'
+            {self._test_center_filter('HL7FILENAME')}
         '''
         return query
     
-    def tstRangeQuery_demographic(self):
+    def tstRangeQuery_demographic(self, columns=None):
         """
         The function executes a SQL query to select the above fields from the 'Disease Incident Export' 
         table.The query filters the results based on the laboratory information provided through the 
         parameters.The laboratory information is used to perform partial string matching on the 
-        'Laboratory' column.If any of the laboratory keywords (self.test1, self.test2, self.test3, 
-        self.test4, self.test5) are found in the 'Laboratory' column, the corresponding 
-        disease incident record is included in the result set.
+        'Laboratory' column.If any of the laboratory keywords (self.test_centers) are found in the 
+        'Laboratory' column, the corresponding disease incident record is included in the result set.
+
+        Args:
+            columns (list, optional): Only select these fields (see project_fields()), defaults 
+                to every demographic field.
         
         Returns:
             query (str): The SQL query string for the range query on demographic information.
@@ -127,57 +261,227 @@ class Completeness:
         
         query = f'''
         SELECT 
-            Last_Name,
-            First_Name, 
-            DOB, 
-            Street_Address,
-            City,
-            State,
-            Zip,
-            Home_Telephone, 
-            Reported_Race as Race,
-            Ethnicity,
-            Sex,
-            Incident_ID
+            {self._select_list(self.project_fields(self.DEMO_FIELDS, columns))},
+            {self.CENTER_COLUMNS[self.DEMO_TABLE]}
         FROM 
-            [Disease Incident Export]
+            [{self.DEMO_TABLE}]
         WHERE 
-            Laboratory LIKE '%{self.test1}%' 
-            OR Laboratory LIKE '%{self.test2}%'
-            OR Laboratory LIKE '%{self.test3}%'
-            OR Laboratory LIKE '%{self.test4}%'
-            OR Laboratory LIKE '%{self.test5}%'
+            {self._test_center_filter('Laboratory')}
             '''
         return query
 
-    def completeness_report(self):
+    def tstRangeQuery_lab_counts(self):
+        """
+        Aggregate version of tstRangeQuery_lab(): same table, fields and filter, but Access only 
+        returns one row with COUNT(*) and COUNT(field) for every field.
+
+        Returns:
+            str: The SQL query string.
+        """
+
+        return self._count_query(self.LAB_FIELDS, self.LAB_TABLE, 'HL7FILENAME')
+
+    def tstRangeQuery_demographic_counts(self):
+        """
+        Aggregate version of tstRangeQuery_demographic(): same table, fields and filter, but Access 
+        only returns one row with COUNT(*) and COUNT(field) for every field.
+
+        Returns:
+            str: The SQL query string.
+        """
+
+        return self._count_query(self.DEMO_FIELDS, self.DEMO_TABLE, 'Laboratory')
+
+    @staticmethod
+    def project_fields(fields, columns=None):
+        """
+        Returns the fields of a table that are in columns, in the order of fields (all of them 
+        when columns is None).
+
+        Raises:
+            ValueError: If a column is not one of the fields.
+        """
+
+        if columns is None:
+            return list(fields)
+        unknown = [col for col in columns if col not in fields]
+        if unknown:
+            raise ValueError(f'Not a field of the table: {", ".join(unknown)}')
+        return [field for field in fields if field in columns]
+
+    def table_query(self, table, columns=None):
+        """
+        Returns the range query of table (LAB_TABLE or DEMO_TABLE), projected on columns.
+        """
+
+        if table == self.LAB_TABLE:
+            return self.tstRangeQuery_lab(columns)
+        return self.tstRangeQuery_demographic(columns)
+
+    def projected_df(self, table, columns):
+        """
+        Returns the rows of the range query of table with only the fields in columns (plus the 
+        test center attribution). If the full query result is already loaded it is sliced, 
+        otherwise only those fields are queried, so a stage that needs a couple of columns never 
+        pulls the whole table.
+
+        Args:
+            table (str): LAB_TABLE or DEMO_TABLE.
+            columns (list): The fields needed.
+
+        Returns:
+            pandas.DataFrame: The projected query result. It may be shared, do not modify it in place.
+        """
+
+        fields = self.project_fields(self.LAB_FIELDS if table == self.LAB_TABLE else self.DEMO_FIELDS, columns)
+        full_query = self.table_query(table)
+        if not self.is_query_cached(full_query):
+            return self.query_df(self.table_query(table, fields))
+        full_df = self.query_df(full_query)
+        return full_df[fields + [col for col in self.ATTRIBUTION_COLUMNS if col in full_df.columns]]
+
+    def stage_df(self, stage):
+        """
+        Returns the projected query result a report stage reads, with the fields it declares in 
+        STAGE_COLUMNS.
+        """
+
+        (table, columns), = self.STAGE_COLUMNS[stage].items()
+        return self.projected_df(table, columns)
+
+    def _select_list(self, fields):
+        """
+        Builds the SELECT list for fields, aliasing renamed columns (e.g. Reported_Race as Race).
+        """
+
+        return ',\n            '.join(
+            f'{self.FIELD_SOURCES[field]} as {field}' if field in self.FIELD_SOURCES else field
+            for field in fields
+        )
+
+    def _test_center_filter(self, column):
+        """
+        Builds the WHERE clause matching any of the test centers anywhere in column.
+        """
+
+        # quotes are doubled so a center name cannot end the SQL string
+        return '\n            OR '.join(
+            f"{column} LIKE '%{center.replace(chr(39), chr(39) * 2)}%'" for center in self.test_centers
+        )
+
+    def attribute_test_centers(self, df):
+        """
+        Adds a 'test_center' column naming the test center each row belongs to, found with one 
+        case-insensitive pass of the combined center pattern over HL7FILENAME (lab) or Laboratory 
+        (demographics). A row matching several centers is attributed to the first one in the text. 
+        Frames without either column are returned unchanged.
+
+        Args:
+            df (pandas.DataFrame): A freshly loaded query result, modified in place.
+
+        Returns:
+            pandas.DataFrame: df
+        """
+
+        for column in self.CENTER_COLUMNS.values():
+            if column in df.columns:
+                values = df[column].astype(object).where(df[column].notna(), '').astype(str)
+                matched = values.str.extract(self._center_pattern, expand=False)
+                df['test_center'] = matched.str.lower().map(self._center_names).to_numpy()
+                break
+        return df
+
+    def report_fields(self, columns):
+        """
+        Returns the columns of a query result that are report fields (everything but the test 
+        center attribution columns).
+        """
+
+        return [col for col in columns if col not in self.ATTRIBUTION_COLUMNS]
+
+    def _count_query(self, fields, table, filter_column):
+        """
+        Builds a single-row aggregate query: COUNT(*) as total_rows and COUNT(field) for every field. 
+        The counts are aliased by position (count_0, count_1, ...) because Access rejects an alias 
+        that is the same as the column it aggregates.
+        """
+
+        counts = ',\n            '.join(
+            f'COUNT({self.FIELD_SOURCES.get(field, field)}) as count_{i}' for i, field in enumerate(fields)
+        )
+        query = f'''
+        SELECT 
+            COUNT(*) as total_rows,
+            {counts}
+        FROM 
+            [{table}]
+        WHERE 
+            {self._test_center_filter(filter_column)}
+        '''
+        return query
+
+    def completeness_report(self, pushdown=None):
         """
         After generating queries used to grab information from the .accdb files that are related to 
         WebCMR Lab and Demographics tab, we create a dataframe from them using range_export() method.
         The dataframe contains percent completeness of each desired field. Finally we combine both 
         dataframes into one excel sheet, which results in our final completeness summary report
-        
+
+        In aggregate pushdown mode the percentages come from COUNT queries instead 
+        (see range_export_counts()), so the rows are only pulled into pandas by the stages that 
+        need them. A query whose rows are already loaded is still answered from memory.
+
+        :param pushdown: Use COUNT queries, defaults to the aggregate_pushdown setting of the object.
         :return: A tuple containing two dataframes: lab_df and demo_df.
         :rtype: tuple
         """
 
+        if pushdown is None:
+            pushdown = self.aggregate_pushdown
 
         # generating queries for both Laboratory data and Demographic data 
         lab_query = self.tstRangeQuery_lab()
         demo_query = self.tstRangeQuery_demographic()
 
         # Creating dataframes from query results 
-        lab_df = self.range_export_df(lab_query)
-        demo_df = self.range_export_df(demo_query)
+        if pushdown and not self.is_query_cached(lab_query):
+            lab_df = self.range_export_counts(self.tstRangeQuery_lab_counts(), self.LAB_FIELDS)
+        else:
+            lab_df = self.range_export_df(lab_query)
+        if pushdown and not self.is_query_cached(demo_query):
+            demo_df = self.range_export_counts(self.tstRangeQuery_demographic_counts(), self.DEMO_FIELDS)
+        else:
+            demo_df = self.range_export_df(demo_query)
 
         return lab_df, demo_df
 
+    def range_export_counts(self, count_query, fields):
+        """
+        Same output as range_export_df(), computed from the single row returned by a count query 
+        built by _count_query().
+
+        Args:
+            count_query (str): The aggregate SQL query.
+            fields (list): The fields the query counts, in the same order.
+
+        Returns:
+            pandas.DataFrame: A DataFrame with two columns: 'Fields of Interest' and 'Percent Complete'.
+        """
+
+        counts = self.query_df(count_query).iloc[0]
+        total_num = float(counts['total_rows'])
+        nonNullCounts = np.array([counts[f'count_{i}'] for i in range(len(fields))], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percent_complete = (nonNullCounts/total_num)*100
+
+        return self.percent_complete_df(fields, percent_complete)
+
     def range_export_df(self, query):
         """
         Generates a DataFrame containing the percentage of complete information for each field of 
         interest. The Percent Completeness is done by looking at the total amount of 
         NonNull values / total (NonNull + Null) for each specified field in the query that is passed 
-        to this method
+        to this method. The counts come from the query's packed null mask (see null_mask()).
 
         Args:
             query (str): The SQL query to retrieve the data from the database.
@@ -196,19 +500,28 @@ class Completeness:
             if col in unwanted_columns:
                 df.drop(col, axis=1)
 
-        # Getting counts of Null and not Null values
-        null_counts = df.isna().sum()
-        nonNullCounts = df.count()
-        
-        # Calculating Percentage of complete information from those values. 
-        difCounts = np.absolute(nonNullCounts.values) # this is a difference of arrays (might just want a ratio of )
-        total_num = null_counts.values+nonNullCounts.values
-        percent_complete = (difCounts/total_num)*100
+        # Percentage of complete information, answered from the shared null mask of this query
+        fields = self.report_fields(df.columns)
+        percent_complete = self.null_mask(query).percent_complete()[fields].values
+
+        return self.percent_complete_df(fields, percent_complete)
+
+    def percent_complete_df(self, fields, percent_complete):
+        """
+        Builds the completeness sheet for one table from per-field percentages.
+
+        Args:
+            fields (list): The field names.
+            percent_complete (array-like): The percent complete of each field, same order.
+
+        Returns:
+            pandas.DataFrame: A DataFrame with two columns: 'Fields of Interest' and 'Percent Complete', 
+                rounded to 2 decimals.
+        """
 
-        # Lab df done 
         lab_df = pd.DataFrame(
             {
-            'Fields of Interest': list(df.columns),
+            'Fields of Interest': list(fields),
             'Percent Complete' : percent_complete
             }
         )
@@ -221,6 +534,15 @@ class Completeness:
     def query_df(self, query):
         """
         Executes a SQL query on a database and returns the result as a pandas DataFrame.
+
+        Results are memoized on the instance, keyed by the normalized SQL text and the identity 
+        (path, size, mtime) of the range export file. Every report and scraping stage that asks 
+        for the same query therefore shares one materialized DataFrame instead of going back to 
+        Access. The returned DataFrame is shared, so callers should not modify it in place. 
+        Use clear_query_cache() to force the next call to re-read the export.
+
+        On a memo miss the on-disk snapshot for this export (by content hash) and query is tried 
+        before ODBC, and results read through ODBC are written back as a snapshot for later runs.
         
         Args:
             query (str): The SQL query to be executed.
@@ -229,10 +551,205 @@ class Completeness:
             pandas.DataFrame: The result of the query as a DataFrame.
         """
 
-        # need to establish database connection
-        conn, _ = self.database_connection()
-        df = pd.read_sql_query(query, conn)
+        key = self.query_cache_key(query)
+        if key in self._query_cache:
+            logging.info('Reusing cached query result (%s rows)', len(self._query_cache[key]))
+            return self._query_cache[key]
+
+        # a previous run may have left a snapshot of this exact export and query
+        snapshot_key = self.snapshot_key(query)
+        df = self.snapshots.load(snapshot_key) if snapshot_key else None
+
+        if df is None:
+            # need to establish database connection
+            conn, _ = self.database_connection()
+            with self.connection.timer('query'):
+                df = self.read_query(query, conn)
+            if snapshot_key:
+                self.snapshots.save(snapshot_key, df)
+        else:
+            self.compact_df(df)
+
+        self._query_cache[key] = self.attribute_test_centers(df)
         return df
+
+    def read_query(self, query, conn):
+        """
+        Reads the whole result of a SQL query. With compact_dtypes the result is read in chunks 
+        of READ_CHUNKSIZE rows (or the chunksize of the object) and each chunk is converted to 
+        compact dtypes as it arrives, so the Python-object frame of the full result is never built.
+
+        Args:
+            query (str): The SQL query to be executed.
+            conn: The open database connection.
+
+        Returns:
+            pandas.DataFrame: The result of the query.
+        """
+
+        query = self.backend.translate(query)
+        if not self.compact_dtypes:
+            return pd.read_sql_query(query, conn)
+        chunks = pd.read_sql_query(query, conn, chunksize=self.chunksize or self.READ_CHUNKSIZE)
+        df, raw_bytes = read_compact(chunks, self.CATEGORY_FIELDS, self.DATE_FIELDS)
+        if df is None:
+            # a result without rows still has its columns
+            return pd.read_sql_query(query, conn)
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            compact_bytes = memory_bytes(df)
+            logging.info(
+                f'Compact dtypes: {len(df)} rows, {raw_bytes / 1024 ** 2:.1f} MB as read, '
+                f'{compact_bytes / 1024 ** 2:.1f} MB compact, '
+                f'{(raw_bytes - compact_bytes) / 1024 ** 2:.1f} MB saved'
+            )
+        return df
+
+    def compact_df(self, df):
+        """
+        Converts a freshly loaded query result (or chunk) to the compact dtypes of the report 
+        fields: CATEGORY_FIELDS as category, DATE_FIELDS as datetime64 and other text as 
+        string[pyarrow]. Does nothing when compact_dtypes is off.
+
+        Args:
+            df (pandas.DataFrame): The query result, modified in place.
+
+        Returns:
+            pandas.DataFrame: df
+        """
+
+        if self.compact_dtypes:
+            compact_frame(df, self.CATEGORY_FIELDS, self.DATE_FIELDS)
+        return df
+
+    def null_mask(self, query):
+        """
+        Returns the packed null-mask index (see null_mask.NullMaskIndex) of the query's result. 
+        The mask is built once per loaded frame and cached next to it, so completeness, threshold 
+        search and the blank reference range report all share one scan for missing values.
+
+        Args:
+            query (str): The SQL query whose result should be indexed.
+
+        Returns:
+            NullMaskIndex: The null-mask index of query_df(query).
+        """
+
+        key = self.query_cache_key(query)
+        if key not in self._null_masks:
+            self._null_masks[key] = NullMaskIndex(self.query_df(query))
+        return self._null_masks[key]
+
+    def query_cache_key(self, query):
+        """
+        Builds the memoization key for a query: the SQL with whitespace collapsed plus the 
+        (path, size, mtime) of the range export, so an export that is replaced on disk is 
+        never served from a stale entry.
+
+        Args:
+            query (str): The SQL query string.
+
+        Returns:
+            tuple: (normalized query, export path, file size, modification time)
+        """
+
+        normalized_query = ' '.join(query.split())
+        return (normalized_query,) + self.export_identity()
+
+    def query_chunks(self, query, chunksize=None):
+        """
+        Streams the result of a SQL query as DataFrames of at most chunksize rows. Nothing is 
+        memoized or snapshotted, so memory is bounded by the chunk size instead of the export size.
+
+        Args:
+            query (str): The SQL query to be executed.
+            chunksize (int, optional): Rows per chunk, defaults to the chunksize of the object.
+
+        Yields:
+            pandas.DataFrame: The next chunk of the result.
+        """
+
+        conn, _ = self.database_connection()
+        chunks = pd.read_sql_query(self.backend.translate(query), conn, chunksize=chunksize or self.chunksize)
+        while True:
+            with self.connection.timer('query'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield self.attribute_test_centers(self.compact_df(chunk))
+
+    def fold_chunks(self, query, accumulators):
+        """
+        Streams query and folds every chunk into each of the accumulators (see accumulators.py).
+
+        Returns:
+            list: The accumulators.
+        """
+
+        n_rows = 0
+        for chunk in self.query_chunks(query):
+            for accumulator in accumulators:
+                accumulator.update(chunk)
+            n_rows += len(chunk)
+        logging.info('Folded %s rows into %s accumulators', n_rows, len(accumulators))
+        return accumulators
+
+    def is_query_cached(self, query):
+        """
+        Returns True if the result of query is already materialized in the query cache.
+        """
+
+        return self.query_cache_key(query) in self._query_cache
+
+    def export_identity(self):
+        """
+        Returns the identity of the range export file as (path, size, mtime). Size and mtime are 
+        None when the file cannot be stat'ed (e.g. the VPN share is unavailable).
+        """
+
+        path = os.path.join(self.folder_path, self.file_name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return (path, None, None)
+        return (path, stat.st_size, stat.st_mtime_ns)
+
+    def export_hash(self):
+        """
+        Returns the content hash of the range export. The hash is only recomputed when the file's 
+        (path, size, mtime) identity changes, so a run reads the file for hashing at most once.
+        """
+
+        identity = self.export_identity()
+        if self._export_hash is None or self._export_hash[0] != identity:
+            logging.info('Hashing range export %s', identity[0])
+            self._export_hash = (identity, file_content_hash(identity[0]))
+        return self._export_hash[1]
+
+    def snapshot_key(self, query):
+        """
+        Returns the snapshot key for query, or None if snapshots are turned off, pyarrow is not 
+        installed or the export cannot be read for hashing.
+        """
+
+        if self.snapshots is None or not self.snapshots.available:
+            return None
+        try:
+            file_hash = self.export_hash()
+        except OSError as e:
+            logging.info('Cannot hash range export, skipping snapshots: %s', e)
+            return None
+        # snapshots hold the frame as it was read, compact or not
+        return self.snapshots.key(file_hash, f'{query} -- compact' if self.compact_dtypes else query)
+
+    def clear_query_cache(self):
+        """
+        Invalidation hook for the query memo. Drops every cached query result so the next 
+        query_df() call goes back to the database.
+        """
+
+        logging.info('Clearing %s cached query results', len(self._query_cache))
+        self._query_cache.clear()
+        self._null_masks.clear()
     
     def report_builder(self):
         """
@@ -240,11 +757,12 @@ class Completeness:
         given query data.
 
         This function performs the following steps:
-        1. Reads in a query for the demographics table and the lab table.
-        2. Calculates the completeness for each field in the query data.
-        3. Generates cross-tabulation dataframes for specific columns of interest.
-        4. Checks if any of the generated dataframes are empty.
-        5. Builds an Excel workbook with multiple sheets, including:
+        1. Computes every table of the report card with report_tables(), or with 
+           stream_report_tables() when the object reads the export in chunks.
+        2. Writes the tables as Parquet / NDJSON files when a metrics_format is set, and skips 
+           the steps below when write_excel is off (see publish_report()).
+        3. Checks if any of the generated dataframes are empty.
+        4. Builds an Excel workbook with multiple sheets, including:
            - A sheet for the completeness report, containing both demographic and lab information.
            - A sheet for the cross-tabulation of ethnicity vs race.
            - A sheet for the cross-tabulation of abnormal flag vs resulted organism.
@@ -257,22 +775,395 @@ class Completeness:
         Returns:
         - None
         """
-    
-        # Read in a query for demographics table
-        demo_query_df, lab_query_df = self.demo_lab_df()
 
+        tables = self.compute_report_tables()
+        self.publish_report(tables)
+        return
+
+    def compute_report_tables(self):
+        """
+        Returns the report tables from stream_report_tables() when the object reads the export in 
+        chunks, from report_tables() otherwise.
+        """
+
+        if self.chunksize:
+            return self.stream_report_tables()
+        return self.report_tables()
+
+    def report_tables(self):
+        """
+        Computes every table of the report card from the fully loaded query results:
+        1. Reads in a query for the demographics table and the lab table.
+        2. Calculates the completeness for each field in the query data.
+        3. Generates cross-tabulation dataframes for specific columns of interest.
+        4. Counts the result tests with a blank reference range.
+        Steps 3 and 4 only read the columns they declare in STAGE_COLUMNS (see stage_df()).
+
+        Returns:
+            dict: The report tables, keyed 'demo_completeness', 'lab_completeness', 'race_ethnicity', 
+                'resulted_organism_abflag', 'result_abflag' and 'blank_reference_range'.
+        """
+    
         # generating all dataframes that are necessary for 
+        # (completeness first: once it has loaded the full queries, the other stages slice them)
         logging.info('Calculating Completeness for each field in query DF')
         lab_complete_report_df, demo_complete_report_df = self.completeness_report()
         logging.info('Looking at the cross tab of Ethnicity vs Race')
-        race_ethnicity_cross_df = self.cross_tab_df(demo_query_df, 'Ethnicity', 'Race')
+        race_ethnicity_cross_df = self.cross_tab_df(self.stage_df('race_ethnicity'), 'Ethnicity', 'Race')
         logging.info('Cross tab of Abnormal Flag vs ResultedOrganism')
-        resultedOrganism_abflag_df = self.cross_tab_df(lab_query_df, 'ABNORMALFLAG','ResultedOrganism')
+        resultedOrganism_abflag_df = self.cross_tab_df(
+            self.stage_df('resulted_organism_abflag'), 'ABNORMALFLAG','ResultedOrganism'
+        )
         logging.info('Cross tab of Abnormal Flag vs Result')
-        result_abflag_df = self.cross_tab_df(lab_query_df, 'ABNORMALFLAG', 'RESULT')
+        result_abflag_df = self.cross_tab_df(self.stage_df('result_abflag'), 'ABNORMALFLAG', 'RESULT')
         logging.info('Calculating how many ResultTest have blank reference range calculations')
         result_freq_df = self.result_test()
 
+        return {
+            'demo_completeness': demo_complete_report_df,
+            'lab_completeness': lab_complete_report_df,
+            'race_ethnicity': race_ethnicity_cross_df,
+            'resulted_organism_abflag': resultedOrganism_abflag_df,
+            'result_abflag': result_abflag_df,
+            'blank_reference_range': result_freq_df
+        }
+
+    def stream_report_tables(self):
+        """
+        Same tables as report_tables(), computed in one streaming pass over each query. Every chunk 
+        is folded into mergeable accumulators (null counts, crosstab pair counts and blank reference 
+        range value counts), so peak memory is bounded by the chunk size rather than the export size.
+
+        Returns:
+            dict: The report tables, with the same keys as report_tables().
+        """
+
+        logging.info(f'Streaming lab query in chunks of {self.chunksize} rows')
+        lab_nulls, organism_pairs, result_pairs, blank_ref_counts = self.fold_chunks(
+            self.tstRangeQuery_lab(),
+            [
+                NullCountAccumulator(),
+                PairCountAccumulator('ABNORMALFLAG', 'ResultedOrganism'),
+                PairCountAccumulator('ABNORMALFLAG', 'RESULT'),
+                ValueCountAccumulator('RESULTTEXT', where_missing='REFERENCERANGE')
+            ]
+        )
+        logging.info(f'Streaming demographic query in chunks of {self.chunksize} rows')
+        demo_nulls, race_pairs = self.fold_chunks(
+            self.tstRangeQuery_demographic(),
+            [NullCountAccumulator(), PairCountAccumulator('Ethnicity', 'Race')]
+        )
+
+        demo_percent = demo_nulls.percent_complete()
+        demo_percent = demo_percent[self.report_fields(demo_percent.index)]
+        lab_percent = lab_nulls.percent_complete()
+        lab_percent = lab_percent[self.report_fields(lab_percent.index)]
+        return {
+            'demo_completeness': self.percent_complete_df(demo_percent.index, demo_percent.values),
+            'lab_completeness': self.percent_complete_df(lab_percent.index, lab_percent.values),
+            'race_ethnicity': self.cross_tab_from_counts(race_pairs.pair_counts, 'Ethnicity', 'Race'),
+            'resulted_organism_abflag': self.cross_tab_from_counts(
+                organism_pairs.pair_counts, 'ABNORMALFLAG', 'ResultedOrganism'
+            ),
+            'result_abflag': self.cross_tab_from_counts(result_pairs.pair_counts, 'ABNORMALFLAG', 'RESULT'),
+            'blank_reference_range': self.result_freq_df(blank_ref_counts.value_counts())
+        }
+
+    def report_file_name(self, lab_name=None):
+        """
+        Returns the workbook name of a lab's report card, '{lab_name}_data_quality_reports.xlsx' 
+        with punctuation in the lab name replaced. Defaults to the lab_name of the object.
+        """
+
+        lab_name = re.sub(r'[^\w\s]+', '_', self.lab_name if lab_name is None else lab_name)
+        return f'{lab_name}_data_quality_reports.xlsx'
+
+    @classmethod
+    def for_labs(cls, lab_centers, file_name, folder_path, **kwargs):
+        """
+        Builds one object whose queries cover the test centers of every lab in lab_centers, for 
+        batch_report_builder().
+
+        Args:
+            lab_centers (dict): {lab name: [test centers]}.
+            file_name (str): The range export file.
+            folder_path (str): Folder of the range export.
+            **kwargs: Other constructor arguments.
+
+        Returns:
+            Completeness: The object, named 'batch'.
+        """
+
+        test_centers = list(dict.fromkeys(c for centers in lab_centers.values() for c in centers))
+        return cls(
+            lab_name='batch', file_name=file_name, folder_path=folder_path, test_centers=test_centers, **kwargs
+        )
+
+    def batch_report_builder(self, lab_centers):
+        """
+        Writes the report card of several labs from one load of the range export. The lab and 
+        demographic queries (which already cover every test center of the object) are read once, 
+        the rows are grouped by their test_center attribution, and each lab's report tables are 
+        computed from the rows of its own centers.
+
+        A row is attributed to a single center (the first one found in its file name or 
+        laboratory), so the centers of different labs should not be substrings of the same name.
+
+        Args:
+            lab_centers (dict): {lab name: [test centers]}. Every center must be one of the 
+                object's test_centers (see for_labs()).
+
+        Returns:
+            dict: {lab name: workbook file name}
+        """
+
+        missing = [c for centers in lab_centers.values() for c in centers if c not in self.test_centers]
+        if missing:
+            raise ValueError(f'Test centers not covered by the queries of this object: {missing}')
+
+        demo_query_df, lab_query_df = self.demo_lab_df()
+        # row positions of every center, one groupby per table
+        demo_groups = demo_query_df.groupby('test_center', sort=False).indices
+        lab_groups = lab_query_df.groupby('test_center', sort=False).indices
+
+        # each lab's null masks are taken from the masks of the loaded queries, not rescanned
+        demo_mask = self.null_mask(self.tstRangeQuery_demographic())
+        lab_mask = self.null_mask(self.tstRangeQuery_lab())
+
+        def positions_of(groups, centers):
+            # positions are sorted so each lab keeps the export's row order
+            positions = [groups[c] for c in centers if c in groups]
+            return np.sort(np.concatenate(positions)) if positions else np.array([], dtype=np.intp)
+
+        report_files = {}
+        for lab, centers in lab_centers.items():
+            logging.info(f'Building report card for {lab} ({", ".join(centers)})')
+            demo_positions = positions_of(demo_groups, centers)
+            lab_positions = positions_of(lab_groups, centers)
+            tables = self.frame_report_tables(
+                demo_query_df.take(demo_positions),
+                lab_query_df.take(lab_positions),
+                demo_mask=demo_mask.take(demo_positions),
+                lab_mask=lab_mask.take(lab_positions)
+            )
+            report_files[lab] = self.write_report(tables, file_name=self.report_file_name(lab))
+        return report_files
+
+    def frame_report_tables(self, demo_query_df, lab_query_df, demo_mask=None, lab_mask=None):
+        """
+        Same tables as report_tables(), computed from already loaded demographic and lab frames 
+        (e.g. the rows of one lab in batch_report_builder()).
+
+        Args:
+            demo_query_df (pd.DataFrame): The demographic rows.
+            lab_query_df (pd.DataFrame): The lab rows.
+            demo_mask (NullMaskIndex, optional): Null mask of demo_query_df, e.g. taken from the 
+                cached mask of the loaded query (see NullMaskIndex.take()). Built if not given.
+            lab_mask (NullMaskIndex, optional): Null mask of lab_query_df, as demo_mask.
+
+        Returns:
+            dict: The report tables, with the same keys as report_tables().
+        """
+
+        if lab_mask is None:
+            lab_mask = NullMaskIndex(lab_query_df)
+        if demo_mask is None:
+            demo_mask = NullMaskIndex(demo_query_df)
+        demo_percent = demo_mask.percent_complete()
+        lab_percent = lab_mask.percent_complete()
+        demo_fields = self.report_fields(demo_query_df.columns)
+        lab_fields = self.report_fields(lab_query_df.columns)
+        no_ref_range_df = lab_query_df[lab_mask.missing_rows('REFERENCERANGE')]
+
+        return {
+            'demo_completeness': self.percent_complete_df(demo_fields, demo_percent[demo_fields].values),
+            'lab_completeness': self.percent_complete_df(lab_fields, lab_percent[lab_fields].values),
+            'race_ethnicity': self.cross_tab_df(demo_query_df, 'Ethnicity', 'Race'),
+            'resulted_organism_abflag': self.cross_tab_df(lab_query_df, 'ABNORMALFLAG', 'ResultedOrganism'),
+            'result_abflag': self.cross_tab_df(lab_query_df, 'ABNORMALFLAG', 'RESULT'),
+            'blank_reference_range': self.result_freq_df(no_ref_range_df['RESULTTEXT'].value_counts())
+        }
+
+    def update_aggregate_store(self, store):
+        """
+        Adds the records of this export that the aggregate store has not seen yet. The export is 
+        streamed in chunks (see export_chunks()) unless its queries are already loaded.
+
+        Args:
+            store (AggregateStore): The historical aggregate store.
+
+        Returns:
+            dict: Number of new records, {'lab': n, 'demo': n}.
+        """
+
+        return store.ingest_chunks(
+            self.export_chunks(self.tstRangeQuery_lab()),
+            self.export_chunks(self.tstRangeQuery_demographic()),
+            self.DEMO_FIELDS,
+            self.LAB_FIELDS,
+            date_violations=self.aggregate_date_violations
+        )
+
+    def export_chunks(self, query):
+        """
+        Yields the result of query as one frame when it is already in the query cache, otherwise 
+        streams it in chunks of the object's chunksize (READ_CHUNKSIZE if it has none).
+        """
+
+        if self.is_query_cached(query):
+            yield self.query_df(query)
+        else:
+            yield from self.query_chunks(query, self.chunksize or self.READ_CHUNKSIZE)
+
+    def aggregate_date_violations(self, lab_query_df):
+        """
+        Date violations stored with the aggregates of an export (or of one of its chunks). The 
+        date rules live in WebCMR_check, which overrides this; a plain report card stores none.
+        """
+
+        return None
+
+    def window_report_tables(self, store, start_day=None, end_day=None, test_centers=None):
+        """
+        Same tables as report_tables(), merged from the aggregates kept in the store instead of
+        the raw rows of an export.
+
+        Args:
+            store (AggregateStore): The historical aggregate store.
+            start_day (str or datetime, optional): First collection day of the window.
+            end_day (str or datetime, optional): Last collection day of the window (inclusive).
+            test_centers (list, optional): Centers to report on, defaults to the ones of the object.
+
+        Returns:
+            dict: The report tables, with the same keys as report_tables() plus 'date_violations'
+                (number of violations of each date rule).
+        """
+
+        if test_centers is None:
+            test_centers = self.test_centers
+        window = dict(start_day=start_day, end_day=end_day, test_centers=test_centers)
+
+        completeness = {}
+        for kind in ['demo', 'lab']:
+            counts = store.field_counts(kind, **window)
+            percent = (counts['non_null'] / counts['rows'] * 100).values
+            completeness[kind] = self.percent_complete_df(counts['field'], percent)
+        blank_ref_counts = pd.Series(
+            {text: n for (text, _), n in store.pair_counts('blank_reference_range', **window).items()},
+            dtype='int64'
+        )
+
+        return {
+            'demo_completeness': completeness['demo'],
+            'lab_completeness': completeness['lab'],
+            'race_ethnicity': self.cross_tab_from_counts(
+                store.pair_counts('race_ethnicity', **window), 'Ethnicity', 'Race'
+            ),
+            'resulted_organism_abflag': self.cross_tab_from_counts(
+                store.pair_counts('resulted_organism_abflag', **window), 'ABNORMALFLAG', 'ResultedOrganism'
+            ),
+            'result_abflag': self.cross_tab_from_counts(
+                store.pair_counts('result_abflag', **window), 'ABNORMALFLAG', 'RESULT'
+            ),
+            'blank_reference_range': self.result_freq_df(
+                blank_ref_counts.sort_values(ascending=False, kind='stable')
+            ),
+            'date_violations': store.date_violation_counts(**window)
+        }
+
+    def publish_report(self, tables):
+        """
+        Writes the report tables in every output the object is set up for: the Excel workbook 
+        (write_report()) unless write_excel is off, and the metric files (export_metrics()) when a 
+        metrics_format is set.
+
+        Returns:
+            dict: The paths written, keyed 'excel' and 'metrics' (the manifest).
+        """
+
+        outputs = {}
+        if self.metrics_format:
+            outputs['metrics'] = self.export_metrics(tables)
+        if self.write_excel:
+            outputs['excel'] = self.write_report(tables)
+        return outputs
+
+    def publish_tables(self, tables):
+        """
+        Returns tables with everything publish_report() still reads from the export added (the 
+        date violations of the metric files), so that publish_report() on the result only writes 
+        files and can run while another thread uses the database connection.
+
+        Args:
+            tables (dict): The report tables.
+
+        Returns:
+            dict: tables, or a copy with 'date_violations' added.
+        """
+
+        if self.metrics_format and 'date_violations' not in tables:
+            tables = dict(tables, date_violations=self.date_violation_table())
+        return tables
+
+    def metrics_dir_name(self):
+        """
+        Returns the default metrics folder, '{lab_name}_data_quality_metrics'.
+        """
+
+        return self.report_file_name().replace('_reports.xlsx', '_metrics')
+
+    def export_metrics(self, tables, output_dir=None, fmt=None):
+        """
+        Writes every report table, plus the date violations when the object checks dates (see 
+        date_violation_table()), as machine-readable files with a run manifest (see 
+        metrics_export.py).
+
+        Args:
+            tables (dict): The report tables.
+            output_dir (str, optional): Defaults to metrics_dir, or metrics_dir_name().
+            fmt (str, optional): 'parquet' or 'ndjson', defaults to metrics_format.
+
+        Returns:
+            str: Path of the manifest.
+        """
+
+        output_dir = output_dir or self.metrics_dir or self.metrics_dir_name()
+        tables = self.publish_tables(tables)
+        path, size, mtime = self.export_identity()
+        run_info = {
+            'lab_name': self.lab_name,
+            'test_centers': self.test_centers,
+            'export': {'path': path, 'size': size, 'mtime_ns': mtime}
+        }
+        return write_metrics(tables, output_dir, fmt or self.metrics_format or 'parquet', run_info)
+
+    def date_violation_table(self):
+        """
+        Date violations exported with the metrics. The date rules live in WebCMR_check, which 
+        overrides this; a plain report card has none.
+        """
+
+        return None
+
+    def write_report(self, tables, file_name=None):
+        """
+        Writes the report card workbook from the tables computed by report_tables().
+
+        Args:
+            tables (dict): The report tables.
+            file_name (str, optional): Workbook path, defaults to '{lab_name}_data_quality_reports.xlsx'.
+
+        Returns:
+            str: The path of the workbook.
+        """
+
+        lab_complete_report_df = tables['lab_completeness']
+        demo_complete_report_df = tables['demo_completeness']
+        race_ethnicity_cross_df = tables['race_ethnicity']
+        resultedOrganism_abflag_df = tables['resulted_organism_abflag']
+        result_abflag_df = tables['result_abflag']
+        result_freq_df = tables['blank_reference_range']
+
         # Check if any of the dataframes are empty
         dfs = [
             lab_complete_report_df, 
@@ -292,8 +1183,11 @@ class Completeness:
         # Going to make one excel sheet with completeness reports from both demographic 
         # and lab information
         logging.info('Report Card is being built...')
-        lab_name = re.sub(r'[^\w\s]+', '_',self.lab_name)
-        writer = pd.ExcelWriter(f'{lab_name}_data_quality_reports.xlsx', engine='xlsxwriter')
+        if file_name is None:
+            file_name = self.report_file_name()
+        if self.streaming_excel:
+            return self.write_report_streaming(tables, file_name)
+        writer = pd.ExcelWriter(file_name, engine='xlsxwriter')
         demo_complete_report_df.to_excel(
             writer, 
             sheet_name='CompletenessReport', 
@@ -325,8 +1219,29 @@ class Completeness:
         # close writer object
         writer.close()
 
-        
-        return 
+        return file_name
+
+    def write_report_streaming(self, tables, file_name):
+        """
+        Same workbook as write_report(), written row by row in xlsxwriter's constant_memory mode 
+        (see report_writer.py) so large crosstabs are never buffered. Logs the write time and peak 
+        memory of every sheet.
+
+        Args:
+            tables (dict): The report tables.
+            file_name (str): Workbook path.
+
+        Returns:
+            str: file_name
+        """
+
+        with StreamingReportWriter(file_name) as writer:
+            writer.write_side_by_side(
+                'CompletenessReport', [tables['demo_completeness'], tables['lab_completeness']]
+            )
+            for sheet_name, table in self.REPORT_SHEETS:
+                writer.write_frame(sheet_name, tables[table])
+        return file_name
 
     def demo_lab_df(self):
         """
@@ -355,9 +1270,10 @@ class Completeness:
     def cross_tab_df(self, df : pd.DataFrame, index : str, column : str) -> pd.DataFrame:
         '''
 
-        We are using a nested dictionary to store the count values for each unique pair b/w the 
-        2 columns. Afterwards, we transform the nested dictionary into a dataframe that looks similar
-        to a crosstab in pandas 
+        We count every unique pair b/w the 2 columns with numpy kernels (factorize + bincount), so 
+        the work over the rows is linear and never leaves numpy. Only the unique pairs are then 
+        turned into a nested dictionary, which becomes a dataframe that looks similar to a crosstab 
+        in pandas (see cross_tab_from_counts).
 
         Generates a cross-tabulation DataFrame based on the specified index and column values.
 
@@ -377,51 +1293,44 @@ class Completeness:
             pd.DataFrame: The cross-tabulation DataFrame.
 
         Algorithm Steps:
-        1. Initialize an empty dictionary called 'counts' to store the counts of unique value pairs.
-        2. Iterate over each row in the input DataFrame.
-        3. Extract the values from the 'index' and 'column' columns for the current row.
-        4. If any of the values is NaN or None, replace it with the string 'N/A'.
-        5. Check if the value from the 'index' column already exists as a key in the 'counts' dictionary.
-        - If it does not exist, create a new nested dictionary for that value.
-        - The nested dictionary will be used to store counts of the 'index' value with each unique value from the 'column' column.
-        6. Check if the value from the 'column' column already exists as a key in the nested dictionary.
-        - If it exists, increment the count for that value pair by 1.
-        - If it does not exist, create a new key-value pair with the count initialized to 1.
-        7. After iterating over all rows, create a new DataFrame 'new_df' using the 'counts' dictionary.
-        8. Replace any NaN values in the index and column names of 'new_df' with None.
-        9. Add a new column called 'Total' to 'new_df' that sums up the row values.
-        10. Add a new row to 'new_df' that contains the column-wise totals.
-        11. Set the index name of 'new_df' to '{index} vs {column}'.
+        1. Replace every NaN / None value in the 'index' and 'column' columns with the string 'N/A'.
+        2. Factorize both columns into integer codes. Factorizing keeps the order in which values 
+           are first seen, which decides the row and column order of the output.
+        3. Combine the two codes into one code per row (index_code * n_column_values + column_code).
+        4. Factorize the combined codes to get the unique pairs in the order they are first seen, 
+           and count each pair with np.bincount.
+        5. Build the crosstab from the ordered pair counts with cross_tab_from_counts().
+        Steps 1-4 live in accumulators.count_pairs(), which the streaming mode shares.
 
         Example usage:
         df = pd.DataFrame(...)
         result = cross_tab_df(df, 'index_column', 'column_column')
         print(result)
         '''
-        
-        counts = {}
-        # creating count table of unique values from col 1 and 2 that are seen together
 
-        for _, row in df.iterrows():
-            col1_val = row[index]
-            col2_val = row[column]
-            
-            # changing all NaN values into Null values 
-            if col1_val in (np.nan, None): 
-                col1_val = 'N/A'
-            
-            if col2_val in (np.nan, None): 
-                col2_val = 'N/A'
+        pair_counts = count_pairs(fill_na(df[index]), fill_na(df[column]))
+        return self.cross_tab_from_counts(pair_counts, index, column)
 
-            # looking at every value in the first column and making a dictionary for its 
-            # pairs with every other value in col 2 
-            if col1_val not in counts: # create dictionary for each value in col 1
-                counts[col1_val] = {} # dictionary will be used to store counts of col 1 val with a specific col 2 val
-            
-            if col2_val in counts[col1_val]: # if a col 2 val already exists in nested dictionary add another count to that pair 
-                counts[col1_val][col2_val] += 1
-            else:
-                counts[col1_val][col2_val] = 1 # if it doesn't exist create an instance of it and give it a count of 1
+    def cross_tab_from_counts(self, pair_counts : dict, index : str, column : str) -> pd.DataFrame:
+        '''
+        Builds the crosstab dataframe from counts of (index value, column value) pairs. The pairs 
+        should be in the order they were first seen in the data: the values of 'index' become the 
+        columns of the crosstab and the values of 'column' become its rows, both in that order. 
+        Pairs that were never seen are left as NaN, and a 'Total' column and row are added.
+
+        Parameters:
+            pair_counts (dict): {(index value, column value): count}
+            index (str): The name of the column used as the index.
+            column (str): The name of the column used as the column.
+
+        Returns:
+            pd.DataFrame: The cross-tabulation DataFrame, with index name '{index} vs {column}'.
+        '''
+
+        # nested dictionary, one dictionary of col 2 counts for each value in col 1 
+        counts = {}
+        for (col1_val, col2_val), count in pair_counts.items():
+            counts.setdefault(col1_val, {})[col2_val] = count
 
         # Now going to look at the the dictionary values and look inside the nested dictionary 
         # for counts and which ever counts is the most for that value pair I will use that as a match
@@ -446,16 +1355,35 @@ class Completeness:
             result_freq_df (pandas.DataFrame): A dataframe with two columns: 
             'Frequency' and 'Cumulative Frequency'.
         """
-        # Getting lab information data frame
         lab_query = self.tstRangeQuery_lab()
-        lab_query_df = self.query_df(lab_query)
-        no_ref_range_df = lab_query_df[
-            lab_query_df['REFERENCERANGE'].isnull() | lab_query_df['REFERENCERANGE'].isna()
-            ]
+        if self.is_query_cached(lab_query):
+            # the full lab table is loaded, its shared null mask already knows the blank rows
+            lab_query_df = self.query_df(lab_query)
+            no_ref_range_df = lab_query_df[self.null_mask(lab_query).missing_rows('REFERENCERANGE')]
+        else:
+            # Getting only the two lab columns this needs
+            lab_query_df = self.stage_df('blank_reference_range')
+            no_ref_range_df = lab_query_df[lab_query_df['REFERENCERANGE'].isna().to_numpy()]
         # Get frequency and cumalitive frequency
         val_counts = no_ref_range_df['RESULTTEXT'].value_counts()
+        return self.result_freq_df(val_counts)
+
+    def result_freq_df(self, val_counts):
+        """
+        Builds the blank reference range summary from the value counts of 'RESULTTEXT'.
+
+        Args:
+            val_counts (pandas.Series): Counts of each result text, most frequent first.
+
+        Returns:
+            result_freq_df (pandas.DataFrame): A dataframe with two columns: 
+            'Frequency' and 'Cumulative Frequency'.
+        """
+
+        # plain labels and counts, whether they came from an Arrow string column or an accumulator
+        val_counts = val_counts.set_axis(val_counts.index.astype(object)).astype('int64')
         cummal_sum = val_counts.cumsum(skipna=False)
-        
+
         # Creating summary dataframe 
         result_freq_df = pd.DataFrame(
             {
@@ -476,7 +1404,10 @@ class Completeness:
 
         # grab both query df 
         demo_df, lab_df = self.demo_lab_df()
-        lab_df.rename(columns={'IncidentID': 'Incident_ID'}, inplace=True)
+        # query results are shared through the query cache, so rename on a copy
+        lab_df = lab_df.rename(columns={'IncidentID': 'Incident_ID'})
+        # every record keeps the test center of its lab result
+        demo_df = demo_df.drop(columns=['test_center'], errors='ignore')
 
         # Join the Tables of Disease Incident ID 
         combined_df = pd.merge(
@@ -486,4 +1417,53 @@ class Completeness:
         how='inner'
         )
 
-        return combined_df
\ No newline at end of file
+        return combined_df
+
+    def combined_null_mask(self):
+        """
+        Returns the packed null mask of combined_query_df(), cached with the masks of the queries. 
+        It is built from the cached demographic and lab masks (see null_mask()) through the row 
+        indexers of the join, so the joined table is never scanned for missing values.
+
+        Returns:
+            NullMaskIndex: The null-mask index of combined_query_df().
+        """
+
+        demo_query = self.tstRangeQuery_demographic()
+        lab_query = self.tstRangeQuery_lab()
+        key = ('combined', self.query_cache_key(demo_query), self.query_cache_key(lab_query))
+        if key in self._null_masks:
+            return self._null_masks[key]
+
+        demo_df, lab_df = self.demo_lab_df()
+        demo_mask = self.null_mask(demo_query)
+        lab_mask = self.null_mask(lab_query)
+
+        # the join of the keys alone gives the demographic and lab row of every joined row, in 
+        # the order of combined_query_df()
+        rows = pd.merge(
+            pd.DataFrame({'Incident_ID': demo_df['Incident_ID'], 'demo_row': np.arange(len(demo_df))}),
+            pd.DataFrame({'Incident_ID': lab_df['IncidentID'], 'lab_row': np.arange(len(lab_df))}),
+            on=['Incident_ID'],
+            how='inner'
+        )
+
+        # joined columns are the demographic columns, then the lab columns other than the key
+        demo_columns = [col for col in demo_mask.columns if col != 'test_center']
+        lab_columns = [col for col in lab_mask.columns if col != 'IncidentID']
+        columns = pd.merge(
+            demo_df[demo_columns].iloc[:0],
+            lab_df.iloc[:0].rename(columns={'IncidentID': 'Incident_ID'}),
+            on=['Incident_ID'],
+            how='inner'
+        ).columns
+
+        missing = np.concatenate(
+            [
+                demo_mask.missing_matrix(demo_columns)[rows['demo_row'].to_numpy()],
+                lab_mask.missing_matrix(lab_columns)[rows['lab_row'].to_numpy()]
+            ],
+            axis=1
+        )
+        self._null_masks[key] = NullMaskIndex.from_missing(missing, columns)
+        return self._null_masks[key]
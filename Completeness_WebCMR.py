@@ -30,7 +30,7 @@ def main():
     1. Sets up logging for the process.
     2. Gets user input for various parameters.
     3. Checks if there are any test centers saved.
-    4. Creates an instance of the WebCMR_check class based on the number of test centers.
+    4. Creates an instance of the WebCMR_check class for all of the test centers.
     5. Calls functions to generate a quality report and retrieve error examples.
     6. Handles various exceptions that may occur during the execution of the program.
     7. Logs the completion of the program.
@@ -73,67 +73,21 @@ def main():
         '''
     )
     try: 
-        if len(test_centers) == 1:
-            report_maker = WebCMR_check(
-                file_name = file_name, 
-                lab_name = lab_name,
-                folder_path = folder_path,
-                test_center_1 = test_centers[0], 
-                username = username, 
-                paswrd = password
-                )
-        elif len(test_centers) == 2:
-            report_maker = WebCMR_check(
+        report_maker = WebCMR_check(
             file_name = file_name, 
             lab_name = lab_name,
             folder_path = folder_path,
-            test_center_1 = test_centers[0], 
-            test_center_2 = test_centers[1],
-            username = username, 
-            paswrd = password
-            )
-        elif len(test_centers) == 3:
-            report_maker = WebCMR_check(
-            file_name = file_name, 
-            lab_name = lab_name,
-            folder_path = folder_path,
-            test_center_1 = test_centers[0], 
-            test_center_2 = test_centers[1],
-            test_center_3 = test_centers[2],
-            username = username, 
-            paswrd = password
-            )
-        elif len(test_centers) == 4:
-            report_maker = WebCMR_check(
-            file_name = file_name, 
-            lab_name = lab_name,
-            folder_path = folder_path,
-            test_center_1 = test_centers[0], 
-            test_center_2 = test_centers[1],
-            test_center_3 = test_centers[2],
-            test_center_4 = test_centers[3],
-            username = username, 
-            paswrd = password
-            )
-        elif len(test_centers) == 5:
-            report_maker = WebCMR_check(
-            file_name = file_name, 
-            lab_name = lab_name,
-            folder_path = folder_path,
-            test_center_1 = test_centers[0], 
-            test_center_2 = test_centers[1],
-            test_center_3 = test_centers[2],
-            test_center_4 = test_centers[3],
-            test_center_5 = test_centers[4],
+            test_centers = test_centers, 
             username = username, 
             paswrd = password
             )
 
-        # function calls to generate quality report and error examples 
-        logging.info('Building Excel Report Card, with all of the reports on each tab...')
-        report_maker.report_builder()
-        logging.info('Starting webscraping for examples that did not meet threshold or have date errors')
-        report_maker.get_hl7()
+        # function calls to generate quality report and error examples, login / scraping overlap 
+        # with building and writing the report card 
+        # (the with block closes the shared .accdb connection once both are done)
+        with report_maker:
+            logging.info('Building Excel Report Card and scraping examples that did not meet threshold or have date errors...')
+            report_maker.pipelined_run()
     except NoSuchElementException as ne:
         # Log the error traceback
         logging.exception("An error occurred, check Log_info.log: %s", ne)
@@ -150,6 +104,8 @@ def main():
         logging.exception("Incompatibility with Chromedriver and Chromebrowser: %s", sessionIncompatible)
     except pyodbc.Error as e:
         logging.exception('Not a valid path to Microsoft Access file folder. Check VPN connection...just in case %s', e)
+    except ValueError as ve:
+        logging.exception('Could not set up the report card: %s', ve)
     logging.info('Program Complete...')
 
     return
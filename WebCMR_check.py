@@ -1,20 +1,47 @@
 import pandas as pd
+import numpy as np
 import logging
 import time
+import queue
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import (NoSuchElementException,
                                         UnexpectedAlertPresentException,
-                                        TimeoutException,
-                                        ElementClickInterceptedException)
+                                        TimeoutException)
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from Completeness import Completeness
+from null_mask import NullMaskIndex
+from compact_dtypes import parse_dates
+from accumulators import NullCountAccumulator, FirstMissingAccumulator
+from rate_limiter import RateLimiter
+from imm_http_client import IMMHttpClient
+from hl7_cache import HL7Cache
+from browser_session import BrowserSession
 from typing import Union
 from docx import Document
 
+# Date ordering rules checked by WebCMR_check.date_violations(). A row violates a rule when the 
+# date in 'earlier' is after the date in 'later'. Checking another pair of dates (e.g. DOB before 
+# SPECCOLLECTEDDATE) only needs another entry here.
+DateRule = namedtuple('DateRule', ['rule_id', 'earlier', 'later', 'label'])
+DATE_RULES = [
+    DateRule('collect_after_receive', 'SPECCOLLECTEDDATE', 'SPECRECEIVEDDATE', 'SpecCollectDate Error (w/Recieve Date)'),
+    DateRule('receive_after_result', 'SPECRECEIVEDDATE', 'RESULTDATE', 'SpecRecieveDate Error (w/Result Date)'),
+    DateRule('collect_after_result', 'SPECCOLLECTEDDATE', 'RESULTDATE', 'SpecCollectDate Error (w/Result Date)'),
+]
+
+
+class StaleResultsError(Exception):
+    """
+    Raised when IMM still shows the results of the previous search after an accession search, so 
+    the message contents area does not belong to the accession that was searched.
+    """
+
 class WebCMR_check(Completeness):
 
     """
@@ -66,16 +93,70 @@ class WebCMR_check(Completeness):
         paswrd, 
         url = 'https://test-sdcounty.atlasph.com/TSTWebCMR/pages/login/login.aspx',
         *args,
+        scrape_workers = 1,
+        scrape_interval = 1.0,
+        lookup_backend = 'selenium',
+        imm_url = None,
+        hl7_cache_path = 'hl7_cache.sqlite',
+        hl7_cache_ttl = 30 * 24 * 3600,
+        hl7_cache_max_entries = 10000,
+        headless = False,
+        cookie_path = 'webcmr_cookies.json',
+        driver_path = 'chromedriver.exe',
         **kwargs
         ):
+        """
+        Args:
+            username (str): TST username.
+            paswrd (str): TST password.
+            url (str): Login page of the WebCMR environment.
+            scrape_workers (int): Number of logged-in browser sessions that look up HL7 messages in 
+                parallel.
+            scrape_interval (float): Minimum seconds between two IMM searches, across all sessions.
+            lookup_backend (str): 'selenium' to look up HL7 messages through Chrome, 'http' to 
+                replay the IMM search over a plain HTTP session (see imm_http_client.py).
+            imm_url (str, optional): Incoming Message Monitor page, required by the 'http' backend.
+            hl7_cache_path (str, optional): SQLite file of scraped HL7 messages reused across runs, 
+                None turns the cache off.
+            hl7_cache_ttl (float): Seconds a cached HL7 message is reused before it is scraped again.
+            hl7_cache_max_entries (int): Number of cached HL7 messages kept.
+            headless (bool): Run Chrome without a window.
+            cookie_path (str, optional): JSON file the WebCMR session cookies are kept in between 
+                runs so login can be skipped, None turns it off.
+            driver_path (str): Path to chromedriver.
+            *args, **kwargs: Passed on to Completeness.
+        """
         super().__init__(*args, **kwargs)
         self.url = url 
         self.username = username
         self.paswrd = paswrd
+        self.scrape_workers = scrape_workers
+        self.rate_limiter = RateLimiter(scrape_interval)
+        if lookup_backend not in ('selenium', 'http'):
+            raise ValueError(f"lookup_backend must be 'selenium' or 'http', not {lookup_backend!r}")
+        if lookup_backend == 'http' and imm_url is None:
+            raise ValueError("lookup_backend='http' needs the imm_url of the Incoming Message Monitor")
+        self.lookup_backend = lookup_backend
+        self.imm_url = imm_url
+        self.hl7_cache = (
+            HL7Cache(hl7_cache_path, hl7_cache_ttl, hl7_cache_max_entries) if hl7_cache_path else None
+        )
+        self.headless = headless
+        self.cookie_path = cookie_path
+        self.driver_path = driver_path
+        # warm lookup sessions reused by get_hl7 and lookup_accession, see open_session()
+        self.browser = self.new_browser_session(cookie_path)
+        self._http_session = None
+        # locator that last found each (page, element) and time spent waiting on it, see multiFind()
+        self._locator_memory = {}
+        self.wait_stats = {}
+        self._wait_lock = threading.Lock()
 
     def login(self): 
         """
-        Logs in the user to the website using the provided credentials and returns the webdriver object.
+        Returns the warm, logged-in webdriver of the run. Chrome is started on the first call and 
+        reused afterwards; the credentials are only typed in when the saved WebCMR cookies no 
+        longer authenticate (see browser_session.py).
 
         Returns:
             webdriver: The webdriver object after successful login.
@@ -84,29 +165,91 @@ class WebCMR_check(Completeness):
             NoSuchElementException: If the username or password elements cannot be found.
         """
 
-        # create chrome webdriver object with the above options
-        logging.info('Starting connection to webdriver')
-        service : ChromeService = ChromeService(executable_path="chromedriver.exe")
-        driver : webdriver = webdriver.Chrome(service=service)
+        return self.browser.get_driver()
 
-        # go to TST website
-        driver.get(self.url)
+    def new_browser_session(self, cookie_path=None) -> BrowserSession:
+        """
+        Returns a (not yet started) browser session with the options of this object.
 
-        # Find the username and password elements and enter login credentials
-        # time.sleep(1)
-        logging.info('Logging into TST')
-        username : webdriver = driver.find_element(By.ID, value="txtUsername")
-        username.send_keys(self.username)
-        password : webdriver = driver.find_element(By.ID, value="txtPassword")
-        password.send_keys(self.paswrd)
-        # time.sleep(.5)
-        password.send_keys(Keys.RETURN)
-        
-        return driver
+        Args:
+            cookie_path (str, optional): Cookie file of the session. The saved cookies of the run 
+                are only used by the warm session; sessions restoring the same cookies would share 
+                one ASP.NET session, which the server serializes, so extra sessions log in on 
+                their own by default.
+        """
+
+        return BrowserSession(
+            url=self.url,
+            username=self.username,
+            paswrd=self.paswrd,
+            driver_path=self.driver_path,
+            headless=self.headless,
+            cookie_path=cookie_path
+        )
     
+    def close(self):
+        """
+        Closes the database connection, the HL7 cache and the warm lookup sessions.
+        """
+
+        super().close()
+        if self.hl7_cache is not None:
+            self.hl7_cache.close()
+        self.browser.quit()
+        if self._http_session is not None:
+            self._http_session.quit()
+            self._http_session = None
+
+    def open_session(self, warm=True):
+        """
+        Opens one logged-in lookup session for the configured lookup_backend.
+
+        Args:
+            warm (bool): Return the run's shared session, which stays open after use. False opens 
+                an extra session for a scraping worker, with its own login and without the saved 
+                cookies, to be closed with `close_session`.
+
+        Returns:
+            webdriver or IMMHttpClient: A Chrome webdriver, or a logged-in HTTP client.
+        """
+
+        if self.lookup_backend == 'http':
+            if not warm:
+                return IMMHttpClient(self.url, self.imm_url, self.username, self.paswrd).login()
+            if self._http_session is None:
+                self._http_session = IMMHttpClient(self.url, self.imm_url, self.username, self.paswrd).login()
+            return self._http_session
+        if warm:
+            return self.login()
+        return self.new_browser_session().get_driver()
+
+    def close_session(self, driver, warm=True):
+        """
+        Closes a session from `open_session`; the warm session is kept for later lookups.
+        """
+
+        if not warm:
+            driver.quit()
+
+    def lookup_accession(self, acc_num, result_test=None) -> str:
+        """
+        Ad-hoc lookup of one HL7 message, on the warm session and through the HL7 cache.
+
+        Args:
+            acc_num (str): The accession number to search for.
+            result_test (str, optional): The result test of the accession.
+
+        Returns:
+            str or None: The HL7 message contents shown by IMM.
+        """
+
+        return self.lookup_hl7([(result_test, acc_num, 'lookup')])[0]
+
     def acc_test_search(self, acc_num, driver,resultTest=None):
         """
-        A function to search for an accession number in the Incoming Message Monitor.
+        A function to search for an accession number in the Incoming Message Monitor. The session 
+        is only navigated to IMM when it is not already there, so consecutive searches just 
+        re-submit the accession box.
         
         Parameters:
             acc_num (str): The accession number to search for.
@@ -115,11 +258,15 @@ class WebCMR_check(Completeness):
         
         Returns:
             WebDriver: The WebDriver object representing the browser session after the search is performed.
+
+        Raises:
+            StaleResultsError: The results of the previous search were not replaced in time.
         """
 
-        # navigate to IMM menu
-        logging.info('Going to Incoming Message Monitor...')
-        _ = self.nav2IMM(driver) 
+        # the session stays on IMM between searches, only navigate when it landed somewhere else
+        if not self.on_imm_page(driver):
+            logging.info('Going to Incoming Message Monitor...')
+            _ = self.nav2IMM(driver) 
 
         logging.info('Inputting accession numbers into search bar')
         acc_box : webdriver = self.multiFind(
@@ -136,8 +283,30 @@ class WebCMR_check(Completeness):
             element_id= search_id,
             xpath='/html/body/form/div[3]/div/div/table[3]/tbody/tr[2]/td/table/tbody/tr[4]/td/div/input[1]'
         )
+        # results of the previous search, if any, so we can wait for the postback to replace them
+        previous_results : list = driver.find_elements(By.ID, 'divContentsArea')
         search_btn.click()
+        if previous_results:
+            try:
+                WebDriverWait(driver, 10).until(EC.staleness_of(previous_results[0]))
+            except TimeoutException:
+                # the page still shows the previous accession's message
+                raise StaleResultsError(f'IMM results did not refresh after searching {acc_num}') from None
         return driver
+
+    def on_imm_page(self, driver) -> bool:
+        """
+        Checks whether the driver is on the Incoming Message Monitor search page.
+
+        Args:
+            driver (WebDriver): The WebDriver object representing the browser session.
+
+        Returns:
+            bool: True if the accession search box is on the current page.
+        """
+
+        # find_elements returns an empty list instead of waiting / raising when it is absent
+        return len(driver.find_elements(By.ID, 'txtAccession')) > 0
     
     def get_hl7(self):
         """
@@ -157,9 +326,10 @@ class WebCMR_check(Completeness):
             6. Finds exceptions with less completeness than the allowed threshold by calling the 
                 `threshold_search` function.
             7. Combines the results from step 5 and step 6 to get a list of accession numbers.
-            8. Logs in to the TST environment to scrape HL7 messages that were flagged as missing or 
-                incorrect info.
-            9. Iterates over the list of accession numbers and performs the following actions for each accession number:
+            8. Looks up the HL7 messages that were flagged as missing or incorrect info with 
+                `scrape_hl7`, using `scrape_workers` logged-in TST sessions in parallel.
+            9. Iterates over the list of accession numbers, in their original order, and performs the 
+                following actions for each accession number:
                 - If the distinguifier is a string, puts threshold error HL7 examples in the word 
                 document.
                 - If the distinguifier is a list, puts date combination error HL7 examples in the 
@@ -172,75 +342,349 @@ class WebCMR_check(Completeness):
             
         """
         
+        # Get the list of Accession numbers from both date_check and threshold_search
+        accession_search : list = self.failing_accessions()
+        self.hl7_report(accession_search)
+        return
+
+    def hl7_report(self, accession_search, file_name="HL7_Error.docx"):
+        """
+        Looks up the HL7 message of every entry in accession_search and writes them to the Word 
+        document, in the order of accession_search.
+
+        Args:
+            accession_search (list): Tuples of (result text, accession number, distinguifier), as 
+                returned by `failing_accessions`.
+            file_name (str): Name of the Word document.
+
+        Returns:
+            str: The file name of the Word document.
+        """
+
         # Creating word document object for hl7 reports
         doc : Document = Document()
         doc.add_heading('HL7 Error Examples')
 
+        # look up every HL7 message, then write them in the order of accession_search
+        hl7_texts : list = self.lookup_hl7(accession_search)
+        for search_params, table in zip(accession_search, hl7_texts):
+            if table is None:
+                continue
+            result_test, acc_num, distinguifier = search_params
+            if isinstance(distinguifier, str):
+                logging.info(f'''
+                Putting threshold error HL7 examples in word doc
+                ACCESSION # : {acc_num}
+                '''
+                             )
+                self.write_hl7(doc, heading='THRESHOLD ERROR', subject=distinguifier, table=table)
+            if isinstance(distinguifier, list):
+                logging.info(f'''
+                Putting date combination error HL7 examples in word doc
+                ACCESSION # : {acc_num}
+                '''
+                             )
+                # date errors are headed by their message, not the [error type, message] pair
+                self.write_hl7(doc, heading='DATE ERROR', subject=distinguifier[1], table=table)
+        logging.info('Putting all HL7 examples into docx ... ')
+        doc.save(file_name)
+        return file_name
+
+    def pipelined_run(self):
+        """
+        Builds the Excel report card and the HL7 error examples with the slow steps overlapped:
+
+        1. Logs into TST in the background while the report tables are computed.
+        2. Finds the failing accessions as soon as the tables are done (the query results are 
+           already loaded by then).
+        3. Writes the Excel workbook (and metric files, see publish_report()) in the background 
+           while the HL7 messages are scraped and the Word document is written. Whatever the 
+           outputs still need from the export is read first (publish_tables()), so only this 
+           thread ever uses the database connection.
+
+        Errors from the background steps are raised here once both steps are done.
+
+        Returns:
+            None
+        """
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            logging.info('Logging into TST in the background while the report tables are computed')
+            login = executor.submit(self.open_session)
+            tables : dict = self.compute_report_tables()
+            logging.info('Finding examples that did not meet threshold or have date errors')
+            accession_search : list = self.failing_accessions()
+
+            # the connection is only used from this thread, the background step just writes files
+            tables = self.publish_tables(tables)
+            logging.info('Writing Excel Report Card in the background while scraping HL7 examples')
+            report = executor.submit(self.publish_report, tables)
+            try:
+                # the warm session has to be ready before the scraping workers ask for it
+                login.result()
+                self.hl7_report(accession_search)
+            finally:
+                report.result()
+        return
+
+    def lookup_hl7(self, accession_search) -> list:
+        """
+        Returns the HL7 message of every accession in accession_search. The same accession often 
+        shows up several times (one row breaking several date rules or threshold fields), so each 
+        accession number is looked up once and its message fanned out to every entry that needs it.
+
+        Args:
+            accession_search (list): Tuples of (result text, accession number, distinguifier).
+
+        Returns:
+            list: The HL7 text for each entry of accession_search (None if it could not be scraped).
+        """
+
+        # first entry of each accession number, in order of first appearance
+        unique_searches : dict = {}
+        for search_params in accession_search:
+            unique_searches.setdefault(search_params[1], search_params)
+        logging.info(
+            f'{len(unique_searches)} unique accession numbers for {len(accession_search)} HL7 examples, '
+            f'{len(accession_search) - len(unique_searches)} lookups saved'
+        )
+
+        hl7_texts : list = self.cached_lookup_hl7(list(unique_searches.values()))
+        by_accession : dict = dict(zip(unique_searches, hl7_texts))
+        return [by_accession[search_params[1]] for search_params in accession_search]
+
+    def cached_lookup_hl7(self, accession_search) -> list:
+        """
+        Returns the HL7 message of every accession in accession_search, reading the HL7 cache 
+        first and only scraping TST (`scrape_hl7`) for the misses. Scraped messages are stored in 
+        the cache for the next run. Only text confirmed to belong to its accession is stored: 
+        `scrape_hl7` returns None when IMM kept showing the previous search's results (see 
+        `StaleResultsError`), and empty text is never cached.
+
+        Args:
+            accession_search (list): Tuples of (result text, accession number, distinguifier).
+
+        Returns:
+            list: The HL7 text for each entry of accession_search (None if it could not be scraped).
+        """
+
+        if self.hl7_cache is None:
+            return self.scrape_hl7(accession_search)
+
+        hl7_texts : list = [self.hl7_cache.get(search_params[1]) for search_params in accession_search]
+        misses : list = [index for index, text in enumerate(hl7_texts) if text is None]
+        logging.info(
+            f'HL7 cache: {len(accession_search) - len(misses)} hits, {len(misses)} misses '
+            f'(run totals: {self.hl7_cache.hits} hits, {self.hl7_cache.misses} misses)'
+        )
+
+        scraped : list = self.scrape_hl7([accession_search[index] for index in misses])
+        for index, text in zip(misses, scraped):
+            # an empty contents area is not a message, look it up again next run
+            if text:
+                self.hl7_cache.put(accession_search[index][1], text)
+            hl7_texts[index] = text
+        return hl7_texts
+
+    def scrape_hl7(self, accession_search) -> list:
+        """
+        Looks up the HL7 message of every accession in accession_search with a pool of 
+        `scrape_workers` logged-in browser sessions. The workers pull (index, search_params) jobs 
+        from a shared queue and every search waits on the shared rate limiter, so TST never sees 
+        more than one search per `scrape_interval` seconds.
+
+        Args:
+            accession_search (list): Tuples of (result text, accession number, distinguifier), 
+                as returned by `failing_accessions`.
+
+        Returns:
+            list: The IMM contents text for each entry of accession_search, in the same order. 
+                Entries whose lookup was interrupted by a browser alert, or whose results never 
+                refreshed (see `fetch_hl7_retry`), are None.
+
+        Raises:
+            Exception: The first error raised by a worker other than an alert, once every worker 
+                has stopped.
+        """
+
+        results : list = [None] * len(accession_search)
+        if not accession_search:
+            return results
+
+        jobs : queue.Queue = queue.Queue()
+        for index, search_params in enumerate(accession_search):
+            jobs.put((index, search_params))
+        errors : list = []
+        stop : threading.Event = threading.Event()
+
+        def worker(warm):
+            try:
+                driver : webdriver = self.open_session(warm=warm)
+            except Exception as e:
+                # the other sessions keep draining the queue
+                logging.exception('Worker could not log into TST: %s', e)
+                errors.append(e)
+                return
+            try:
+                while not stop.is_set():
+                    try:
+                        index, (result_test, acc_num, _) = jobs.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        results[index] = self.fetch_hl7_retry(acc_num, result_test, driver)
+                    except UnexpectedAlertPresentException:
+                        continue
+            except Exception as e:
+                logging.exception('Worker stopped on accession lookup: %s', e)
+                errors.append(e)
+                stop.set()
+            finally:
+                self.close_session(driver, warm=warm)
+
+        n_workers : int = max(1, min(self.scrape_workers, len(accession_search)))
+        logging.info(
+            f'Scraping TST environment for {len(accession_search)} HL7 messages with {n_workers} browser sessions...'
+        )
+        # the first worker uses the warm session, the others open their own
+        threads : list = [
+            threading.Thread(target=worker, args=(i == 0,), daemon=True) for i in range(n_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.log_wait_stats()
+        if errors and (stop.is_set() or not jobs.empty()):
+            raise errors[0]
+        return results
+
+    def failing_accessions(self) -> list:
+        """
+        Builds the list of HL7 examples to look up: every date combination error from `date_check` 
+        followed by one example per field that fails its threshold from `threshold_search`.
+        When the object reads the export in chunks the list is built by `stream_failing_accessions` 
+        instead.
+
+        Returns:
+            list: Tuples of (result text, accession number, distinguifier), where the distinguifier 
+                is the field name for threshold errors and [error type, message] for date errors.
+        """
+
+        if self.chunksize:
+            return self.stream_failing_accessions()
+
         # calling combined query
         logging.info('Getting information from both Demographics and Lab and combining them into one DF')
         combined_query_df : pd.DataFrame = self.combined_query_df()
         demo_complete_df ,lab_complete_df = self.completeness_report() 
 
-        # Get the list of Accession numbers from both date_check and threshold_search
         logging.info('Finding exceptions with incorrect date combinations')
         date_accession : list[tuple(str, int,Union[str, list])] = self.date_check(combined_query_df)
         logging.info('Finding exceptions with less completeness than allowed threshold')
         threshold_accession : list[tuple(str, int,Union[str, list])] = self.threshold_search(
             master_table=combined_query_df,
             demo_complete_df=demo_complete_df,
-            lab_complete_df=lab_complete_df
+            lab_complete_df=lab_complete_df,
+            master_nulls=self.combined_null_mask()
         )
-        accession_search : list = date_accession + threshold_accession
+        return date_accession + threshold_accession
 
-        # get driver: 
-        driver : webdriver = self.login()
-        logging.info('Scraping TST environment for HL7 messages that were flagged as missing or incorrect info...')
-        for index, search_params in enumerate(accession_search):
-            try:
-            
-                result_test : str = search_params[0]
-                acc_num : int = search_params[1]
-                distinguifier : Union[str, list] = search_params[2] # union is a method to type hint two types
-
-                if isinstance(distinguifier, str):
-                    logging.info(f'''
-                    Putting threshold error HL7 examples in word doc
-                    ACCESSION # : {acc_num}
-                    '''
-                                 )
-                    self.hl7_extraction(
-                        doc, 
-                        accession_search, 
-                        index, 
-                        result_test, 
-                        acc_num, 
-                        heading='THRESHOLD ERROR', 
-                        driver=driver
-                    )  
-                    #time.sleep(2)
-                if isinstance(distinguifier, list):
-                    # Need to tailor accession search variable to give a good header 
-                    logging.info(f'''
-                    Putting date combination error HL7 examples in word doc
-                    ACCESSION # : {acc_num}
-                    '''
-                                 )
-                    accession_search : list = [accession_search[0], accession_search[1], accession_search[2][1]]
-                    self.hl7_extraction(
-                        doc, 
-                        accession_search,
-                        index, 
-                        result_test, 
-                        acc_num, 
-                        heading='DATE ERROR', 
-                        driver=driver
-                    )
-                    #time.sleep(2)
-            except UnexpectedAlertPresentException:
+    def stream_failing_accessions(self) -> list:
+        """
+        Streaming version of `failing_accessions`, giving the same list without loading either 
+        query. `failing_accessions` checks the lab rows joined to their demographic record 
+        (`combined_query_df`), ordered by demographic record then lab row, so the queries are 
+        streamed in three passes:
+
+        1. Demographics: null counts, and the positions of the records of every Incident_ID.
+        2. Lab: null counts; rows of incidents with a demographic record are date checked and the 
+           first of them (in joined order) missing each lab field is kept, as is the first lab row 
+           of every incident.
+        3. Demographics again: the first record missing each field among incidents with lab rows, 
+           whose example is the first lab row of its incident, as in the joined table.
+
+        Returns:
+            list: Same format as `failing_accessions`.
+        """
+
+        logging.info('Streaming demographic query for incidents and missing fields')
+        demo_nulls : NullCountAccumulator = NullCountAccumulator()
+        # Incident_ID -> positions of its demographic records, the row order of combined_query_df
+        demo_rows : dict = {}
+        n_demo : int = 0
+        for chunk in self.query_chunks(self.tstRangeQuery_demographic()):
+            demo_nulls.update(chunk)
+            for position, incident_id in enumerate(chunk['Incident_ID'], start=n_demo):
+                if pd.notna(incident_id):
+                    demo_rows.setdefault(incident_id, []).append(position)
+            n_demo += len(chunk)
+
+        logging.info('Streaming lab query for date combination errors and missing fields')
+        lab_nulls : NullCountAccumulator = NullCountAccumulator()
+        # field -> ((demographic position, lab position), RESULTTEXT, ACCESSIONNUMBER)
+        lab_examples : dict = {}
+        date_accession : list = []
+        # Incident_ID -> (RESULTTEXT, ACCESSIONNUMBER) of its first lab row
+        first_lab_rows : dict = {}
+        n_lab : int = 0
+        for chunk in self.query_chunks(self.tstRangeQuery_lab()):
+            lab_nulls.update(chunk)
+            lab_positions : np.ndarray = np.arange(n_lab, n_lab + len(chunk))
+            n_lab += len(chunk)
+            # the join drops lab rows without a demographic record
+            joined : np.ndarray = chunk['IncidentID'].map(lambda incident_id: incident_id in demo_rows).to_numpy(dtype=bool)
+            chunk = chunk[joined].reset_index(drop=True)
+            if chunk.empty:
                 continue
-        logging.info('Putting all HL7 examples into docx ... ')
-        doc.save("HL7_Error.docx")
-        return
+            lab_positions = lab_positions[joined]
+            for incident_id, result_text, acc_num in zip(chunk['IncidentID'], chunk['RESULTTEXT'], chunk['ACCESSIONNUMBER']):
+                first_lab_rows.setdefault(incident_id, (result_text, acc_num))
+            first_demo : np.ndarray = np.array([demo_rows[incident_id][0] for incident_id in chunk['IncidentID']])
+
+            # a lab row is repeated for every demographic record of its incident
+            violations : pd.DataFrame = self.date_violations(chunk)
+            for row, entry in zip(violations['row'], self.date_errors(chunk, violations)):
+                for demo_position in demo_rows[chunk['IncidentID'].iloc[row]]:
+                    date_accession.append(((demo_position, lab_positions[row]), entry))
+
+            for field in self.LAB_FIELDS:
+                missing : np.ndarray = np.flatnonzero(chunk[field].isna().to_numpy())
+                if not len(missing):
+                    continue
+                row = missing[np.lexsort((lab_positions[missing], first_demo[missing]))[0]]
+                key : tuple = (first_demo[row], lab_positions[row])
+                if field not in lab_examples or key < lab_examples[field][0]:
+                    lab_examples[field] = (key, chunk['RESULTTEXT'].iloc[row], chunk['ACCESSIONNUMBER'].iloc[row])
+        # sort is stable, the violations of one row keep their rule order
+        date_accession = [entry for _, entry in sorted(date_accession, key=lambda item: item[0])]
+
+        logging.info('Streaming demographic query for the first joined record missing each field')
+        demo_missing : FirstMissingAccumulator = FirstMissingAccumulator(self.DEMO_FIELDS, keep=['Incident_ID'])
+        for chunk in self.query_chunks(self.tstRangeQuery_demographic()):
+            demo_missing.update(chunk[chunk['Incident_ID'].map(lambda incident_id: incident_id in first_lab_rows).to_numpy(dtype=bool)])
+
+        demo_percent : pd.Series = demo_nulls.percent_complete()
+        demo_percent = demo_percent[self.report_fields(demo_percent.index)]
+        lab_percent : pd.Series = lab_nulls.percent_complete()
+        lab_percent = lab_percent[self.report_fields(lab_percent.index)]
+        demo_complete_df : pd.DataFrame = self.percent_complete_df(demo_percent.index, demo_percent.values)
+        lab_complete_df : pd.DataFrame = self.percent_complete_df(lab_percent.index, lab_percent.values)
+
+        # same report order as failing_accessions, which has always unpacked completeness_report() 
+        # (lab, demo) into (demo_complete_df, lab_complete_df): the thresholds line up lab first
+        threshold_accession : list = []
+        for col in self.failing_fields(lab_complete_df, demo_complete_df):
+            if col in lab_examples:
+                _, result_text, acc_num = lab_examples[col]
+                threshold_accession.append((result_text, acc_num, col))
+            elif col in demo_missing.examples:
+                result_text, acc_num = first_lab_rows[demo_missing.examples[col]['Incident_ID']]
+                threshold_accession.append((result_text, acc_num, col))
+
+        assert len(threshold_accession) < 41
+        return date_accession + threshold_accession
 
     def hl7_extraction(self, doc, accession_search, index, result_test, acc_num, heading , driver):
         """
@@ -258,58 +702,159 @@ class WebCMR_check(Completeness):
         Returns:
             None
         """
+        table : str = self.fetch_hl7_retry(acc_num, result_test, driver)
+        if table is None:
+            return
+        self.write_hl7(doc, heading, accession_search[index][2], table)
+        pass 
+
+    def fetch_hl7_retry(self, acc_num, result_test, driver, attempts=2):
+        """
+        `fetch_hl7` behind the shared rate limiter, searching again when IMM kept showing the 
+        previous accession's results.
+
+        Parameters:
+            acc_num (int): The accession number to search for.
+            result_test (str): The result test to search for.
+            driver (webdriver): A logged-in session from `open_session`.
+            attempts (int): Number of searches before the accession is skipped.
+
+        Returns:
+            str or None: The HL7 message contents of acc_num, None if the results never refreshed.
+        """
+        for attempt in range(attempts):
+            self.rate_limiter.wait()
+            try:
+                return self.fetch_hl7(acc_num, result_test, driver)
+            except StaleResultsError as e:
+                logging.warning(f'{e} (attempt {attempt + 1} of {attempts})')
+        logging.warning(f'Skipping accession {acc_num}, IMM kept showing the previous results')
+        return None
+
+    def fetch_hl7(self, acc_num, result_test, driver) -> str:
+        """
+        Searches the Incoming Message Monitor for an accession number and returns the text of the 
+        message contents area.
+
+        Parameters:
+            acc_num (int): The accession number to search for.
+            result_test (str): The result test to search for.
+            driver (webdriver): A logged-in session from `open_session`.
+
+        Returns:
+            str: The HL7 message contents shown by IMM.
+
+        Raises:
+            StaleResultsError: IMM still showed the previous search's results.
+        """
+        if isinstance(driver, IMMHttpClient):
+            return driver.search(acc_num)
         driver : webdriver = self.acc_test_search(
                     acc_num=acc_num, resultTest=result_test, driver=driver
                     )
-        table : str = driver.find_element(By.ID, "divContentsArea").text       
-        doc.add_heading(f'{heading}: {accession_search[index][2]}')
+        return driver.find_element(By.ID, "divContentsArea").text
+
+    def write_hl7(self, doc, heading, subject, table):
+        """
+        Adds one HL7 example to the Word document.
+
+        Parameters:
+            doc (Word.Document): The Word document to add to.
+            heading (str): 'THRESHOLD ERROR' or 'DATE ERROR'.
+            subject (str): The failing field or the date error message.
+            table (str): The HL7 message contents from `fetch_hl7`.
+
+        Returns:
+            None
+        """
+        doc.add_heading(f'{heading}: {subject}')
         doc.add_paragraph(table)
-        pass 
 
-    def multiFind(self, driver, element_id, xpath=None, field_name=None):
+    def multiFind(self, driver, element_id, xpath=None, field_name=None, timeout=6):
         """
         Finds and returns an element on a web page using the given driver and element ID.
 
-        The function uses the WebDriverWait class from the selenium.webdriver.support.ui module
-        to wait for a specified amount of time until the element is present on the page.
-        It first tries to find the element using the ID locator strategy.
-        If the element is not found within the specified timeout period, it waits for an additional
-        1.5 seconds and then tries to find the element using the XPath locator strategy.
-        If the element is still not found, it tries to find the element using the field name locator strategy.
-        If the element is found, it is returned as a WebElement object.
+        The element is looked up by ID, then by the XPath expression, then by the field name 
+        XPath. Each poll tries every locator once with find_elements (which neither waits nor 
+        raises); between polls the function backs off exponentially until the element shows up or 
+        the timeout runs out. The locator that found the element is remembered per page and element 
+        and tried first next time, so pages where the ID never matches stop paying for it.
+        The time spent waiting for each element is added to `wait_stats`.
 
         Args:
             driver (WebDriver): The web driver used to interact with the web page.
             element_id (str): The ID of the element to be found.
             xpath (str, optional): The XPath expression to locate the element (default: None).
             field_name (str, optional): The name of the field to locate the element (default: None).
+            timeout (float, optional): Seconds to keep polling before giving up (default: 6).
             
         Returns:
             WebElement: The found element.
+
+        Raises:
+            NoSuchElementException: If no locator finds the element before the timeout.
         """
-    
-        wait = WebDriverWait(driver, 2)
-        try: 
-            element_btn = wait.until(EC.presence_of_element_located((By.ID, element_id)))
-        except TimeoutException:
-            time.sleep(1.5)
-            if xpath:
-                try: 
-                    element_btn = wait.until(EC.presence_of_element_located((By.XPATH, xpath)))
-                except: 
-                    pass
-            if field_name:
-                try: 
-                    element_btn = wait.until(EC.presence_of_element_located((By.XPATH, field_name)))
-                except: 
-                    pass
-            else: 
-                logging.error(f"Cannot find {element_id} on web")
-                raise NoSuchElementException(f"Cannot find {element_id} on web")
-        except ElementClickInterceptedException: 
-                self.alert_handling(driver)
-        return element_btn
-    
+
+        locators : list = [(By.ID, element_id)]
+        if xpath:
+            locators.append((By.XPATH, xpath))
+        if field_name:
+            locators.append((By.XPATH, field_name))
+
+        # try the locator that worked last time on this page first
+        key : tuple = (self._page_name(driver), element_id)
+        remembered : int = self._locator_memory.get(key, 0)
+        order : list = [remembered] + [i for i in range(len(locators)) if i != remembered]
+
+        start : float = time.monotonic()
+        backoff : float = 0.05
+        while True:
+            for i in order:
+                elements : list = driver.find_elements(*locators[i])
+                if elements:
+                    self._record_wait(key, time.monotonic() - start, i)
+                    return elements[0]
+            remaining : float = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            time.sleep(min(backoff, remaining))
+            backoff = min(backoff * 2, 1.0)
+
+        self._record_wait(key, time.monotonic() - start, None)
+        logging.error(f"Cannot find {element_id} on web")
+        raise NoSuchElementException(f"Cannot find {element_id} on web")
+
+    @staticmethod
+    def _page_name(driver) -> str:
+        # path of the current page without the query string, e.g. /TSTWebCMR/pages/home.aspx
+        try:
+            return urllib.parse.urlparse(driver.current_url).path
+        except Exception:
+            return ''
+
+    def _record_wait(self, key, seconds, locator):
+        # shared by every scraping worker
+        with self._wait_lock:
+            if locator is not None:
+                self._locator_memory[key] = locator
+            stats : dict = self.wait_stats.setdefault(key, {'lookups': 0, 'misses': 0, 'wait_seconds': 0.0})
+            stats['lookups'] += 1
+            stats['misses'] += locator is None
+            stats['wait_seconds'] += seconds
+
+    def log_wait_stats(self, top=5):
+        """
+        Logs the elements that cost the most waiting time in multiFind.
+        """
+
+        with self._wait_lock:
+            slowest : list = sorted(self.wait_stats.items(), key=lambda item: -item[1]['wait_seconds'])[:top]
+        for (page, element_id), stats in slowest:
+            logging.info(
+                f"Waited {stats['wait_seconds']:.2f}s for {element_id} on {page or 'unknown page'} "
+                f"over {stats['lookups']} lookups ({stats['misses']} not found)"
+            )
+
     def go_home(self, driver):
         """
         Clicks the home button and the investigators search button.
@@ -382,7 +927,28 @@ class WebCMR_check(Completeness):
         desired_option.click()
         return
     
-    def date_check(self, combined_query_df) -> list:
+    def stage_df(self, stage):
+        """
+        Same as Completeness.stage_df(), plus the 'date_check' stage. Its columns come from 
+        DATE_RULES as they are when it runs: the dates the rules compare and the lab record they 
+        flag, or the joined lab and demographic table (combined_query_df()) when a rule compares 
+        a demographic date.
+
+        Raises:
+            ValueError: A date rule names a column that is neither a lab nor a demographic field.
+        """
+
+        if stage != 'date_check':
+            return super().stage_df(stage)
+        columns : list = list(dict.fromkeys(col for rule in DATE_RULES for col in (rule.earlier, rule.later)))
+        unknown : list = [col for col in columns if col not in self.LAB_FIELDS and col not in self.DEMO_FIELDS]
+        if unknown:
+            raise ValueError(f'Date rules compare columns that are not report fields: {", ".join(unknown)}')
+        if any(col not in self.LAB_FIELDS for col in columns):
+            return self.combined_query_df()
+        return self.projected_df(self.LAB_TABLE, list(dict.fromkeys(columns + ['ACCESSIONNUMBER', 'RESULTTEXT'])))
+
+    def date_check(self, combined_query_df=None) -> list:
         """
         Check the dates in the given combined query dataframe for errors.
 
@@ -391,8 +957,12 @@ class WebCMR_check(Completeness):
                 collection_date < received_date < result_date
         where '<' signifies earlier date
 
+        The checks themselves are done by date_violations(); this method only formats the 
+        error messages for the rows that were flagged.
+
         Args:
-            combined_query_df (DataFrame): The combined query dataframe containing the date columns.
+            combined_query_df (DataFrame, optional): The combined query dataframe containing the date 
+                columns. Defaults to the columns the checks need (stage_df('date_check')).
         
         Returns:
             list: An array of tuples representing the date errors. Each tuple contains the following:
@@ -401,133 +971,200 @@ class WebCMR_check(Completeness):
                 - An array with the error type and a detailed error message
         """
 
+        if combined_query_df is None:
+            combined_query_df = self.stage_df('date_check')
+        return self.date_errors(combined_query_df, self.date_violations(combined_query_df))
+
+    def date_errors(self, combined_query_df, violations) -> list:
+        """
+        Formats the rows flagged by date_violations() as date_check() entries, one per violation 
+        and in the same order.
+        """
+
+        rules : dict = {rule.rule_id: rule for rule in DATE_RULES}
+
         # Array of accession for date errors
         date_errors = []
-        # looking at every row and checking date conditions
-        for _, row in combined_query_df.iterrows():
-            # get timestamp variables
-            spec_col_date = row['SPECCOLLECTEDDATE']
-            spec_rec_date = row['SPECRECEIVEDDATE']
-            result_date = row['RESULTDATE']
-
-            # running checks on valid time combinations 
-            if spec_col_date > spec_rec_date:
-                date_errors.append(
-                    (
-                        row['RESULTTEXT'],
-                        row['ACCESSIONNUMBER'],
-                        ['SpecCollectDate Error (w/Recieve Date)',f'SpecCollectDate Error (w/Recieve Date) : {spec_col_date} > {spec_rec_date}']
-                    )
+        for rule_id, row, acc_num, result_text in violations.itertuples(index=False, name=None):
+            rule : DateRule = rules[rule_id]
+            earlier_date = combined_query_df[rule.earlier].iloc[row]
+            later_date = combined_query_df[rule.later].iloc[row]
+            date_errors.append(
+                (
+                    result_text,
+                    acc_num,
+                    [rule.label, f'{rule.label} : {earlier_date} > {later_date}']
                 )
-            if spec_rec_date > result_date:
-                date_errors.append(
-                    (
-                        row['RESULTTEXT'],
-                        row['ACCESSIONNUMBER'],
-                        ['SpecRecieveDate Error (w/Result Date)',f'SpecRecieveDate Error (w/Result Date) : {spec_rec_date} > {result_date}']
-                    )
-                )
-            if spec_col_date > result_date:
-                date_errors.append(
-                    (
-                        row['RESULTTEXT'],
-                        row['ACCESSIONNUMBER'], 
-                        ['SpecCollectDate Error (w/Result Date)',f'SpecCollectDate Error (w/Result Date) : {spec_col_date} > {result_date}']
-                    )
-                )
-            
+            )
         return date_errors
-    
-    def threshold_search(self, master_table, demo_complete_df ,lab_complete_df) -> list:
+
+    def date_violations(self, combined_query_df, rules=None) -> pd.DataFrame:
         """
-        This method is meant to look at the completeness report of both lab and demographics data, 
-        and compare it to a standard threshold that has been predetermined an hardcoded into the 
-        program. If a field has a percent complete value less than the threshold, the program grabs 
-        one specific combo of Accession Number and Result Test where that field has a blank entry 
+        Vectorized check of every date ordering rule over the whole dataframe.
 
-        This function follows the following steps:
-        1. Ensures that the indexes of the master table are not an issue in later analysis by 
-        resetting them.
-        2. Concatenates the demographic complete dataframe and the lab complete dataframe into one 
-        dataframe called `combined_complete_df`.
-        3. Resets the indexes of the `combined_complete_df`.
-        4. Converts the 'Percent Complete' column of `combined_complete_df` to a float data type.
-        5. Builds a dictionary `threshold_key_pair` that contains the threshold value for every 
-        specific field of interest.
-        6. Initializes a list `threshold_error` to store the threshold errors.
-        7. Iterates over each row in the `combined_complete_df` dataframe.
-        8. Retrieves the field of interest and the percent complete value for the current row.
-        9. Assigns the threshold value for the field of interest in the `threshold_key_pair` dictionary.
-        10. Checks if the percent complete value is less than the threshold value.
-        11. If the condition is true, filters the master table to create a subset where the 
-        field of interest has missing values (NaN or Null).
-        12. Ensures that the length of the `master_subset` is greater than 0.
-        13. Retrieves the first row from `master_subset` that contains NaN value for the field of 
-        interest.
-        14. Appends the result text, accession number, and field of interest to the `threshold_error` 
-        list.
-        15. Asserts that the length of `threshold_error` is less than 41 to ensure that only one 
-        threshold error is recorded per field of interest.
-        16. Returns the `threshold_error` list containing the threshold errors.
+        Each date column is parsed to datetime64 once, each rule becomes one boolean mask 
+        (earlier > later), and the flagged cells are collected into a compact table. Dates that 
+        are missing or cannot be parsed never flag a rule. Rules whose columns are not in the 
+        dataframe are skipped.
+
+        Args:
+            combined_query_df (DataFrame): The combined query dataframe containing the date columns.
+            rules (list[DateRule]): The rules to check, DATE_RULES by default.
+
+        Returns:
+            pd.DataFrame: One row per violation, ordered by row then by rule, with columns 
+                'rule_id', 'row' (position in combined_query_df), 'ACCESSIONNUMBER' and 'RESULTTEXT'.
+        """
+
+        if rules is None:
+            rules = DATE_RULES
+        # only keep rules we can evaluate on this dataframe
+        usable_rules : list = []
+        for rule in rules:
+            if rule.earlier in combined_query_df.columns and rule.later in combined_query_df.columns:
+                usable_rules.append(rule)
+            else:
+                logging.warning(f'Skipping date rule {rule.rule_id}, missing {rule.earlier} or {rule.later}')
+
+        # parse every date column once, text dates can mix formats
+        date_columns : set = {col for rule in usable_rules for col in (rule.earlier, rule.later)}
+        parsed : dict = {
+            col: parse_dates(combined_query_df[col]).to_numpy()
+            for col in date_columns
+        }
+
+        # one boolean mask per rule, stacked as (rows, rules)
+        n_rows : int = len(combined_query_df)
+        masks : np.ndarray = np.zeros((n_rows, len(usable_rules)), dtype=bool)
+        for i, rule in enumerate(usable_rules):
+            masks[:, i] = parsed[rule.earlier] > parsed[rule.later] # NaT compares False
+
+        # row-major nonzero keeps the row order, then the rule order within a row
+        rows, rule_positions = np.nonzero(masks)
+        rule_ids : np.ndarray = np.array([rule.rule_id for rule in usable_rules], dtype=object)
+        violations : pd.DataFrame = pd.DataFrame({
+            'rule_id': rule_ids[rule_positions],
+            'row': rows,
+            'ACCESSIONNUMBER': combined_query_df['ACCESSIONNUMBER'].to_numpy()[rows],
+            'RESULTTEXT': combined_query_df['RESULTTEXT'].to_numpy()[rows]
+        })
+        logging.info(f'Found {len(violations)} date order violations in {n_rows} rows')
+        return violations
+
+    def date_violation_table(self):
+        """
+        The date violations of the lab records (see date_violations()), for export_metrics().
+        """
+
+        return self.date_violations(self.stage_df('date_check'))
+
+    def aggregate_date_violations(self, lab_query_df):
+        """
+        The date rules only compare lab dates, so the violations stored with the aggregates of an
+        export are checked on the lab query itself (rows are positions in lab_query_df).
+        """
+
+        return self.date_violations(lab_query_df)
+
+    def failing_fields(self, demo_complete_df, lab_complete_df) -> list:
+        """
+        Compares the completeness report of both demographics and lab data to the standard 
+        thresholds that have been predetermined and hardcoded into the program.
+
+        1. Concatenates the demographic complete dataframe and the lab complete dataframe into one 
+        dataframe called `combined_complete_df` and resets its indexes.
+        2. Converts the 'Percent Complete' column of `combined_complete_df` to a float data type.
+        3. Compares each field's percent complete with the threshold at the same position.
 
         Args:
-            master_table (pd.DataFrame): The master table dataframe.
             demo_complete_df (pd.DataFrame): The demographic complete dataframe.
             lab_complete_df (pd.DataFrame): The lab complete dataframe.
 
         Returns:
-            list: A list of threshold errors, each containing the result text, accession number, 
-            and field of interest.
+            list: The fields of interest whose percent complete is below their threshold, in report order.
         """
 
-        # making sure index's are not an issue in later analysis
-        master_table.reset_index(inplace=True)
-        
-        
         # Going to concatenate into one df
         combined_complete_df : pd.DataFrame 
         combined_complete_df = pd.concat([demo_complete_df, lab_complete_df])
         combined_complete_df.reset_index(inplace=True)
         combined_complete_df['Percent Complete'] : pd.Series
         combined_complete_df['Percent Complete'] = combined_complete_df['Percent Complete'].astype(float)
-        print(combined_complete_df)
-        # building a dictionary that has the threshold value for every specific field of interest
-        # At the same time checking if the threshold value is less than the percent complete
-        # and then trying to find the accession numbers for one of the blank fields in the that category
-        threshold_key_pair : dict = {}
+        logging.debug('Combined completeness table:\n%s', combined_complete_df)
+        # threshold value for every specific field of interest, by position in combined_complete_df
         threshold_vals : list = [
             100,100,100,100,100,100,100,100,100,100,100,100,100,100,100,100,100,100,
             100,100,100,100,100,100,100,100,100,100,100,100,100,95,95,95,95,95,
             100,100,100,100
             ] # need marjorie to give me a list of thresholds similar to this 
-        
-        threshold_error : list = []
+
+        failing : list = []
         for i, row in combined_complete_df.iterrows():
             col : str = row['Fields of Interest']
             pc : float = row['Percent Complete']
-            threshold_key_pair[col] = threshold_vals[i]
+            if pc < float(threshold_vals[i]):
+                failing.append(col)
+        return failing
+
+    def threshold_search(self, master_table, demo_complete_df ,lab_complete_df, master_nulls=None) -> list:
+        """
+        This method is meant to look at the completeness report of both lab and demographics data, 
+        and compare it to a standard threshold that has been predetermined an hardcoded into the 
+        program. If a field has a percent complete value less than the threshold, the program grabs 
+        one specific combo of Accession Number and Result Test where that field has a blank entry 
 
-            # if Percent complete is lower than threshold we need to look at a subset of master table
+        This function follows the following steps:
+        1. Ensures that the indexes of the master table are not an issue in later analysis by 
+        resetting them.
+        2. Uses the packed null mask of the master table, `master_nulls` (e.g. the cached 
+        `combined_null_mask`), or builds it once if none is given.
+        3. Gets the fields whose percent complete is below their threshold from `failing_fields`.
+        4. For each failing field, looks up the first row of the master table where the field has 
+        a missing value (NaN or Null) in the null mask, and ensures such a row exists.
+        5. Appends the result text, accession number, and field of interest of that row to the 
+        `threshold_error` list.
+        6. Asserts that the length of `threshold_error` is less than 41 to ensure that only one 
+        threshold error is recorded per field of interest.
+        7. Returns the `threshold_error` list containing the threshold errors.
+
+        Args:
+            master_table (pd.DataFrame): The master table dataframe.
+            demo_complete_df (pd.DataFrame): The demographic complete dataframe.
+            lab_complete_df (pd.DataFrame): The lab complete dataframe.
+            master_nulls (NullMaskIndex, optional): The null mask of the master table.
+
+        Returns:
+            list: A list of threshold errors, each containing the result text, accession number, 
+            and field of interest.
+        """
+
+        # making sure index's are not an issue in later analysis
+        master_table.reset_index(inplace=True)
+
+        # one null mask of the master table, shared by every failing field
+        if master_nulls is None:
+            master_nulls = NullMaskIndex(master_table)
+
+        threshold_error : list = []
+        for col in self.failing_fields(demo_complete_df, lab_complete_df):
+            # if Percent complete is lower than threshold we need to look at the master table
             # and pull out a accession number of a field where there is a nan value. We will look at 
             # only the first occurrence of nan value for this search 
-            
-            if pc < float(threshold_vals[i]):
-                # filtering table on missing values using both NaN and Null for missing
-                master_subset : pd.DataFrame = master_table[master_table[col].isna() | master_table[col].isnull()]
+            first_missing : int = master_nulls.first_missing(col)
 
-                assert len(master_subset) > 0
-                
-                # grabbing first row that contains NaN value of columns that 
-                master_subset_row: pd.DataFrame = master_subset.iloc[0]
+            assert first_missing is not None
+            
+            # grabbing first row that contains NaN value of columns that 
+            master_subset_row: pd.Series = master_table.iloc[first_missing]
 
             # Appending the accession numbers that do not meet threshold criteria  
-                threshold_error.append(
-                    (
-                    master_subset_row['RESULTTEXT'],
-                    master_subset_row['ACCESSIONNUMBER'],
-                    col
-                    )
+            threshold_error.append(
+                (
+                master_subset_row['RESULTTEXT'],
+                master_subset_row['ACCESSIONNUMBER'],
+                col
                 )
+            )
         # there are 40 fields of interest, want to make sure we only grab 1 from each field that fails
         # Percent Complete threshold set by marjorie, So there couldn't be more than 40 elements total
         # in threshold_error list 
@@ -0,0 +1,178 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Mergeable accumulators for the chunked (streaming) report mode of Completeness. Each
+#   accumulator folds one chunk of a query result at a time with update(), can be combined
+#   with another accumulator over a later part of the same result with merge(), and only
+#   keeps per-field or per-value totals, so memory is bounded by the chunk size and the number
+#   of distinct values rather than by the size of the range export.
+#
+#   Accumulators must be updated / merged in row order; the outputs depend on which values
+#   and rows were seen first, exactly like their in-memory counterparts.
+#-------------------------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+
+def fill_na(series):
+    """
+    Returns the values of series as an object array with every null replaced by 'N/A'.
+    """
+
+    return series.astype(object).where(series.notna(), 'N/A').to_numpy()
+
+
+def count_pairs(index_values, column_values):
+    """
+    Counts every (index value, column value) pair with numpy kernels (factorize + bincount).
+
+    Args:
+        index_values (np.ndarray): Values of the first column, nulls already replaced.
+        column_values (np.ndarray): Values of the second column, nulls already replaced.
+
+    Returns:
+        dict: {(index value, column value): count}, in the order the pairs are first seen.
+    """
+
+    # integer codes for each column, factorize keeps first-seen order
+    index_codes, index_uniques = pd.factorize(index_values)
+    column_codes, column_uniques = pd.factorize(column_values)
+
+    # one code per (index, column) pair, counted in a single pass
+    n_column_uniques = max(len(column_uniques), 1)
+    pair_codes = index_codes.astype(np.int64) * n_column_uniques + column_codes
+    pair_ids, pair_uniques = pd.factorize(pair_codes)
+    pair_totals = np.bincount(pair_ids, minlength=len(pair_uniques))
+
+    # unique pairs only from here on, in the order they were first seen
+    pair_counts = {}
+    for pair_code, count in zip(pair_uniques, pair_totals):
+        i, j = divmod(int(pair_code), n_column_uniques)
+        pair_counts[(index_uniques[i], column_uniques[j])] = int(count)
+    return pair_counts
+
+
+def _add_counts(counts, other_counts):
+    # dict addition that keeps first-seen order: new keys from other go to the end
+    for key, count in other_counts.items():
+        counts[key] = counts.get(key, 0) + count
+    return counts
+
+
+class NullCountAccumulator:
+    """
+    Missing-value counts per field, for range_export_df().
+    """
+
+    def __init__(self):
+        self.null_counts = None
+        self.n_rows = 0
+
+    def update(self, chunk):
+        counts = chunk.isna().sum()
+        self.null_counts = counts if self.null_counts is None else self.null_counts + counts
+        self.n_rows += len(chunk)
+        return self
+
+    def merge(self, other):
+        if other.null_counts is not None:
+            self.null_counts = (
+                other.null_counts if self.null_counts is None else self.null_counts + other.null_counts
+            )
+        self.n_rows += other.n_rows
+        return self
+
+    def percent_complete(self):
+        """
+        Returns:
+            pd.Series: Percentage of present values per field.
+        """
+
+        if self.null_counts is None:
+            return pd.Series(dtype=float)
+        nonNullCounts = self.n_rows - self.null_counts
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (nonNullCounts / self.n_rows) * 100
+
+
+class PairCountAccumulator:
+    """
+    Counts of (index, column) value pairs, for cross_tab_df().
+    """
+
+    def __init__(self, index, column):
+        self.index = index
+        self.column = column
+        self.pair_counts = {}
+
+    def update(self, chunk):
+        chunk_counts = count_pairs(fill_na(chunk[self.index]), fill_na(chunk[self.column]))
+        _add_counts(self.pair_counts, chunk_counts)
+        return self
+
+    def merge(self, other):
+        _add_counts(self.pair_counts, other.pair_counts)
+        return self
+
+
+class ValueCountAccumulator:
+    """
+    Value counts of a column, optionally only over rows where another column is missing
+    (RESULTTEXT where REFERENCERANGE is blank, for result_test()).
+    """
+
+    def __init__(self, column, where_missing=None):
+        self.column = column
+        self.where_missing = where_missing
+        self.counts = {}
+
+    def update(self, chunk):
+        values = chunk[self.column]
+        if self.where_missing is not None:
+            values = values[chunk[self.where_missing].isna()]
+        values = values.dropna()
+        if len(values):
+            codes, uniques = pd.factorize(values.to_numpy())
+            totals = np.bincount(codes, minlength=len(uniques))
+            _add_counts(self.counts, dict(zip(uniques, totals.tolist())))
+        return self
+
+    def merge(self, other):
+        _add_counts(self.counts, other.counts)
+        return self
+
+    def value_counts(self):
+        """
+        Returns:
+            pd.Series: Counts sorted from most to least frequent, ties in first-seen order.
+        """
+
+        counts = pd.Series(self.counts, dtype='int64')
+        return counts.sort_values(ascending=False, kind='stable')
+
+
+class FirstMissingAccumulator:
+    """
+    For every field, the first row where it is missing (only the 'keep' columns of that row are
+    kept), for threshold_search().
+    """
+
+    def __init__(self, fields, keep):
+        self.fields = list(fields)
+        self.keep = list(keep)
+        self.examples = {}
+
+    def update(self, chunk):
+        for field in self.fields:
+            if field in self.examples:
+                continue
+            missing = chunk[field].isna().to_numpy()
+            if missing.any():
+                self.examples[field] = chunk[self.keep].iloc[int(missing.argmax())]
+        return self
+
+    def merge(self, other):
+        for field, row in other.examples.items():
+            self.examples.setdefault(field, row)
+        return self
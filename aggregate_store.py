@@ -0,0 +1,395 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Historical store of report card aggregates across successive range exports. Weekly
+#   exports overlap heavily, so instead of rescanning every raw row each time, the rows of a
+#   new export that were not seen before (by ACCESSIONNUMBER and RESULTTEXT for lab records, so
+#   a result added to an accession later still counts, and by Incident_ID for demographic
+#   records) are reduced to per-day, per-test-center aggregates and added to a
+#   local SQLite file:
+#       - non-null counts and row counts per field
+#       - crosstab pair counts (Ethnicity vs Race, Abnormal Flag vs ResultedOrganism / RESULT)
+#         and the result texts with a blank reference range
+#       - date violation counts per rule
+#   A report card for any window of days and centers is then built by summing the stored
+#   aggregates (see Completeness.window_report_tables).
+#
+#   An export is ingested one chunk at a time. The record keys of each chunk are checked
+#   against the store with an anti-join in SQLite, so an ingest costs time and memory in
+#   proportion to the export, not to the history kept in the store.
+#
+#   The day of a lab record is its SPECCOLLECTEDDATE; a demographic record takes the earliest
+#   collection date of its lab records in the same export. Records without one are stored
+#   under the day '' and only show up in reports without a day window. Crosstab values are
+#   stored as text.
+#-------------------------------------------------------------------------------------------
+
+import logging
+import sqlite3
+import numpy as np
+import pandas as pd
+from accumulators import count_pairs, fill_na
+from compact_dtypes import parse_dates
+
+
+class AggregateStore:
+
+    # (crosstab name, index column, column column) for each table
+    LAB_CROSSTABS = [
+        ('resulted_organism_abflag', 'ABNORMALFLAG', 'ResultedOrganism'),
+        ('result_abflag', 'ABNORMALFLAG', 'RESULT')
+    ]
+    DEMO_CROSSTABS = [('race_ethnicity', 'Ethnicity', 'Race')]
+    # record keys used to recognise rows from earlier exports, the record id comes first
+    RECORD_KEYS = {'lab': ('ACCESSIONNUMBER', 'RESULTTEXT'), 'demo': ('Incident_ID',)}
+
+    def __init__(self, path='aggregate_store.sqlite'):
+        """
+        Args:
+            path (str): SQLite file of the store, created on first use.
+        """
+        self.path = path
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(
+                '''
+                CREATE TABLE IF NOT EXISTS seen_records (
+                    kind TEXT NOT NULL,
+                    record_key TEXT NOT NULL,
+                    PRIMARY KEY (kind, record_key)
+                );
+                CREATE TABLE IF NOT EXISTS field_counts (
+                    day TEXT NOT NULL,
+                    test_center TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    field TEXT NOT NULL,
+                    non_null INTEGER NOT NULL,
+                    rows INTEGER NOT NULL,
+                    PRIMARY KEY (day, test_center, kind, field)
+                );
+                CREATE TABLE IF NOT EXISTS pair_counts (
+                    day TEXT NOT NULL,
+                    test_center TEXT NOT NULL,
+                    crosstab TEXT NOT NULL,
+                    index_value TEXT NOT NULL,
+                    column_value TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    first_seen INTEGER NOT NULL,
+                    PRIMARY KEY (day, test_center, crosstab, index_value, column_value)
+                );
+                CREATE TABLE IF NOT EXISTS date_violations (
+                    day TEXT NOT NULL,
+                    test_center TEXT NOT NULL,
+                    rule_id TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (day, test_center, rule_id)
+                );
+                -- record keys of the chunk being checked, see unseen()
+                CREATE TEMP TABLE IF NOT EXISTS chunk_keys (
+                    position INTEGER PRIMARY KEY,
+                    record_key TEXT NOT NULL
+                );
+                -- new records of the export being ingested, added to seen_records once it is done
+                CREATE TEMP TABLE IF NOT EXISTS new_records (
+                    kind TEXT NOT NULL,
+                    record_key TEXT NOT NULL
+                );
+                '''
+            )
+        return self._conn
+
+    def record_keys(self, kind, df):
+        """
+        Returns the record key of every row: ACCESSIONNUMBER|RESULTTEXT for lab rows, Incident_ID 
+        for demographic rows, or a hash of the whole row when the ACCESSIONNUMBER / Incident_ID 
+        is missing.
+        """
+
+        def text(column):
+            return column.astype(object).where(column.notna(), '').astype(str).to_numpy(dtype=object)
+
+        id_column, *other_columns = self.RECORD_KEYS[kind]
+        keys = text(df[id_column])
+        for col in other_columns:
+            keys = keys + '|' + text(df[col])
+        missing = df[id_column].isna().to_numpy()
+        if missing.any():
+            row_hashes = pd.util.hash_pandas_object(df[missing].astype(str), index=False).to_numpy()
+            keys[missing] = ['row:' + str(h) for h in row_hashes]
+        return keys
+
+    def unseen(self, kind, keys):
+        """
+        Returns:
+            np.ndarray: Boolean mask, True for the keys not recorded by an earlier export. The keys 
+                are looked up in seen_records by SQLite, the stored keys are never read into memory.
+        """
+
+        conn = self._connection()
+        conn.execute('DELETE FROM chunk_keys')
+        conn.executemany('INSERT INTO chunk_keys VALUES (?, ?)', enumerate(keys))
+        positions = [
+            position for (position,) in conn.execute(
+                '''
+                SELECT position FROM chunk_keys WHERE NOT EXISTS (
+                    SELECT 1 FROM seen_records
+                    WHERE seen_records.kind = ? AND seen_records.record_key = chunk_keys.record_key
+                )
+                ''',
+                (kind,)
+            )
+        ]
+        conn.execute('DELETE FROM chunk_keys')
+        new_rows = np.zeros(len(keys), dtype=bool)
+        new_rows[positions] = True
+        return new_rows
+
+    def _new_rows(self, kind, df):
+        # mask of the rows of df not seen by an earlier export, their keys are kept in new_records
+        keys = self.record_keys(kind, df)
+        new_rows = self.unseen(kind, keys)
+        self._connection().executemany(
+            'INSERT INTO new_records VALUES (?, ?)', [(kind, key) for key in keys[new_rows]]
+        )
+        return new_rows
+
+    @staticmethod
+    def _days(dates):
+        days = parse_dates(dates).dt.strftime('%Y-%m-%d')
+        return days.fillna('').to_numpy(dtype=object)
+
+    @staticmethod
+    def _centers(df):
+        if 'test_center' not in df.columns:
+            return np.full(len(df), '', dtype=object)
+        return df['test_center'].fillna('').astype(str).to_numpy(dtype=object)
+
+    def ingest_export(self, demo_df, lab_df, demo_fields, lab_fields, date_violations=None):
+        """
+        Adds the aggregates of the records of an export that is already loaded, see ingest_chunks().
+
+        Args:
+            demo_df (pandas.DataFrame): Demographic query result (with test_center).
+            lab_df (pandas.DataFrame): Lab query result (with test_center).
+            demo_fields (list): Demographic report fields, in report order.
+            lab_fields (list): Lab report fields, in report order.
+            date_violations (pandas.DataFrame, optional): Output of WebCMR_check.date_violations
+                on lab_df ('rule_id' and positional 'row').
+
+        Returns:
+            dict: Number of new records, {'lab': n, 'demo': n}.
+        """
+
+        return self.ingest_chunks(
+            [lab_df], [demo_df], demo_fields, lab_fields,
+            date_violations=None if date_violations is None else lambda chunk: date_violations
+        )
+
+    def ingest_chunks(self, lab_chunks, demo_chunks, demo_fields, lab_fields, date_violations=None):
+        """
+        Adds the aggregates of the records of an export that are not in the store yet. The export 
+        is read one chunk at a time, every lab chunk before the first demographic one, and only 
+        the chunk being added is in memory. The whole export is added in one transaction.
+
+        Args:
+            lab_chunks (iterable): Lab query result (with test_center), as DataFrames.
+            demo_chunks (iterable): Demographic query result (with test_center), as DataFrames.
+            demo_fields (list): Demographic report fields, in report order.
+            lab_fields (list): Lab report fields, in report order.
+            date_violations (callable, optional): Returns the date violations of a lab chunk, as
+                WebCMR_check.date_violations does ('rule_id' and positional 'row').
+
+        Returns:
+            dict: Number of new records, {'lab': n, 'demo': n}.
+        """
+
+        conn = self._connection()
+        new_records = {'lab': 0, 'demo': 0}
+        total_records = {'lab': 0, 'demo': 0}
+        # a demographic record takes the earliest collection day of its lab records
+        incident_days = {}
+
+        with conn:
+            conn.execute('DELETE FROM new_records')
+            for lab_df in lab_chunks:
+                lab_days = self._days(lab_df['SPECCOLLECTEDDATE'])
+                chunk_days = (
+                    pd.Series(lab_days, index=lab_df['IncidentID'].to_numpy())
+                    .replace('', np.nan).dropna().groupby(level=0).min()
+                )
+                for incident_id, day in chunk_days.items():
+                    if incident_id not in incident_days or day < incident_days[incident_id]:
+                        incident_days[incident_id] = day
+
+                new_lab = self._new_rows('lab', lab_df)
+                self._add_table('lab', lab_df, new_lab, lab_days, lab_fields, self.LAB_CROSSTABS, blank_reference=True)
+                violations = date_violations(lab_df) if date_violations is not None else None
+                if violations is not None and len(violations):
+                    self._add_date_violations(violations, new_lab, lab_days, self._centers(lab_df))
+                new_records['lab'] += int(new_lab.sum())
+                total_records['lab'] += len(lab_df)
+
+            incident_days = pd.Series(incident_days, dtype=object)
+            for demo_df in demo_chunks:
+                demo_days = demo_df['Incident_ID'].map(incident_days).fillna('').to_numpy(dtype=object)
+                new_demo = self._new_rows('demo', demo_df)
+                self._add_table('demo', demo_df, new_demo, demo_days, demo_fields, self.DEMO_CROSSTABS)
+                new_records['demo'] += int(new_demo.sum())
+                total_records['demo'] += len(demo_df)
+
+            # records of this export only count as seen by the next one
+            conn.execute('INSERT OR IGNORE INTO seen_records SELECT kind, record_key FROM new_records')
+            conn.execute('DELETE FROM new_records')
+
+        logging.info(
+            f"Aggregate store: {new_records['lab']} of {total_records['lab']} lab and "
+            f"{new_records['demo']} of {total_records['demo']} demographic records are new"
+        )
+        return new_records
+
+    def _next_sequence(self):
+        # pair counts remember the order they were first seen in, for the crosstab layout
+        row = self._connection().execute('SELECT MAX(first_seen) FROM pair_counts').fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def _add_table(self, kind, df, new_rows, days, fields, crosstabs, blank_reference=False):
+        conn = self._connection()
+        positions = np.flatnonzero(new_rows)
+        if len(positions) == 0:
+            return
+        df = df.take(positions)
+        groups = pd.DataFrame({'day': days[positions], 'center': self._centers(df)}).groupby(
+            ['day', 'center'], sort=False
+        ).indices
+
+        sequence = self._next_sequence()
+        for (day, center), rows in groups.items():
+            group = df.take(rows)
+            non_null = group[fields].notna().sum()
+            conn.executemany(
+                '''
+                INSERT INTO field_counts VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (day, test_center, kind, field) DO UPDATE SET
+                    non_null = non_null + excluded.non_null,
+                    rows = rows + excluded.rows
+                ''',
+                [
+                    (day, center, kind, i, field, int(non_null[field]), len(group))
+                    for i, field in enumerate(fields)
+                ]
+            )
+
+            pair_sets = [
+                (name, count_pairs(fill_na(group[index]), fill_na(group[column])))
+                for name, index, column in crosstabs
+            ]
+            if blank_reference:
+                # result texts with a blank reference range, kept as pairs with an empty column
+                blank = group.loc[group['REFERENCERANGE'].isna().to_numpy(), 'RESULTTEXT'].dropna()
+                counts = {}
+                for text in blank.to_numpy():
+                    counts[(text, '')] = counts.get((text, ''), 0) + 1
+                pair_sets.append(('blank_reference_range', counts))
+
+            for name, pair_counts in pair_sets:
+                rows_to_add = []
+                for (index_value, column_value), count in pair_counts.items():
+                    rows_to_add.append(
+                        (day, center, name, str(index_value), str(column_value), int(count), sequence)
+                    )
+                    sequence += 1
+                conn.executemany(
+                    '''
+                    INSERT INTO pair_counts VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (day, test_center, crosstab, index_value, column_value) DO UPDATE SET
+                        count = count + excluded.count
+                    ''',
+                    rows_to_add
+                )
+
+    def _add_date_violations(self, date_violations, new_lab, lab_days, lab_centers):
+        rows = date_violations['row'].to_numpy()
+        keep = new_lab[rows]
+        counts = pd.DataFrame({
+            'day': lab_days[rows[keep]],
+            'center': lab_centers[rows[keep]],
+            'rule_id': date_violations['rule_id'].to_numpy()[keep]
+        }).value_counts(sort=False)
+        self._connection().executemany(
+            '''
+            INSERT INTO date_violations VALUES (?, ?, ?, ?)
+            ON CONFLICT (day, test_center, rule_id) DO UPDATE SET count = count + excluded.count
+            ''',
+            [(day, center, rule_id, int(count)) for (day, center, rule_id), count in counts.items()]
+        )
+
+    @staticmethod
+    def _window(start_day, end_day, test_centers):
+        # WHERE clause and parameters for a window of days (inclusive) and centers
+        clauses, params = [], []
+        if start_day is not None:
+            clauses.append("day != '' AND day >= ?")
+            params.append(str(pd.Timestamp(start_day).date()))
+        if end_day is not None:
+            clauses.append("day != '' AND day <= ?")
+            params.append(str(pd.Timestamp(end_day).date()))
+        if test_centers is not None:
+            clauses.append(f"test_center IN ({', '.join('?' for _ in test_centers)})")
+            params.extend(test_centers)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def field_counts(self, kind, start_day=None, end_day=None, test_centers=None):
+        """
+        Returns:
+            pandas.DataFrame: 'field', 'non_null' and 'rows' summed over the window, in report order.
+        """
+
+        where, params = self._window(start_day, end_day, test_centers)
+        rows = self._connection().execute(
+            f'''
+            SELECT field, SUM(non_null), SUM(rows) FROM field_counts
+            {where}{' AND' if where else ' WHERE'} kind = ?
+            GROUP BY field ORDER BY MIN(position)
+            ''',
+            params + [kind]
+        ).fetchall()
+        return pd.DataFrame(rows, columns=['field', 'non_null', 'rows'])
+
+    def pair_counts(self, crosstab, start_day=None, end_day=None, test_centers=None):
+        """
+        Returns:
+            dict: {(index value, column value): count} summed over the window, in first-seen order.
+        """
+
+        where, params = self._window(start_day, end_day, test_centers)
+        rows = self._connection().execute(
+            f'''
+            SELECT index_value, column_value, SUM(count) FROM pair_counts
+            {where}{' AND' if where else ' WHERE'} crosstab = ?
+            GROUP BY index_value, column_value ORDER BY MIN(first_seen)
+            ''',
+            params + [crosstab]
+        ).fetchall()
+        return {(index_value, column_value): count for index_value, column_value, count in rows}
+
+    def date_violation_counts(self, start_day=None, end_day=None, test_centers=None):
+        """
+        Returns:
+            pandas.Series: Number of violations of each date rule over the window.
+        """
+
+        where, params = self._window(start_day, end_day, test_centers)
+        rows = self._connection().execute(
+            f'SELECT rule_id, SUM(count) FROM date_violations{where} GROUP BY rule_id ORDER BY rule_id',
+            params
+        ).fetchall()
+        return pd.Series(dict(rows), dtype='int64')
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,195 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Data-source backends for Completeness. Every backend serves the same lab / demographic
+#   query contract (the tables of a TST range export, queried with the SQL built by
+#   Completeness), so the analytics also run off Windows:
+#       - AccessBackend: the .accdb range export through the Microsoft Access ODBC driver
+#       - SQLiteBackend: a SQLite copy of the export
+#       - DuckDBBackend: a DuckDB copy of the export, queries run multi-threaded in the engine
+#       - FileBackend: a folder with one CSV or Parquet file per table, loaded into an
+#         in-memory SQLite database
+#   Access quotes table names as [name]; the other backends get them as "name".
+#
+#   pyodbc and duckdb are optional; a backend whose driver is not installed raises
+#   ImportError when it connects.
+#-------------------------------------------------------------------------------------------
+
+import abc
+import logging
+import os
+import re
+import sqlite3
+import pandas as pd
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+class Backend(abc.ABC):
+    # file extensions served by the backend, see backend_for()
+    extensions = ()
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The range export (file or folder) the backend reads.
+        """
+        self.path = path
+
+    @abc.abstractmethod
+    def connect(self):
+        """
+        Returns:
+            A new DB-API connection to the export.
+        """
+
+    def health_check(self, conn, cursor):
+        """
+        Cheap round trip to the database, raises if the connection is no longer usable.
+        """
+
+        conn.cursor().execute('SELECT 1').fetchone()
+
+    def translate(self, query):
+        """
+        Rewrites a query built for Access for this backend: [name] identifiers become "name".
+        """
+
+        return re.sub(r'\[([^\]]+)\]', r'"\1"', query)
+
+
+class AccessBackend(Backend):
+    extensions = ('.accdb', '.mdb')
+
+    def connect(self):
+        if pyodbc is None:
+            raise ImportError('pyodbc is needed to read Access range exports')
+        pyodbc.lowercase = False
+        return pyodbc.connect(
+            r"Driver={Microsoft Access Driver (*.mdb, *.accdb)};" +
+            fr"Dbq={self.path}")
+
+    def health_check(self, conn, cursor):
+        # catalog lookup, raises pyodbc.Error if the file or share is no longer reachable
+        cursor.tables(tableType='TABLE').fetchone()
+
+    def translate(self, query):
+        return query
+
+
+class SQLiteBackend(Backend):
+    extensions = ('.sqlite', '.sqlite3', '.db')
+
+    def connect(self):
+        # open read-only, a missing file is an error instead of a new empty database
+        return sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+
+
+class DuckDBBackend(Backend):
+    extensions = ('.duckdb',)
+
+    def __init__(self, path, threads=None):
+        """
+        Args:
+            path (str): The DuckDB database file.
+            threads (int, optional): Threads DuckDB may use per query, defaults to all cores.
+        """
+        super().__init__(path)
+        self.threads = threads
+
+    def connect(self):
+        if duckdb is None:
+            raise ImportError('duckdb is needed to read DuckDB range exports')
+        config = {'threads': self.threads} if self.threads else {}
+        return duckdb.connect(self.path, read_only=True, config=config)
+
+    def translate(self, query):
+        # LIKE is case-insensitive in Access (and SQLite), not in DuckDB
+        return re.sub(r'\bLIKE\b', 'ILIKE', super().translate(query))
+
+
+class FileBackend(Backend):
+    extensions = ('.csv', '.parquet')
+
+    def __init__(self, path, tables=None):
+        """
+        Args:
+            path (str): Folder with one '{table}.csv' or '{table}.parquet' file per table, or a 
+                single such file.
+            tables (list, optional): Tables to load, defaults to every CSV / Parquet file in path.
+        """
+        super().__init__(path)
+        self.tables = tables
+
+    def table_files(self):
+        """
+        Returns:
+            dict: {table name: file} for the tables in the folder.
+        """
+
+        if os.path.isdir(self.path):
+            paths = [os.path.join(self.path, entry) for entry in sorted(os.listdir(self.path))]
+        else:
+            paths = [self.path]
+        files = {}
+        for file_path in paths:
+            table, extension = os.path.splitext(os.path.basename(file_path))
+            if extension.lower() in self.extensions and (self.tables is None or table in self.tables):
+                files[table] = file_path
+        return files
+
+    def connect(self):
+        conn = sqlite3.connect(':memory:')
+        for table, file_path in self.table_files().items():
+            if file_path.lower().endswith('.parquet'):
+                df = pd.read_parquet(file_path)
+            else:
+                df = pd.read_csv(file_path)
+            df.to_sql(table, conn, index=False)
+            logging.info(f'Loaded {len(df)} rows of {table} from {file_path}')
+        return conn
+
+
+BACKENDS = {
+    'access': AccessBackend,
+    'sqlite': SQLiteBackend,
+    'duckdb': DuckDBBackend,
+    'files': FileBackend
+}
+
+
+def backend_for(path, backend=None):
+    """
+    Returns the backend of a range export.
+
+    Args:
+        path (str): The range export (file, or folder of table files).
+        backend (str or Backend, optional): A backend, or the name of one in BACKENDS. Defaults to
+            the backend for the extension of path; a folder is read with FileBackend and anything
+            else with AccessBackend.
+
+    Returns:
+        Backend: The backend.
+    """
+
+    if isinstance(backend, Backend):
+        return backend
+    if backend is not None:
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown backend {backend!r}, expected one of {", ".join(BACKENDS)}')
+        return BACKENDS[backend](path)
+    if os.path.isdir(path):
+        return FileBackend(path)
+    extension = os.path.splitext(path)[1].lower()
+    for backend_class in BACKENDS.values():
+        if extension in backend_class.extensions:
+            return backend_class(path)
+    return AccessBackend(path)
@@ -0,0 +1,246 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Month-end batch mode: builds the report card of every range export (.accdb) in a folder.
+#   ODBC reads and pandas work hold the GIL, so the exports are processed in a pool of worker
+#   processes rather than threads. Every export logs to its own file, a failing export is
+#   recorded and skipped without stopping the others, and a summary workbook puts the
+#   completeness of every field side by side for all exports.
+#
+#   Algorithm:
+#       1. Find every .accdb file in the folder (Menu.find_accdb_files)
+#       2. Submit one job per file to a ProcessPoolExecutor with a bounded number of workers
+#       3. Each job writes {lab}_{export}_data_quality_reports.xlsx and logs to
+#          {log_dir}/{export}.log, and returns its completeness tables or its error
+#       4. Write the summary workbook (completeness per field x export, and the status of
+#          every export)
+#-------------------------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import logging
+import traceback
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from menu import Menu
+from Completeness import Completeness
+
+
+def _log_to_file(log_path):
+    # worker processes are reused between exports, so the root logger is reset for every job
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    handler = logging.FileHandler(log_path)
+    handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(message)s'))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    return handler
+
+
+def process_export(file_name, folder_path, lab_name, test_centers, log_dir, output_dir, options=None):
+    """
+    Builds the report card of one range export. Runs in a worker process; every error is caught
+    and returned so one bad export never takes down the batch.
+
+    Args:
+        file_name (str): The .accdb file.
+        folder_path (str): Folder of the .accdb file.
+        lab_name (str): Name for the report card.
+        test_centers (list): Test centers to report on.
+        log_dir (str): Folder for the per-export log file.
+        output_dir (str): Folder for the report card workbook.
+        options (dict, optional): Other Completeness constructor arguments.
+
+    Returns:
+        dict: 'file_name', 'status' ('ok' or 'failed'), 'seconds', 'log', and either 'report',
+            'lab_completeness' and 'demo_completeness' or 'error' and 'traceback'.
+    """
+
+    export = os.path.splitext(file_name)[0]
+    log_path = os.path.join(log_dir, f'{export}.log')
+    handler = _log_to_file(log_path)
+    start = time.perf_counter()
+    result = {'file_name': file_name, 'log': log_path}
+    try:
+        logging.info(f'Processing {file_name} for {lab_name} ({", ".join(test_centers)})')
+        with Completeness(
+            lab_name=lab_name,
+            file_name=file_name,
+            folder_path=folder_path,
+            test_centers=test_centers,
+            **(options or {})
+        ) as report_maker:
+            tables = report_maker.compute_report_tables()
+            report_file = report_maker.report_file_name(f'{lab_name}_{export}')
+            report = report_maker.write_report(tables, file_name=os.path.join(output_dir, report_file))
+        result.update(
+            status='ok',
+            report=report,
+            lab_completeness=tables['lab_completeness'],
+            demo_completeness=tables['demo_completeness']
+        )
+    except Exception as e:
+        logging.exception('Report card for %s failed: %s', file_name, e)
+        result.update(status='failed', error=repr(e), traceback=traceback.format_exc())
+    finally:
+        result['seconds'] = round(time.perf_counter() - start, 2)
+        logging.info(f'{file_name} finished in {result["seconds"]}s ({result["status"]})')
+        logging.getLogger().removeHandler(handler)
+        handler.close()
+    return result
+
+
+def run_batch(
+    folder_path,
+    lab_name,
+    test_centers,
+    max_workers = None,
+    log_dir = 'batch_logs',
+    output_dir = '.',
+    summary_file = None,
+    options = None
+    ):
+    """
+    Builds the report card of every .accdb file in folder_path in a pool of worker processes and
+    writes the summary workbook.
+
+    Args:
+        folder_path (str): Folder with the range exports.
+        lab_name (str): Name for the report cards.
+        test_centers (list): Test centers to report on.
+        max_workers (int, optional): Worker processes, defaults to the CPU count (never more than
+            the number of exports).
+        log_dir (str): Folder for the per-export log files.
+        output_dir (str): Folder for the report cards and the summary workbook.
+        summary_file (str, optional): Summary workbook name, defaults to
+            '{lab_name}_batch_summary.xlsx'.
+        options (dict, optional): Other Completeness constructor arguments (must be picklable).
+
+    Returns:
+        list: The result of process_export() for every export, in file name order.
+    """
+
+    files = Menu().find_accdb_files(folder_path)
+    if not files:
+        logging.warning(f'No .accdb files in {folder_path}')
+        return []
+    os.makedirs(log_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    n_workers = max(1, min(max_workers or os.cpu_count() or 1, len(files)))
+    logging.info(f'Processing {len(files)} range exports with {n_workers} worker processes')
+    results = {}
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {
+            executor.submit(
+                process_export, file_name, folder_path, lab_name, test_centers, log_dir, output_dir, options
+            ): file_name
+            for file_name in files
+        }
+        for future in as_completed(futures):
+            file_name = futures[future]
+            try:
+                results[file_name] = future.result()
+            except Exception as e:
+                # the worker process itself died (e.g. a crash in the ODBC driver)
+                logging.exception('Worker for %s stopped: %s', file_name, e)
+                results[file_name] = {'file_name': file_name, 'status': 'failed', 'error': repr(e)}
+            logging.info(f'{file_name}: {results[file_name]["status"]}')
+
+    results = [results[file_name] for file_name in files]
+    if summary_file is None:
+        summary_file = f'{lab_name}_batch_summary.xlsx'
+    write_summary(results, os.path.join(output_dir, summary_file))
+    return results
+
+
+def summary_tables(results):
+    """
+    Builds the summary tables of a batch.
+
+    Args:
+        results (list): Results of process_export().
+
+    Returns:
+        tuple: (completeness, status). completeness has one row per (Table, Field) and one
+            'Percent Complete' column per successful export; status has one row per export.
+    """
+
+    columns = {}
+    for result in results:
+        if result['status'] != 'ok':
+            continue
+        per_table = [
+            ('Lab', result['lab_completeness']),
+            ('Demographic', result['demo_completeness'])
+        ]
+        columns[result['file_name']] = pd.concat(
+            [
+                df.set_index('Fields of Interest')['Percent Complete'].rename_axis('Field')
+                for _, df in per_table
+            ],
+            keys=[table for table, _ in per_table],
+            names=['Table', 'Field']
+        )
+    completeness = pd.DataFrame(columns)
+
+    status = pd.DataFrame(
+        [
+            {
+                'File': result['file_name'],
+                'Status': result['status'],
+                'Seconds': result.get('seconds'),
+                'Report': result.get('report'),
+                'Log': result.get('log'),
+                'Error': result.get('error')
+            }
+            for result in results
+        ]
+    )
+    return completeness, status
+
+
+def write_summary(results, file_name):
+    """
+    Writes the summary workbook of a batch (see summary_tables()).
+
+    Returns:
+        str: file_name
+    """
+
+    completeness, status = summary_tables(results)
+    logging.info(f'Writing batch summary {file_name}')
+    writer = pd.ExcelWriter(file_name, engine='xlsxwriter')
+    completeness.to_excel(writer, sheet_name='Completeness')
+    status.to_excel(writer, sheet_name='Status', index=False)
+    writer.close()
+    return file_name
+
+
+def main():
+    """
+    Prompts for the folder, report name and test centers and runs the batch.
+    """
+
+    logging.basicConfig(filename='Batch_Log.log', level=logging.INFO, format='%(asctime)s:%(levelname)s:%(message)s')
+    menu = Menu()
+    folder_path = menu.get_input("Enter complete folder_path to TST range exports: ",
+                                 str,
+                                 lambda x: menu.is_valid_folder_path(x))
+    lab_name = menu.get_input("Enter name for data quality report cards: ", str)
+    test_centers = menu.get_test_centers()
+
+    results = run_batch(folder_path, lab_name, test_centers)
+    failed = [result['file_name'] for result in results if result['status'] != 'ok']
+    logging.info(f'Batch complete: {len(results) - len(failed)} ok, {len(failed)} failed {failed}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    # the exe built with auto-py-to-exe starts its pool workers through freeze_support()
+    multiprocessing.freeze_support()
+    sys.exit(main())
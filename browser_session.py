@@ -0,0 +1,210 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Reusable Chrome session for the WebCMR scraping. The driver is started once with tuned
+#   options (optionally headless, no images, no extensions, eager page loads) and kept warm
+#   for every lookup of the run. The authenticated cookies are saved to a JSON file after
+#   login, and the next run restores them and skips typing the credentials while the
+#   WebCMR session is still valid.
+#-------------------------------------------------------------------------------------------
+
+import json
+import logging
+import os
+import time
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support.wait import WebDriverWait
+
+
+class BrowserSession:
+    def __init__(
+        self,
+        url,
+        username,
+        paswrd,
+        driver_path = 'chromedriver.exe',
+        headless = False,
+        cookie_path = 'webcmr_cookies.json',
+        login_timeout = 15
+        ):
+        """
+        Args:
+            url (str): WebCMR login page.
+            username (str): WebCMR username.
+            paswrd (str): WebCMR password.
+            driver_path (str): Path to chromedriver.
+            headless (bool): Run Chrome without a window.
+            cookie_path (str, optional): JSON file the authenticated cookies are kept in between
+                runs, None turns cookie persistence off.
+            login_timeout (float): Seconds to wait for the login to go through.
+        """
+        self.url = url
+        self.username = username
+        self.paswrd = paswrd
+        self.driver_path = driver_path
+        self.headless = headless
+        self.cookie_path = cookie_path
+        self.login_timeout = login_timeout
+        self.driver = None
+        self.logins = 0
+
+    def chrome_options(self):
+        """
+        Returns:
+            webdriver.ChromeOptions: Startup options tuned for scraping text pages.
+        """
+
+        options = webdriver.ChromeOptions()
+        if self.headless:
+            options.add_argument('--headless=new')
+            options.add_argument('--window-size=1920,1080')
+        options.add_argument('--disable-extensions')
+        options.add_argument('--no-first-run')
+        # images are never read, don't download them
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+        # return as soon as the DOM is ready, multiFind waits for the elements it needs
+        options.page_load_strategy = 'eager'
+        return options
+
+    def start(self):
+        """
+        Starts Chrome if it is not running.
+
+        Returns:
+            webdriver: The running driver.
+        """
+
+        if self.driver is None:
+            logging.info('Starting connection to webdriver')
+            service = ChromeService(executable_path=self.driver_path)
+            self.driver = webdriver.Chrome(service=service, options=self.chrome_options())
+        return self.driver
+
+    def is_alive(self):
+        """
+        Returns True if the driver is running and still responds.
+        """
+
+        if self.driver is None:
+            return False
+        try:
+            self.driver.current_url
+        except WebDriverException:
+            return False
+        return True
+
+    @staticmethod
+    def on_login_page(driver):
+        return len(driver.find_elements(By.ID, 'txtUsername')) > 0
+
+    def get_driver(self):
+        """
+        Returns the warm, logged-in driver. Chrome is (re)started if it is not running, and the
+        login is only done when neither the running session nor the saved cookies are still valid.
+
+        Returns:
+            webdriver: A logged-in driver.
+        """
+
+        if not self.is_alive():
+            self.driver = None
+            self.start()
+            if self.restore_cookies():
+                logging.info('Reusing saved WebCMR session, skipping login')
+                return self.driver
+            self.login()
+        elif self.on_login_page(self.driver):
+            # the session timed out while the driver was idle
+            self.login()
+        return self.driver
+
+    def login(self):
+        """
+        Logs into WebCMR with the credentials and saves the authenticated cookies.
+
+        Returns:
+            webdriver: The logged-in driver.
+        """
+
+        driver = self.start()
+        driver.get(self.url)
+
+        logging.info('Logging into TST')
+        username = driver.find_element(By.ID, value="txtUsername")
+        username.send_keys(self.username)
+        password = driver.find_element(By.ID, value="txtPassword")
+        password.send_keys(self.paswrd)
+        password.send_keys(Keys.RETURN)
+        self.logins += 1
+
+        try:
+            WebDriverWait(driver, self.login_timeout).until(lambda d: not self.on_login_page(d))
+        except TimeoutException:
+            logging.warning('Still on the login page after logging in, not saving cookies')
+            return driver
+        self.save_cookies()
+        return driver
+
+    def save_cookies(self):
+        """
+        Writes the cookies of the current session and the page it landed on to cookie_path.
+        """
+
+        if not self.cookie_path or self.driver is None:
+            return
+        session = {'home_url': self.driver.current_url, 'cookies': self.driver.get_cookies()}
+        # the cookies authenticate as the user, keep the file private; several sessions can save 
+        # at once, so write a temporary file and swap it in
+        tmp_path = f'{self.cookie_path}.{os.getpid()}.{id(self)}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(session, f)
+        os.replace(tmp_path, self.cookie_path)
+
+    def restore_cookies(self):
+        """
+        Loads the saved cookies into the driver and checks whether they still authenticate.
+
+        Returns:
+            bool: True if the driver is logged in with the saved session.
+        """
+
+        if not self.cookie_path or not os.path.isfile(self.cookie_path):
+            return False
+        try:
+            with open(self.cookie_path) as f:
+                session = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.info('Cannot read saved WebCMR cookies: %s', e)
+            return False
+
+        now = time.time()
+        cookies = [cookie for cookie in session.get('cookies', []) if cookie.get('expiry', now + 1) > now]
+        if not cookies:
+            return False
+
+        # cookies can only be set on a page of their domain
+        self.driver.get(self.url)
+        for cookie in cookies:
+            try:
+                self.driver.add_cookie(cookie)
+            except WebDriverException as e:
+                logging.info('Skipping saved cookie %s: %s', cookie.get('name'), e)
+        self.driver.get(session.get('home_url') or self.url)
+        return not self.on_login_page(self.driver)
+
+    def quit(self):
+        """
+        Closes Chrome. The saved cookies are kept for the next run.
+        """
+
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except WebDriverException as e:
+                logging.info('Error while closing Chrome: %s', e)
+            self.driver = None
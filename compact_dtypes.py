@@ -0,0 +1,162 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Compact dtypes for loaded query results. read_sql_query hands every text column back as
+#   Python objects, several times the size of the raw data. Results are read in chunks and
+#   each chunk is converted as it is read (read_compact), so the object frame of the whole
+#   result never exists:
+#       - low-cardinality fields (State, Sex, Race, ...) to category
+#       - date fields to datetime64, only when every present value parses, so completeness
+#         never changes
+#       - the remaining text columns to Arrow-backed strings (string[pyarrow])
+#   pyarrow is optional; without it free text stays object.
+#-------------------------------------------------------------------------------------------
+
+import warnings
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def string_dtype():
+    """
+    Returns:
+        pandas.StringDtype or None: string[pyarrow], None if pyarrow is not installed.
+    """
+
+    return pd.StringDtype('pyarrow') if pyarrow is not None else None
+
+
+def parse_dates(values):
+    """
+    Parses a text column to datetime64, values that do not parse become NaT. Text dates can mix 
+    formats, so every value is parsed on its own.
+    """
+
+    with warnings.catch_warnings():
+        # pandas < 2 falls back to parsing each value, and warns about it
+        warnings.simplefilter('ignore', UserWarning)
+        if int(pd.__version__.split('.')[0]) >= 2:
+            return pd.to_datetime(values, errors='coerce', format='mixed')
+        return pd.to_datetime(values, errors='coerce')
+
+
+def memory_bytes(df):
+    """
+    Returns the memory used by df, counting the Python objects it holds.
+    """
+
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+
+def compact_frame(df, category_columns=(), date_columns=()):
+    """
+    Converts the text columns of df to compact dtypes. Columns the driver already typed (numbers,
+    dates) are left alone.
+
+    Args:
+        df (pandas.DataFrame): A freshly loaded query result, modified in place.
+        category_columns (iterable): Low-cardinality columns, stored as category.
+        date_columns (iterable): Date columns, stored as datetime64.
+
+    Returns:
+        pandas.DataFrame: df
+    """
+
+    text_dtype = string_dtype()
+    for col in df.columns:
+        values = df[col]
+        if values.dtype != object and not isinstance(values.dtype, pd.StringDtype):
+            continue
+        if col in category_columns:
+            df[col] = values.astype('category')
+        elif col in date_columns:
+            dates = parse_dates(values)
+            # a value that does not parse would turn into a missing one, keep the text then
+            if dates.isna().sum() == values.isna().sum():
+                df[col] = dates
+            elif text_dtype is not None:
+                df[col] = values.astype(text_dtype)
+        elif values.dtype == object and text_dtype is not None and \
+                pd.api.types.infer_dtype(values, skipna=True) == 'string':
+            # a column with no values at all is left alone, it may be a number column
+            df[col] = values.astype(text_dtype)
+        elif getattr(values.dtype, 'storage', None) == 'python' and text_dtype is not None:
+            # Arrow strings read back from a snapshot by older pandas
+            df[col] = values.astype(text_dtype)
+    return df
+
+
+def read_compact(chunks, category_columns=(), date_columns=()):
+    """
+    Builds one compact frame from the chunks of a query result. Each chunk is converted before 
+    the next one is read; date columns stay text until every chunk is in, so whether a date 
+    column converts is decided over the whole result, as compact_frame() does for one frame.
+
+    Args:
+        chunks (iterable): DataFrames, e.g. read_sql_query(..., chunksize=n).
+        category_columns (iterable): Low-cardinality columns, stored as category.
+        date_columns (iterable): Date columns, stored as datetime64.
+
+    Returns:
+        tuple: (DataFrame, raw_bytes), the whole result, or None if there were no chunks, and the 
+            memory the chunks used as read, before they were converted.
+    """
+
+    frames = []
+    raw_bytes = 0
+    for chunk in chunks:
+        raw_bytes += memory_bytes(chunk)
+        frames.append(compact_frame(chunk, category_columns))
+    if not frames:
+        return None, 0
+    # chunks see different categories, give them all the same ones so concat keeps category
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            categories = frames[0][col].cat.categories.append(
+                [frame[col].cat.categories for frame in frames[1:]]
+            ).unique()
+            if pd.api.types.infer_dtype(categories, skipna=True) == 'string':
+                # sorted, like the categories astype('category') picks for the whole column
+                categories = categories.sort_values()
+            for frame in frames:
+                frame[col] = frame[col].cat.set_categories(categories)
+    if len(frames) > 1:
+        align_missing_columns(frames)
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    # text left as object in a chunk (with no values there) gets its string dtype here
+    return compact_frame(df, date_columns=date_columns), raw_bytes
+
+
+def align_missing_columns(frames):
+    """
+    A column with no values in a chunk comes back from the driver as object, whatever its type in 
+    the other chunks, and concat would then turn the whole column into object. Gives such a column 
+    the dtype it has in the chunks that do have values.
+
+    Args:
+        frames (list): Chunks of one query result, modified in place.
+    """
+
+    for col in frames[0].columns:
+        empty = [frame for frame in frames if frame[col].dtype == object and frame[col].isna().all()]
+        if not empty:
+            continue
+        dtypes = [frame[col].dtype for frame in frames if frame[col].notna().any()]
+        if not dtypes:
+            continue
+        if all(pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+               for dtype in dtypes):
+            # missing values make an integer column float, as a single read would
+            dtype = dtypes[0] if len(set(dtypes)) == 1 and pd.api.types.is_float_dtype(dtypes[0]) \
+                else 'float64'
+        elif len(set(dtypes)) == 1 and (pd.api.types.is_datetime64_any_dtype(dtypes[0]) or
+                                        isinstance(dtypes[0], pd.StringDtype)):
+            dtype = dtypes[0]
+        else:
+            continue
+        for frame in empty:
+            frame[col] = frame[col].astype(dtype)
@@ -0,0 +1,110 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Owns the single database connection used by a Completeness object. Opening the .accdb
+#   over the network share is expensive, so the connection is opened lazily on first use,
+#   reused for every query, health checked before it is handed out (reconnecting if the
+#   share dropped) and closed deterministically when the owner is done with it.
+#   Connect and query times are accumulated so a run can report where the time went.
+#-------------------------------------------------------------------------------------------
+
+import logging
+import time
+from contextlib import contextmanager
+
+
+class ConnectionManager:
+    def __init__(self, connect, health_check=None):
+        """
+        Args:
+            connect (callable): Zero-argument callable returning a new DB-API connection.
+            health_check (callable, optional): Called as health_check(conn, cursor); should raise
+                if the connection is no longer usable. Defaults to opening and closing a cursor.
+        """
+        self._connect = connect
+        self._health_check = health_check or self._cursor_check
+        self.conn = None
+        self.cursor = None
+        self.timings = {'connect': 0.0, 'query': 0.0}
+        self.counts = {'connect': 0, 'query': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @staticmethod
+    def _cursor_check(conn, cursor):
+        conn.cursor().close()
+
+    def get_connection(self):
+        """
+        Returns the managed connection, connecting on first use and reconnecting if the
+        existing connection fails its health check.
+
+        Returns:
+            tuple: The connection object and its cursor.
+        """
+
+        if self.conn is not None and not self.is_healthy():
+            logging.warning('Database connection failed health check, reconnecting')
+            self.close()
+
+        if self.conn is None:
+            with self.timer('connect'):
+                self.conn = self._connect()
+                self.cursor = self.conn.cursor()
+        return self.conn, self.cursor
+
+    def is_healthy(self):
+        """
+        Returns True if there is an open connection that passes the health check.
+        """
+
+        if self.conn is None:
+            return False
+        try:
+            self._health_check(self.conn, self.cursor)
+        except Exception as e:
+            logging.info('Database health check failed: %s', e)
+            return False
+        return True
+
+    @contextmanager
+    def timer(self, kind):
+        """
+        Context manager that adds the elapsed wall-clock time of its block to timings[kind].
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[kind] = self.timings.get(kind, 0.0) + elapsed
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            logging.info('Database %s took %.2f s', kind, elapsed)
+
+    def close(self):
+        """
+        Closes the cursor and connection if they are open. Safe to call more than once.
+        """
+
+        for handle in (self.cursor, self.conn):
+            if handle is None:
+                continue
+            try:
+                handle.close()
+            except Exception as e:
+                # handle already invalid (e.g. the share went away), nothing left to release
+                logging.info('Ignoring error while closing database handle: %s', e)
+        if self.conn is not None:
+            logging.info(
+                'Closed database connection: %s connect(s) in %.2f s, %s quer(ies) in %.2f s',
+                self.counts['connect'], self.timings['connect'],
+                self.counts['query'], self.timings['query']
+            )
+        self.conn = None
+        self.cursor = None
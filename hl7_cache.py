@@ -0,0 +1,132 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Persistent cache of scraped HL7 messages keyed by accession number. Messages in the
+#   Incoming Message Monitor do not change once received, so a rerun for the same lab reads
+#   them from a local SQLite file instead of searching TST again. Entries expire after a TTL,
+#   and once the cache holds more than max_entries messages the least recently used ones are
+#   evicted. Hits and misses are counted so a run can report how much scraping it saved.
+#-------------------------------------------------------------------------------------------
+
+import logging
+import sqlite3
+import time
+
+
+class HL7Cache:
+    def __init__(self, path='hl7_cache.sqlite', ttl_seconds=30 * 24 * 3600, max_entries=10000):
+        """
+        Args:
+            path (str): SQLite file of the cache, created on first use.
+            ttl_seconds (float): Age after which a cached message is fetched again. None keeps
+                messages forever.
+            max_entries (int): Number of messages kept, least recently used ones are evicted past it.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS hl7_messages (
+                    accession_number TEXT PRIMARY KEY,
+                    hl7_text TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                '''
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _is_expired(self, fetched_at, now):
+        return self.ttl_seconds is not None and now - fetched_at > self.ttl_seconds
+
+    def get(self, acc_num):
+        """
+        Returns:
+            str or None: The cached HL7 text of the accession number, None on a miss or if the
+                entry has expired (expired entries are dropped).
+        """
+
+        conn = self._connection()
+        key = str(acc_num)
+        now = time.time()
+        row = conn.execute(
+            'SELECT hl7_text, fetched_at FROM hl7_messages WHERE accession_number = ?', (key,)
+        ).fetchone()
+        if row is None or self._is_expired(row[1], now):
+            if row is not None:
+                conn.execute('DELETE FROM hl7_messages WHERE accession_number = ?', (key,))
+                conn.commit()
+            self.misses += 1
+            return None
+
+        conn.execute('UPDATE hl7_messages SET last_used = ? WHERE accession_number = ?', (now, key))
+        conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def put(self, acc_num, hl7_text):
+        """
+        Stores the HL7 text of an accession number with the current time as its fetch time.
+        """
+
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO hl7_messages VALUES (?, ?, ?, ?)', (str(acc_num), hl7_text, now, now)
+        )
+        conn.commit()
+        self.evict()
+
+    def evict(self):
+        """
+        Drops expired messages, then the least recently used ones past max_entries.
+
+        Returns:
+            int: Number of messages removed.
+        """
+
+        conn = self._connection()
+        removed = 0
+        if self.ttl_seconds is not None:
+            removed += conn.execute(
+                'DELETE FROM hl7_messages WHERE fetched_at < ?', (time.time() - self.ttl_seconds,)
+            ).rowcount
+        removed += conn.execute(
+            '''
+            DELETE FROM hl7_messages WHERE accession_number IN (
+                SELECT accession_number FROM hl7_messages
+                ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            ''',
+            (self.max_entries,)
+        ).rowcount
+        conn.commit()
+        if removed:
+            logging.info('Evicted %s HL7 messages from %s', removed, self.path)
+        return removed
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM hl7_messages').fetchone()[0]
+
+    def clear(self):
+        """
+        Drops every cached message.
+        """
+
+        conn = self._connection()
+        conn.execute('DELETE FROM hl7_messages')
+        conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
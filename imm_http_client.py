@@ -0,0 +1,202 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Browser-free lookup backend for the Incoming Message Monitor (IMM). Instead of driving
+#   Chrome through the ASP.NET pages, one persistent HTTP session (cookie jar) logs into
+#   WebCMR once and replays the IMM search postback for every accession number, carrying the
+#   hidden ASP.NET state fields (__VIEWSTATE, __EVENTVALIDATION, ...) from page to page. The
+#   HL7 message is read from the divContentsArea element of the returned HTML.
+#
+#   The client exposes quit() like a webdriver, so WebCMR_check can treat it as a session.
+#-------------------------------------------------------------------------------------------
+
+import logging
+import urllib.parse
+import urllib.request
+from html.parser import HTMLParser
+from http.cookiejar import CookieJar
+
+# elements that start a new line in the rendered text of the contents area
+_LINE_BREAK_TAGS = {'br', 'p', 'div', 'tr', 'li', 'pre', 'table'}
+_VOID_TAGS = {'br', 'input', 'img', 'hr', 'meta', 'link'}
+
+
+class IMMHttpError(Exception):
+    """
+    Raised when the WebCMR pages do not look like the login / IMM pages the client expects.
+    """
+
+
+class _PageParser(HTMLParser):
+    """
+    Collects the first form of a page (action and input fields) and the text of one element.
+    """
+
+    def __init__(self, contents_id='divContentsArea'):
+        super().__init__(convert_charrefs=True)
+        self.contents_id = contents_id
+        self.action = None
+        self.fields = {}
+        self.submits = []
+        self.images = []
+        self.contents = None
+        self._in_form = False
+        self._form_done = False
+        self._contents_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form' and not self._form_done:
+            self._in_form = True
+            self.action = attrs.get('action', '')
+        elif tag == 'input' and self._in_form and attrs.get('name'):
+            input_type = (attrs.get('type') or 'text').lower()
+            if input_type == 'submit':
+                self.submits.append((attrs['name'], attrs.get('value', '')))
+            elif input_type == 'image':
+                self.images.append(attrs['name'])
+            elif input_type not in ('button', 'reset', 'file') and (
+                    input_type not in ('checkbox', 'radio') or 'checked' in attrs):
+                self.fields[attrs['name']] = attrs.get('value') or ''
+
+        if self._contents_depth:
+            if tag in _LINE_BREAK_TAGS:
+                self.contents.append('\n')
+            if tag not in _VOID_TAGS:
+                self._contents_depth += 1
+        elif attrs.get('id') == self.contents_id:
+            self.contents = []
+            self._contents_depth = 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if self._contents_depth and tag not in _VOID_TAGS:
+            self._contents_depth -= 1
+
+    def handle_endtag(self, tag):
+        if tag == 'form' and self._in_form:
+            self._in_form = False
+            self._form_done = True
+        if self._contents_depth and tag not in _VOID_TAGS:
+            self._contents_depth -= 1
+            if tag in _LINE_BREAK_TAGS:
+                self.contents.append('\n')
+
+    def handle_data(self, data):
+        if self._contents_depth:
+            self.contents.append(data)
+
+    def contents_text(self):
+        """
+        Returns:
+            str or None: Visible text of the contents element with one line per block, like
+                WebElement.text, or None if the page has no such element.
+        """
+
+        if self.contents is None:
+            return None
+        lines = (' '.join(line.split()) for line in ''.join(self.contents).splitlines())
+        return '\n'.join(line for line in lines if line)
+
+
+class IMMHttpClient:
+    def __init__(self, login_url, imm_url, username, paswrd, timeout=30):
+        """
+        Args:
+            login_url (str): WebCMR login page (login.aspx).
+            imm_url (str): Incoming Message Monitor page of the same WebCMR environment.
+            username (str): WebCMR username.
+            paswrd (str): WebCMR password.
+            timeout (float): Seconds to wait for each HTTP response.
+        """
+        self.login_url = login_url
+        self.imm_url = imm_url
+        self.username = username
+        self.paswrd = paswrd
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        # last IMM page, its form state is posted back with the next search
+        self._imm_page = None
+
+    def _request(self, url, fields=None):
+        data = None if fields is None else urllib.parse.urlencode(fields).encode('utf-8')
+        with self.opener.open(url, data=data, timeout=self.timeout) as response:
+            charset = response.headers.get_content_charset() or 'utf-8'
+            return response.geturl(), response.read().decode(charset, errors='replace')
+
+    def _parse(self, url, html):
+        page = _PageParser()
+        page.feed(html)
+        page.close()
+        page.url = urllib.parse.urljoin(url, page.action or '')
+        return page
+
+    def login(self):
+        """
+        Logs in with the login form, keeping the ASP.NET hidden fields and submitting with the
+        form's first submit button.
+
+        Returns:
+            IMMHttpClient: self, logged in.
+
+        Raises:
+            IMMHttpError: If the login form cannot be found or is shown again after submitting.
+        """
+
+        logging.info('Logging into WebCMR over HTTP')
+        page = self._parse(*self._request(self.login_url))
+        if 'txtUsername' not in page.fields or 'txtPassword' not in page.fields:
+            raise IMMHttpError(f'No login form at {self.login_url}')
+
+        fields = dict(page.fields, txtUsername=self.username, txtPassword=self.paswrd)
+        if page.submits:
+            name, value = page.submits[0]
+            fields[name] = value
+        response_page = self._parse(*self._request(page.url, fields))
+        if 'txtPassword' in response_page.fields:
+            raise IMMHttpError('WebCMR login was rejected')
+        self._imm_page = None
+        return self
+
+    def search(self, acc_num):
+        """
+        Replays the IMM search postback for an accession number.
+
+        Args:
+            acc_num (str): The accession number to search for.
+
+        Returns:
+            str: Text of the divContentsArea element of the result page.
+
+        Raises:
+            IMMHttpError: If the IMM page has no accession box or the result has no contents area.
+        """
+
+        if self._imm_page is None:
+            self._imm_page = self._parse(*self._request(self.imm_url))
+            if 'txtAccession' not in self._imm_page.fields:
+                raise IMMHttpError(f'No accession search box at {self.imm_url}, is the session logged in?')
+
+        # an image button posts its click coordinates instead of a value
+        fields = dict(self._imm_page.fields, txtAccession=str(acc_num))
+        fields['ibtnSearch.x'] = '1'
+        fields['ibtnSearch.y'] = '1'
+        result_page = self._parse(*self._request(self._imm_page.url, fields))
+
+        text = result_page.contents_text()
+        if text is None:
+            # landed somewhere else (e.g. session expired), start from the IMM page next time
+            self._imm_page = None
+            raise IMMHttpError(f'No divContentsArea in the IMM response for {acc_num}')
+        if 'txtAccession' in result_page.fields:
+            self._imm_page = result_page
+        return text
+
+    def quit(self):
+        """
+        Ends the session. Named like WebDriver.quit so WebCMR_check can close either kind of session.
+        """
+
+        self.cookies.clear()
+        self._imm_page = None
@@ -38,11 +38,8 @@ class Menu:
         if not os.path.isdir(path):
             return False
         
-        # Use os.listdir() to get a list of files in the directory
-        files = os.listdir(path)
-        
         # Check if there is at least one file with a .accdb extension
-        accdb_files = [f for f in files if f.endswith('.accdb')]
+        accdb_files = self.find_accdb_files(path)
         if not accdb_files:
             print("No Microsoft Access files ...")
             return False
@@ -51,6 +48,13 @@ class Menu:
         return True
 
 
+    def find_accdb_files(self, path):
+        """
+        Returns the names of every .accdb file (range export) in the folder, sorted.
+        """
+
+        return sorted(f for f in os.listdir(path) if f.endswith('.accdb'))
+
     def get_test_centers(self):
         
         test_centers : list = []
@@ -59,18 +63,12 @@ class Menu:
         no_list : tuple = ('n', 'no', 'No', 'N')
         accepted_answers : tuple = yes_list+no_list
 
-        # Main code for test centers search only is capable of doing 5 at a time 
-        # This can easily be changed in Completeness.py
-        while center_num < 5:
+        # Any number of test centers can be searched for
+        while True:
             center_num += 1
             test_center : str = self.get_input(f"Enter test_center_{center_num}: ", str)
             test_centers.append(test_center)
 
-            # telling user that we cant have more than 5 inputs
-            if center_num == 5:
-                print('No more test centers can be added')
-                break
-
             # ask users if they would like to add another test center they are searching for 
             # if they say yes, we repeat the operation, if they say no we exit
             # Exceptions are dealt with in the else portion
@@ -93,7 +91,4 @@ class Menu:
                     break
                 continue
 
-        # Cannot have more than 5 centers currently         
-        assert len(test_centers) <= 5
-
         return test_centers
\ No newline at end of file
@@ -0,0 +1,133 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Machine-readable output of the report card tables for the dashboard, instead of parsing
+#   the .xlsx. Every table is written as its own Parquet or newline-delimited JSON file in
+#   a flat, typed layout:
+#       - completeness tables as they are ('Fields of Interest', 'Percent Complete')
+#       - crosstabs in long form, one row per pair seen: (index value, column value, count),
+#         without the Total row and column
+#       - other tables with their index as the first column
+#   A manifest.json describing the run and every file is written last, so a folder with a
+#   manifest is complete.
+#
+#   pyarrow is optional; without it only the 'ndjson' format is available.
+#-------------------------------------------------------------------------------------------
+
+import json
+import logging
+import os
+import pandas as pd
+from datetime import datetime, timezone
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+FORMATS = {'parquet': '.parquet', 'ndjson': '.ndjson'}
+
+
+def is_crosstab(df):
+    """
+    Returns True for a table built by Completeness.cross_tab_from_counts().
+    """
+
+    return isinstance(df, pd.DataFrame) and ' vs ' in str(df.index.name) and 'Total' in df.columns
+
+
+def crosstab_long(df):
+    """
+    Turns a crosstab into one row per (index value, column value) pair that was seen.
+
+    Returns:
+        pandas.DataFrame: Columns '{index}', '{column}' and 'count'.
+    """
+
+    index, column = str(df.index.name).split(' vs ', 1)
+    counts = df.drop(index='Total', columns='Total', errors='ignore')
+    # the values of index are the columns of the crosstab, the values of column its rows
+    counts = counts.rename_axis(index=column, columns=index).stack().dropna()
+    long_df = counts.astype('int64').rename('count').reset_index()
+    return long_df[[index, column, 'count']]
+
+
+def metric_frame(table):
+    """
+    Returns the flat frame written for one report table.
+    """
+
+    if isinstance(table, pd.Series):
+        return table.rename_axis(table.index.name or 'label').rename('count').reset_index()
+    if is_crosstab(table):
+        return crosstab_long(table)
+    if isinstance(table.index, pd.RangeIndex):
+        return table.reset_index(drop=True)
+    return table.rename_axis(table.index.name or 'label').reset_index()
+
+
+def _typed_columns(df):
+    # Parquet needs string column names and one type per column; labels mixing text and
+    # numbers (e.g. RESULT values) are written as text
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed'):
+            df[col] = df[col].map(lambda value: value if pd.isna(value) else str(value))
+    return df
+
+
+def write_table(df, path, fmt):
+    """
+    Writes one flat frame as Parquet or newline-delimited JSON.
+    """
+
+    if fmt == 'parquet':
+        _typed_columns(df).to_parquet(path, index=False)
+    else:
+        df.to_json(path, orient='records', lines=True, date_format='iso')
+
+
+def write_metrics(tables, output_dir, fmt='parquet', run_info=None):
+    """
+    Writes every report table and the run manifest to output_dir.
+
+    Args:
+        tables (dict): {table name: DataFrame or Series}, e.g. the output of
+            Completeness.report_tables(). None entries are skipped.
+        output_dir (str): Folder for the files, created if needed.
+        fmt (str): 'parquet' or 'ndjson'.
+        run_info (dict, optional): Description of the run, stored in the manifest.
+
+    Returns:
+        str: Path of manifest.json.
+    """
+
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown metrics format {fmt!r}, expected one of {", ".join(FORMATS)}')
+    if fmt == 'parquet' and pyarrow is None:
+        raise ImportError("pyarrow is needed for the 'parquet' metrics format, use 'ndjson'")
+    os.makedirs(output_dir, exist_ok=True)
+
+    entries = []
+    for name, table in tables.items():
+        if table is None:
+            continue
+        df = metric_frame(table)
+        file_name = f'{name}{FORMATS[fmt]}'
+        write_table(df, os.path.join(output_dir, file_name), fmt)
+        entries.append({'table': name, 'file': file_name, 'rows': len(df), 'columns': [str(c) for c in df.columns]})
+
+    manifest = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'format': fmt,
+        'run': run_info or {},
+        'tables': entries
+    }
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    tmp_path = f'{manifest_path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(tmp_path, manifest_path)
+    logging.info(f'Wrote {len(entries)} metric tables as {fmt} to {output_dir}')
+    return manifest_path
@@ -0,0 +1,117 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Packed null-mask index for a loaded query frame. The frame is scanned for missing values
+#   once and the (rows x fields) boolean mask is stored as numpy bit arrays (8 rows per byte).
+#   Percent complete, the first missing row of a field and the rows where a field is blank are
+#   all answered from that one index, so completeness, threshold search and the blank
+#   reference range report never rescan the frame. The index of a subset of the rows (one
+#   lab's rows) or of a joined frame is built from the bits of the loaded frame's index
+#   (take(), from_missing()) instead of scanning the new frame.
+#-------------------------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+# number of set bits for every possible byte value
+_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+class NullMaskIndex:
+    def __init__(self, df):
+        """
+        Args:
+            df (pd.DataFrame): The frame to index. Every column is scanned once with isna().
+        """
+        self._set_missing(df.isna().to_numpy(dtype=bool), df.columns)
+
+    def _set_missing(self, missing, columns):
+        self.columns = list(columns)
+        self.n_rows = len(missing)
+        self._positions = {col: i for i, col in enumerate(self.columns)}
+
+        # (ceil(rows / 8), fields) uint8, bit set = value missing
+        self.bits = np.packbits(missing, axis=0)
+
+    @classmethod
+    def from_missing(cls, missing, columns):
+        """
+        Builds the index from a (rows x fields) boolean missing-value matrix, e.g. the columns of 
+        other indexes joined with missing_matrix().
+
+        Returns:
+            NullMaskIndex: The index, no frame is scanned.
+        """
+
+        index = cls.__new__(cls)
+        index._set_missing(np.asarray(missing, dtype=bool).reshape(len(missing), len(columns)), columns)
+        return index
+
+    def missing_matrix(self, columns=None):
+        """
+        Returns:
+            np.ndarray: The unpacked (rows x fields) missing-value matrix of columns (default all).
+        """
+
+        columns = self.columns if columns is None else list(columns)
+        column_bits = self.bits[:, [self._positions[col] for col in columns]]
+        return np.unpackbits(column_bits, axis=0, count=self.n_rows).astype(bool)
+
+    def take(self, positions):
+        """
+        Returns:
+            NullMaskIndex: The index of the rows at positions, as NullMaskIndex(df.take(positions)) 
+                would be, built from the packed bits.
+        """
+
+        return NullMaskIndex.from_missing(self.missing_matrix()[positions], self.columns)
+
+    def null_counts(self):
+        """
+        Returns:
+            pd.Series: Number of missing values per field.
+        """
+
+        counts = _POPCOUNT[self.bits].sum(axis=0, dtype=np.int64)
+        return pd.Series(counts, index=self.columns)
+
+    def non_null_counts(self):
+        """
+        Returns:
+            pd.Series: Number of present values per field.
+        """
+
+        return self.n_rows - self.null_counts()
+
+    def percent_complete(self):
+        """
+        Returns:
+            pd.Series: Percentage of present values per field (NaN if the frame has no rows).
+        """
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.non_null_counts() / self.n_rows * 100
+
+    def missing_rows(self, col):
+        """
+        Returns:
+            np.ndarray: Boolean mask over the rows, True where col is missing.
+        """
+
+        column_bits = self.bits[:, self._positions[col]]
+        return np.unpackbits(column_bits, count=self.n_rows).astype(bool)
+
+    def first_missing(self, col):
+        """
+        Returns:
+            int or None: Position of the first row where col is missing, None if it never is.
+        """
+
+        column_bits = self.bits[:, self._positions[col]]
+        nonzero_bytes = np.flatnonzero(column_bits)
+        if len(nonzero_bytes) == 0:
+            return None
+
+        # argmax over the 8 rows packed in the first byte that has a missing value
+        byte = nonzero_bytes[0]
+        return int(byte * 8 + np.unpackbits(column_bits[byte:byte + 1]).argmax())
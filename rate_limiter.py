@@ -0,0 +1,40 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Thread-safe rate limiter shared by the HL7 scraping workers of WebCMR_check. However many
+#   browser sessions are searching the Incoming Message Monitor, lookups are started at most
+#   once every min_interval seconds, so adding workers never overloads the TST environment.
+#-------------------------------------------------------------------------------------------
+
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, min_interval=1.0):
+        """
+        Args:
+            min_interval (float): Minimum number of seconds between two permits, across all
+                threads. 0 turns the limiter off.
+        """
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_permit = 0.0
+
+    def wait(self):
+        """
+        Blocks until the caller may start its next request.
+
+        Returns:
+            float: Seconds the caller waited.
+        """
+
+        # reserve the next slot under the lock, sleep outside of it so other threads can queue up
+        with self._lock:
+            now = time.monotonic()
+            permit = max(now, self._next_permit)
+            self._next_permit = permit + self.min_interval
+        delay = permit - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
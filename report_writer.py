@@ -0,0 +1,190 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   Streaming workbook writer for large report cards. pd.ExcelWriter keeps every cell of every
+#   sheet in memory until the workbook is saved, which is slow for high-cardinality crosstabs
+#   such as Result_AbFlag. This writer opens the workbook in xlsxwriter's constant_memory mode
+#   and writes each sheet row by row; a row is flushed to disk as soon as the next one starts.
+#   The sheets look like the ones pandas writes (bold, bordered header and index cells), and
+#   several tables can share a sheet side by side, as on CompletenessReport.
+#
+#   The write time and the peak memory of the process (its high-water resident set size) are
+#   logged for every sheet and kept in sheet_stats. Both are read once per sheet, so measuring
+#   costs nothing in the row loop; tracing every allocation with tracemalloc is opt-in
+#   (trace_memory), as it slows the writes down several times.
+#-------------------------------------------------------------------------------------------
+
+import ctypes
+import logging
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from itertools import zip_longest
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss_bytes():
+    """
+    Returns:
+        int or None: The peak resident set size of the process so far, None if the platform 
+            does not report it.
+    """
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+    if sys.platform == 'win32':
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ('cb', ctypes.c_ulong),
+                ('PageFaultCount', ctypes.c_ulong),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    return None
+
+
+class StreamingReportWriter:
+    def __init__(self, file_name, trace_memory=False):
+        """
+        Args:
+            file_name (str): The .xlsx workbook to write.
+            trace_memory (bool): Also trace the peak Python memory of each sheet with tracemalloc. 
+                Much slower, for profiling only.
+        """
+        self.file_name = file_name
+        self.trace_memory = trace_memory
+        self.workbook = xlsxwriter.Workbook(file_name, {'constant_memory': True, 'nan_inf_to_errors': True})
+        # same look as the header and index cells pandas writes
+        self.header_format = self.workbook.add_format(
+            {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+        )
+        self.index_format = self.workbook.add_format({'bold': True, 'border': 1, 'valign': 'top'})
+        # {sheet name: {'seconds': ..., 'peak_bytes': ...}}, plus 'traced_peak_bytes' with trace_memory
+        self.sheet_stats = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @contextmanager
+    def _measure(self, sheet_name):
+        # time and peak process memory of writing one sheet; with trace_memory tracemalloc is only 
+        # started here if nothing else is tracing, otherwise the peak is the one since that began
+        started = self.trace_memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak_bytes = peak_rss_bytes()
+            stats = {'seconds': seconds, 'peak_bytes': peak_bytes}
+            message = f'Wrote sheet {sheet_name} in {seconds:.2f} s'
+            if peak_bytes is not None:
+                message += f', process peak memory {peak_bytes / 1024 ** 2:.1f} MB'
+            if self.trace_memory:
+                stats['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                message += f", traced peak {stats['traced_peak_bytes'] / 1024 ** 2:.1f} MB"
+                if started:
+                    tracemalloc.stop()
+            self.sheet_stats[sheet_name] = stats
+            logging.info(message)
+
+    @staticmethod
+    def _cell_value(value):
+        # missing values are left blank, numpy scalars become Python values
+        if value is None or (not isinstance(value, str) and pd.isna(value)):
+            return None
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    def _write_cell(self, worksheet, row, col, value, cell_format=None):
+        value = self._cell_value(value)
+        if value is not None:
+            worksheet.write(row, col, value, cell_format)
+
+    def write_side_by_side(self, sheet_name, frames):
+        """
+        Writes frames (without their index) next to each other on one sheet with a blank column
+        between them, like to_excel with startcol.
+
+        Args:
+            sheet_name (str): The sheet.
+            frames (list): The DataFrames, left to right.
+        """
+
+        with self._measure(sheet_name):
+            worksheet = self.workbook.add_worksheet(sheet_name)
+            start_cols = []
+            col = 0
+            for df in frames:
+                start_cols.append(col)
+                col += len(df.columns) + 1
+
+            for start_col, df in zip(start_cols, frames):
+                for j, name in enumerate(df.columns):
+                    self._write_cell(worksheet, 0, start_col + j, name, self.header_format)
+            # constant_memory writes rows in order, so every frame contributes to row i before
+            # row i+1; rows are taken one at a time, the tables are never copied
+            rows = zip_longest(*(df.itertuples(index=False, name=None) for df in frames))
+            for i, frame_rows in enumerate(rows):
+                for start_col, row in zip(start_cols, frame_rows):
+                    if row is not None:
+                        for j, value in enumerate(row):
+                            self._write_cell(worksheet, i + 1, start_col + j, value)
+
+    def write_frame(self, sheet_name, df):
+        """
+        Writes df with its index on its own sheet, like to_excel.
+
+        Args:
+            sheet_name (str): The sheet.
+            df (pandas.DataFrame): The table.
+        """
+
+        with self._measure(sheet_name):
+            worksheet = self.workbook.add_worksheet(sheet_name)
+            self._write_cell(worksheet, 0, 0, df.index.name, self.header_format)
+            for j, name in enumerate(df.columns):
+                self._write_cell(worksheet, 0, j + 1, name, self.header_format)
+
+            for i, row in enumerate(df.itertuples(index=True, name=None)):
+                self._write_cell(worksheet, i + 1, 0, row[0], self.index_format)
+                for j, value in enumerate(row[1:]):
+                    self._write_cell(worksheet, i + 1, j + 1, value)
+
+    def close(self):
+        """
+        Saves the workbook.
+        """
+
+        if self.workbook is not None:
+            self.workbook.close()
+            self.workbook = None
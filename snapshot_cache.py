@@ -0,0 +1,156 @@
+#-------------------------------------------------------------------------------------------
+#
+#   Purpose:
+#   On-disk columnar snapshots of range export query results. Reading a TST_DIE_*.accdb
+#   through the Access ODBC driver is the slowest part of a run, so the first load of each
+#   query result is written as an Arrow IPC file keyed by a content hash of the .accdb and the
+#   query (which carries the test-center filter). Later runs memory-map the snapshot instead
+#   of going through ODBC. Old snapshots are evicted least-recently-used first once the
+#   directory grows past its size budget.
+#
+#   pyarrow is optional; without it the cache reports itself unavailable and every load
+#   falls through to the database.
+#-------------------------------------------------------------------------------------------
+
+import hashlib
+import logging
+import os
+
+try:
+    import pyarrow as pa
+    from pyarrow import ipc
+except ImportError:
+    pa = None
+    ipc = None
+
+
+def file_content_hash(path, chunk_size=1024 * 1024):
+    """
+    Returns the sha256 hex digest of a file's contents, read in chunks so large exports are
+    never held in memory.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SnapshotCache:
+    def __init__(self, directory='range_export_snapshots', max_bytes=1024 ** 3):
+        """
+        Args:
+            directory (str): Folder the .arrow snapshots are written to.
+            max_bytes (int): Size budget for the folder, older snapshots are evicted past it.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @property
+    def available(self):
+        return pa is not None
+
+    def key(self, file_hash, query):
+        """
+        Builds the snapshot key from the export's content hash and the whitespace-normalized query.
+        """
+
+        normalized_query = ' '.join(query.split())
+        return hashlib.sha256(f'{file_hash}\n{normalized_query}'.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.arrow')
+
+    def load(self, key):
+        """
+        Memory-maps the snapshot for key and returns it as a DataFrame, or None if there is no
+        snapshot (or it cannot be read).
+        """
+
+        path = self.path(key)
+        if not self.available or not os.path.isfile(path):
+            return None
+        try:
+            with pa.memory_map(path, 'r') as source:
+                df = ipc.open_file(source).read_all().to_pandas()
+        except (pa.ArrowException, OSError) as e:
+            logging.warning('Could not read snapshot %s, ignoring it: %s', path, e)
+            return None
+
+        # bump mtime so eviction treats this snapshot as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another process sharing the folder, the frame is already read
+            pass
+        logging.info('Loaded %s rows from snapshot %s', len(df), path)
+        return df
+
+    def save(self, key, df):
+        """
+        Writes df as an Arrow IPC snapshot for key and evicts old snapshots if the folder is over
+        budget. Frames that cannot be represented in Arrow (e.g. mixed-type object columns) are
+        skipped with a warning.
+        """
+
+        if not self.available:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        # processes sharing the folder can save the same key at once
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            table = pa.Table.from_pandas(df)
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        except (pa.ArrowException, ValueError, TypeError, OSError) as e:
+            logging.warning('Could not write snapshot %s: %s', path, e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        logging.info('Wrote %s rows to snapshot %s', len(df), path)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used snapshots until the folder fits in max_bytes. The most
+        recent snapshot is always kept, even if it alone is over budget. Several processes can
+        evict the same folder at once (see batch_runner.py), so a snapshot another one already
+        removed is skipped.
+        """
+
+        if not os.path.isdir(self.directory):
+            return
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.arrow'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                snapshots.append((stat.st_mtime, stat.st_size, name))
+        snapshots.sort()
+
+        total = sum(size for _, size, _ in snapshots)
+        while total > self.max_bytes and len(snapshots) > 1:
+            _, size, name = snapshots.pop(0)
+            total -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            logging.info('Evicted snapshot %s', name)
+
+    def clear(self):
+        """
+        Removes every snapshot in the folder.
+        """
+
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.arrow'):
+                os.remove(os.path.join(self.directory, name))
@@ -3,12 +3,20 @@ import os
 import pandas as pd
 import numpy as np
 import docx
-from WebCMR_check import WebCMR_check
+import random
+import tempfile
+import sqlite3
+import threading
+import time
+from unittest import mock
+from WebCMR_check import WebCMR_check, DateRule, StaleResultsError
+from hl7_cache import HL7Cache
+from null_mask import NullMaskIndex
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException,UnexpectedAlertPresentException
+from selenium.common.exceptions import NoSuchElementException,UnexpectedAlertPresentException,TimeoutException
 from collections import Counter
 
 
@@ -108,6 +116,412 @@ class TestWebCMRClass(unittest.TestCase):
         # testing to see the correct amount of unique examples (acc_num):
         self.assertTrue(len(np.unique(acc_nums))==3)
 
+    def test_date_violations(self):
+
+        date_df : pd.DataFrame = pd.DataFrame({
+            'SPECCOLLECTEDDATE' : ['04/05/2023', '04/06/2023', None, '04/25/2023'],
+            'SPECRECEIVEDDATE' : ['04/06/2023', '04/04/2023', '05/07/2023', '04/20/2023'],
+            'RESULTDATE' : ['04/08/2023', '04/10/2023', '05/06/2023', '04/19/2023'],
+            'DOB' : ['01/01/1990', '01/01/1990', '01/01/1990', '05/01/2023'],
+            'RESULTTEXT' : ['A', 'B', 'C', 'D'],
+            'ACCESSIONNUMBER' : [1, 2, 3, 4]
+        })
+
+        violations : pd.DataFrame = self.test_instance.date_violations(date_df)
+
+        # compact columnar table ordered by row then by rule, missing dates never flag
+        self.assertListEqual(list(violations.columns), ['rule_id', 'row', 'ACCESSIONNUMBER', 'RESULTTEXT'])
+        self.assertListEqual(list(violations['row']), [1, 2, 3, 3, 3])
+        self.assertListEqual(list(violations['rule_id']), [
+            'collect_after_receive',
+            'receive_after_result',
+            'collect_after_receive', 'receive_after_result', 'collect_after_result'
+            ])
+        self.assertListEqual(list(violations['ACCESSIONNUMBER']), [2, 3, 4, 4, 4])
+
+        # new date pairs are just another rule
+        dob_rule = DateRule('dob_after_collect', 'DOB', 'SPECCOLLECTEDDATE', 'DOB Error (w/Collect Date)')
+        dob_violations : pd.DataFrame = self.test_instance.date_violations(date_df, rules=[dob_rule])
+        self.assertListEqual(list(dob_violations['ACCESSIONNUMBER']), [4])
+
+        # text dates in different formats are all parsed, none of them is dropped as missing
+        mixed_df : pd.DataFrame = pd.DataFrame({
+            'SPECCOLLECTEDDATE' : ['04/05/2023', '2023-04-08 10:00', '4/7/2023'],
+            'SPECRECEIVEDDATE' : ['04/06/2023', '2023-04-07 09:00', '2023-04-06'],
+            'RESULTDATE' : ['2023-04-07', '04/09/2023', '4/8/2023'],
+            'RESULTTEXT' : ['A', 'B', 'C'],
+            'ACCESSIONNUMBER' : [1, 2, 3]
+        })
+        mixed_violations : pd.DataFrame = self.test_instance.date_violations(mixed_df)
+        self.assertListEqual(list(mixed_violations['row']), [1, 2])
+        self.assertListEqual(list(mixed_violations['rule_id']), ['collect_after_receive', 'collect_after_receive'])
+
+    def test_date_check_projection(self):
+        # without a dataframe the date checks only query the five lab columns they use
+        conn = sqlite3.connect(':memory:')
+        lab_df = pd.DataFrame({field: ['x', None] for field in WebCMR_check.LAB_FIELDS})
+        lab_df['SPECCOLLECTEDDATE'] = ['04/06/2023', '04/05/2023']
+        lab_df['SPECRECEIVEDDATE'] = ['04/04/2023', '04/06/2023']
+        lab_df['RESULTDATE'] = ['04/10/2023', '04/08/2023']
+        lab_df['ACCESSIONNUMBER'] = ['2', '1']
+        lab_df['HL7FILENAME'] = ['Palomar_1.hl7', 'Pomerado_2.hl7']
+        lab_df.to_sql(WebCMR_check.LAB_TABLE, conn, index=False)
+
+        self.test_instance.snapshots = None
+        with mock.patch.object(self.test_instance, 'database_connection', return_value=(conn, conn.cursor())), \
+                mock.patch('pandas.read_sql_query', wraps=pd.read_sql_query) as read_sql:
+            date_errors = self.test_instance.date_check()
+        conn.close()
+
+        query = read_sql.call_args[0][0]
+        for field in ['SPECCOLLECTEDDATE', 'SPECRECEIVEDDATE', 'RESULTDATE', 'ACCESSIONNUMBER', 'RESULTTEXT']:
+            self.assertIn(field, query)
+        self.assertNotIn('PROVIDERNAME', query)
+        self.assertListEqual([(acc_num, error[0]) for _, acc_num, error in date_errors],
+                             [('2', 'SpecCollectDate Error (w/Recieve Date)')])
+
+    def test_date_check_demographic_rule(self):
+        # a rule on a demographic date is checked on the joined table instead of being skipped
+        conn = sqlite3.connect(':memory:')
+        lab_df = pd.DataFrame({field: ['x', 'x'] for field in WebCMR_check.LAB_FIELDS})
+        lab_df['IncidentID'] = [1, 2]
+        lab_df['SPECCOLLECTEDDATE'] = ['04/06/2023', '04/05/2023']
+        lab_df['ACCESSIONNUMBER'] = ['A1', 'A2']
+        lab_df['HL7FILENAME'] = ['Palomar_1.hl7', 'Palomar_2.hl7']
+        lab_df.to_sql(WebCMR_check.LAB_TABLE, conn, index=False)
+        demo_df = pd.DataFrame({field: ['a', 'a'] for field in WebCMR_check.DEMO_FIELDS})
+        demo_df = demo_df.rename(columns={'Race': 'Reported_Race'})
+        demo_df['Incident_ID'] = [1, 2]
+        demo_df['DOB'] = ['01/01/1990', '05/01/2023']
+        demo_df['Laboratory'] = ['Palomar Medical'] * 2
+        demo_df.to_sql(WebCMR_check.DEMO_TABLE, conn, index=False)
+
+        self.test_instance.snapshots = None
+        rules = [DateRule('born_after_collect', 'DOB', 'SPECCOLLECTEDDATE', 'DOB Error (w/Collect Date)')]
+        with mock.patch.object(self.test_instance, 'database_connection', return_value=(conn, conn.cursor())), \
+                mock.patch('WebCMR_check.DATE_RULES', rules):
+            date_errors = self.test_instance.date_check()
+            self.assertListEqual(list(self.test_instance.date_violation_table()['rule_id']), ['born_after_collect'])
+        conn.close()
+        self.assertListEqual([(acc_num, error[0]) for _, acc_num, error in date_errors], [('A2', 'DOB Error (w/Collect Date)')])
+
+        # a column of neither table is an error, not a skipped rule
+        with mock.patch('WebCMR_check.DATE_RULES', [DateRule('x', 'NOT_A_FIELD', 'RESULTDATE', 'x')]):
+            with self.assertRaises(ValueError):
+                self.test_instance.date_check()
+
+    def test_stream_failing_accessions(self):
+        # the streaming mode finds the same examples as the joined lab/demographic table, lab rows 
+        # without a demographic record (incident 99) are left out of both
+        conn = sqlite3.connect(':memory:')
+        lab_df = pd.DataFrame({field: ['x'] * 8 for field in WebCMR_check.LAB_FIELDS})
+        lab_df['IncidentID'] = [99, 20, 10, 30, 99, 10, 20, 30]
+        lab_df['SPECCOLLECTEDDATE'] = ['04/05/2023', '04/05/2023'] + ['04/01/2023'] * 5 + ['04/04/2023']
+        lab_df['SPECRECEIVEDDATE'] = ['04/02/2023'] * 8
+        lab_df['RESULTDATE'] = ['04/03/2023'] * 4 + ['04/01/2023', '04/01/2023', '04/03/2023', '04/03/2023']
+        lab_df['ABNORMALFLAG'] = [None, 'H', 'L', None, 'H', 'L', None, 'H']
+        lab_df['RESULTTEXT'] = [f'RT{i}' for i in range(8)]
+        lab_df['ACCESSIONNUMBER'] = [f'A{i}' for i in range(8)]
+        lab_df['HL7FILENAME'] = [f'Palomar_{i}.hl7' for i in range(8)]
+        lab_df.to_sql(WebCMR_check.LAB_TABLE, conn, index=False)
+        demo_df = pd.DataFrame({field: ['a'] * 5 for field in WebCMR_check.DEMO_FIELDS})
+        demo_df = demo_df.rename(columns={'Race': 'Reported_Race'})
+        demo_df['Incident_ID'] = [10, 40, 30, 20, 20]
+        demo_df['Sex'] = ['F', None, None, 'M', 'M']
+        demo_df['Laboratory'] = ['Palomar Medical'] * 5
+        demo_df.to_sql(WebCMR_check.DEMO_TABLE, conn, index=False)
+
+        obj : WebCMR_check = self.test_instance
+        obj.snapshots = None
+        failing = {}
+        with mock.patch.object(obj, 'database_connection', return_value=(conn, conn.cursor())):
+            for chunksize in [None, 3]:
+                obj.chunksize = chunksize
+                obj.clear_query_cache()
+                failing[chunksize] = obj.failing_accessions()
+        conn.close()
+
+        self.assertListEqual(failing[3], failing[None])
+        self.assertListEqual(
+            [(acc_num, error if isinstance(error, str) else error[0]) for _, acc_num, error in failing[3]],
+            [
+                ('A5', 'SpecRecieveDate Error (w/Result Date)'),
+                ('A7', 'SpecCollectDate Error (w/Recieve Date)'),
+                ('A7', 'SpecCollectDate Error (w/Result Date)'),
+                # incident 20 has two demographic records
+                ('A1', 'SpecCollectDate Error (w/Recieve Date)'),
+                ('A1', 'SpecCollectDate Error (w/Result Date)'),
+                ('A1', 'SpecCollectDate Error (w/Recieve Date)'),
+                ('A1', 'SpecCollectDate Error (w/Result Date)'),
+                ('A3', 'ABNORMALFLAG'),
+                ('A3', 'Sex')
+            ]
+        )
+
+    def test_combined_null_mask(self):
+        # the joined table's mask comes from the cached query masks, not a scan of the join
+        conn = sqlite3.connect(':memory:')
+        lab_df = pd.DataFrame({field: [['x', None, 'y'][i % 3] for i in range(7)] for field in WebCMR_check.LAB_FIELDS})
+        lab_df['IncidentID'] = [20, 10, 99, 10, 30, 20, 10]
+        lab_df['HL7FILENAME'] = [f'Palomar_{i}.hl7' for i in range(7)]
+        lab_df.to_sql(WebCMR_check.LAB_TABLE, conn, index=False)
+        demo_df = pd.DataFrame({field: [['a', None][i % 2] for i in range(4)] for field in WebCMR_check.DEMO_FIELDS})
+        demo_df = demo_df.rename(columns={'Race': 'Reported_Race'})
+        demo_df['Incident_ID'] = [30, 10, 40, 10]
+        demo_df['Laboratory'] = ['Palomar Medical'] * 4
+        demo_df.to_sql(WebCMR_check.DEMO_TABLE, conn, index=False)
+
+        obj : WebCMR_check = self.test_instance
+        obj.snapshots = None
+        obj.chunksize = None
+        with mock.patch.object(obj, 'database_connection', return_value=(conn, conn.cursor())):
+            obj.clear_query_cache()
+            expected = NullMaskIndex(obj.combined_query_df())
+            obj.null_mask(obj.tstRangeQuery_demographic())
+            obj.null_mask(obj.tstRangeQuery_lab())
+            with mock.patch.object(NullMaskIndex, '__init__', side_effect=AssertionError('joined table scanned')):
+                combined_mask = obj.combined_null_mask()
+            self.assertIs(obj.combined_null_mask(), combined_mask)
+        conn.close()
+
+        self.assertListEqual(combined_mask.columns, expected.columns)
+        self.assertEqual(combined_mask.n_rows, 7)
+        np.testing.assert_array_equal(combined_mask.bits, expected.bits)
+
+    def test_scrape_hl7_order(self):
+        # four sessions pulling from one queue, results still come back in accession_search order
+        accession_search = [('RT' + str(i), i, 'field' + str(i)) for i in range(12)]
+        accession_search[3] = ('RT3', 3, ['SpecCollectDate Error (w/Recieve Date)', 'message'])
+        drivers = []
+
+        def open_session(warm=True):
+            driver = mock.Mock()
+            drivers.append((driver, warm))
+            return driver
+
+        def fetch_hl7(acc_num, result_test, driver):
+            time.sleep(random.random() / 100)
+            if acc_num == 5:
+                raise UnexpectedAlertPresentException()
+            return f'MSH|{acc_num}|{result_test}'
+
+        obj : WebCMR_check = self.test_instance
+        obj.scrape_workers = 4
+        obj.rate_limiter.min_interval = 0
+        with mock.patch.object(obj, 'open_session', side_effect=open_session), \
+                mock.patch.object(obj, 'fetch_hl7', side_effect=fetch_hl7):
+            results = obj.scrape_hl7(accession_search)
+
+        # one warm session that stays open, three extra ones closed by their workers
+        self.assertEqual(len(drivers), 4)
+        self.assertEqual(sum(warm for _, warm in drivers), 1)
+        self.assertTrue(all(driver.quit.called != warm for driver, warm in drivers))
+        # an alert only skips that accession
+        self.assertIsNone(results[5])
+        expected = [f'MSH|{i}|RT{i}' for i in range(12)]
+        expected[5] = None
+        self.assertListEqual(results, expected)
+
+    def test_worker_sessions_log_in_on_their_own(self):
+        # only the warm session restores the saved cookies, workers sharing them would share one 
+        # ASP.NET session
+        obj : WebCMR_check = self.test_instance
+        with mock.patch('WebCMR_check.BrowserSession') as session:
+            obj.open_session(warm=False)
+            obj.open_session(warm=False)
+        self.assertEqual(session.call_count, 2)
+        self.assertTrue(all(call.kwargs['cookie_path'] is None for call in session.call_args_list))
+        self.assertEqual(obj.browser.cookie_path, obj.cookie_path)
+
+    def test_acc_test_search_stays_on_imm(self):
+        # a session that starts on the home page navigates once, then only re-submits the search
+        driver = mock.Mock()
+        pages = {'imm': False, 'results': False}
+
+        def find_elements(by, element_id):
+            shown = pages['imm'] if element_id == 'txtAccession' else pages['results']
+            return [mock.Mock()] if shown else []
+
+        def nav2IMM(driver):
+            pages['imm'] = True
+
+        driver.find_elements.side_effect = find_elements
+        obj : WebCMR_check = self.test_instance
+        with mock.patch.object(obj, 'nav2IMM', side_effect=nav2IMM) as nav, \
+                mock.patch.object(obj, 'multiFind') as find, \
+                mock.patch('WebCMR_check.WebDriverWait') as wait:
+            find.return_value.click.side_effect = lambda: pages.update(results=True)
+            for acc_num in [101, 102, 103]:
+                obj.acc_test_search(acc_num=acc_num, driver=driver)
+
+        self.assertEqual(nav.call_count, 1)
+        self.assertEqual(find.return_value.click.call_count, 3)
+        # every search after the first waits for the old results to go stale
+        self.assertEqual(wait.return_value.until.call_count, 2)
+
+    def test_scrape_hl7_stale_results(self):
+        # a search whose results never refresh is retried, then skipped instead of returning the 
+        # previous accession's message
+        attempts = Counter()
+
+        def fetch_hl7(acc_num, result_test, driver):
+            attempts[acc_num] += 1
+            if acc_num == 2 or (acc_num == 3 and attempts[acc_num] == 1):
+                raise StaleResultsError(f'IMM results did not refresh after searching {acc_num}')
+            return f'MSH|{acc_num}'
+
+        obj : WebCMR_check = self.test_instance
+        obj.scrape_workers = 1
+        obj.rate_limiter.min_interval = 0
+        with mock.patch.object(obj, 'open_session', return_value=mock.Mock()), \
+                mock.patch.object(obj, 'fetch_hl7', side_effect=fetch_hl7):
+            results = obj.scrape_hl7([('RT1', 1, 'field1'), ('RT2', 2, 'field2'), ('RT3', 3, 'field3')])
+
+        self.assertListEqual(results, ['MSH|1', None, 'MSH|3'])
+        self.assertDictEqual(dict(attempts), {1: 1, 2: 2, 3: 2})
+
+        # the timeout itself surfaces from acc_test_search
+        driver = mock.Mock()
+        driver.find_elements.return_value = [mock.Mock()]
+        with mock.patch.object(obj, 'multiFind'), mock.patch('WebCMR_check.WebDriverWait') as wait:
+            wait.return_value.until.side_effect = TimeoutException()
+            with self.assertRaises(StaleResultsError):
+                obj.acc_test_search(acc_num=4, driver=driver)
+
+    def test_lookup_hl7_cache(self):
+        # a second run only scrapes what the first one could not get
+        accession_search = [('RT1', 1, 'field1'), ('RT2', 2, 'field2'), ('RT3', 3, 'field3')]
+        obj : WebCMR_check = self.test_instance
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            obj.hl7_cache = HL7Cache(os.path.join(tmp_dir, 'hl7_cache.sqlite'))
+            scraped = [[]]
+
+            def scrape_hl7(searches):
+                scraped[0] = [acc_num for _, acc_num, _ in searches]
+                return [None if acc_num == 2 else '' if acc_num == 3 and len(scraped[0]) == 3
+                        else f'MSH|{acc_num}' for acc_num in scraped[0]]
+
+            with mock.patch.object(obj, 'scrape_hl7', side_effect=scrape_hl7):
+                first = obj.lookup_hl7(accession_search)
+                self.assertListEqual(scraped[0], [1, 2, 3])
+                second = obj.lookup_hl7(accession_search)
+                # nothing came back for 2 and an empty contents area for 3, neither was cached
+                self.assertListEqual(scraped[0], [2, 3])
+            obj.hl7_cache.close()
+
+        self.assertListEqual(first, ['MSH|1', None, ''])
+        self.assertListEqual(second, ['MSH|1', None, 'MSH|3'])
+        self.assertEqual(obj.hl7_cache.hits, 1)
+
+    def test_multiFind_remembers_locator(self):
+        # the ID never matches on this page, the element shows up by XPath after a few polls
+        class FakeDriver:
+            current_url = 'https://tst/TSTWebCMR/pages/imm.aspx?x=1'
+
+            def __init__(self):
+                self.calls = []
+                self.polls_until_ready = 3
+
+            def find_elements(self, by, value):
+                self.calls.append(by)
+                if by == By.ID:
+                    self.polls_until_ready -= 1
+                    return []
+                return ['element'] if self.polls_until_ready <= 0 else []
+
+        obj : WebCMR_check = self.test_instance
+        driver = FakeDriver()
+        self.assertEqual(obj.multiFind(driver, 'txtAccession', xpath='//input'), 'element')
+        key = ('/TSTWebCMR/pages/imm.aspx', 'txtAccession')
+        self.assertGreater(obj.wait_stats[key]['wait_seconds'], 0)
+
+        # next lookup on the same page goes straight to the XPath
+        driver.calls = []
+        self.assertEqual(obj.multiFind(driver, 'txtAccession', xpath='//input'), 'element')
+        self.assertListEqual(driver.calls, [By.XPATH])
+        self.assertEqual(obj.wait_stats[key]['lookups'], 2)
+
+        with self.assertRaises(NoSuchElementException):
+            obj.multiFind(driver, 'missing', timeout=0.2)
+        self.assertEqual(obj.wait_stats[('/TSTWebCMR/pages/imm.aspx', 'missing')]['misses'], 1)
+
+    def test_lookup_hl7_dedup(self):
+        # one row breaking two date rules and a threshold field is only scraped once
+        date_error = ['SpecCollectDate Error (w/Recieve Date)', 'message']
+        accession_search = [
+            ('RT1', 1, date_error), ('RT1', 1, date_error), ('RT2', 2, date_error),
+            ('RT3', 3, 'field1'), ('RT1', 1, 'field2')
+        ]
+        obj : WebCMR_check = self.test_instance
+        obj.hl7_cache = None
+        with mock.patch.object(obj, 'scrape_hl7', side_effect=lambda searches: [
+                f'MSH|{acc_num}' for _, acc_num, _ in searches]) as scrape:
+            results = obj.lookup_hl7(accession_search)
+
+        self.assertListEqual([acc_num for _, acc_num, _ in scrape.call_args[0][0]], [1, 2, 3])
+        self.assertListEqual(results, ['MSH|1', 'MSH|1', 'MSH|2', 'MSH|3', 'MSH|1'])
+
+    def test_pipelined_run(self):
+        # login overlaps the report tables, the workbook is written while HL7 examples are scraped
+        logged_in = threading.Event()
+        scraping = threading.Event()
+        overlaps = {}
+        calls = []
+
+        def open_session(warm=True):
+            logged_in.set()
+
+        def compute_report_tables():
+            overlaps['login'] = logged_in.wait(5)
+            calls.append('tables')
+            return {'lab_completeness': pd.DataFrame()}
+
+        def write_report(tables):
+            overlaps['scraping'] = scraping.wait(5)
+            calls.append('write_report')
+
+        def hl7_report(accession_search):
+            scraping.set()
+            calls.append(('hl7_report', accession_search))
+
+        obj : WebCMR_check = self.test_instance
+        with mock.patch.object(obj, 'open_session', side_effect=open_session), \
+                mock.patch.object(obj, 'compute_report_tables', side_effect=compute_report_tables), \
+                mock.patch.object(obj, 'failing_accessions', return_value=[('RT1', 1, 'field1')]), \
+                mock.patch.object(obj, 'write_report', side_effect=write_report), \
+                mock.patch.object(obj, 'hl7_report', side_effect=hl7_report):
+            obj.pipelined_run()
+
+        self.assertDictEqual(overlaps, {'login': True, 'scraping': True})
+        self.assertListEqual(calls, ['tables', ('hl7_report', [('RT1', 1, 'field1')]), 'write_report'])
+
+    def test_pipelined_run_queries_on_main_thread(self):
+        # the metric files need the date violations, they are read before the background write
+        threads = {}
+        violations = pd.DataFrame({'rule_id': [], 'row': []})
+
+        def date_violation_table():
+            threads['query'] = threading.current_thread()
+            return violations
+
+        def write_metrics(tables, output_dir, fmt, run_info):
+            threads['write'] = threading.current_thread()
+            self.assertIs(tables['date_violations'], violations)
+
+        obj : WebCMR_check = self.test_instance
+        obj.metrics_format = 'ndjson'
+        obj.write_excel = False
+        with mock.patch.object(obj, 'open_session'), \
+                mock.patch.object(obj, 'compute_report_tables', return_value={'lab_completeness': pd.DataFrame()}), \
+                mock.patch.object(obj, 'failing_accessions', return_value=[]), \
+                mock.patch.object(obj, 'date_violation_table', side_effect=date_violation_table), \
+                mock.patch('Completeness.write_metrics', side_effect=write_metrics), \
+                mock.patch.object(obj, 'hl7_report'):
+            obj.pipelined_run()
+
+        self.assertIs(threads['query'], threading.main_thread())
+        self.assertIsNot(threads['write'], threading.main_thread())
+
     def test_threshold_search(self):
         
         # create a sample combined query dataframe for testing
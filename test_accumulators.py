@@ -0,0 +1,64 @@
+import unittest
+import pandas as pd
+import numpy as np
+from accumulators import (
+    NullCountAccumulator, PairCountAccumulator, ValueCountAccumulator, FirstMissingAccumulator,
+    count_pairs, fill_na
+)
+
+
+class TestAccumulators(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'ABNORMALFLAG': ['H', None, 'L', 'H', np.nan, 'H', 'L'],
+            'RESULT': ['POS', 'NEG', None, 'POS', 'NEG', 'NEG', None],
+            'REFERENCERANGE': [None, 'x', None, None, 'x', None, 'x'],
+            'RESULTTEXT': ['A', 'B', 'C', 'A', 'B', 'C', 'C'],
+            'ACCESSIONNUMBER': [1, 2, 3, 4, 5, 6, 7],
+        })
+        # uneven chunks, the last one has a single row
+        self.chunks = [self.df.iloc[0:3], self.df.iloc[3:6], self.df.iloc[6:]]
+
+    def fold(self, make_accumulator):
+        # folding chunk by chunk and merging per-chunk accumulators must agree
+        folded = make_accumulator()
+        for chunk in self.chunks:
+            folded.update(chunk)
+        merged = make_accumulator()
+        for chunk in self.chunks:
+            merged.merge(make_accumulator().update(chunk))
+        return folded, merged
+
+    def test_null_counts(self):
+        folded, merged = self.fold(NullCountAccumulator)
+        expected = self.df.count() / len(self.df) * 100
+        pd.testing.assert_series_equal(folded.percent_complete(), expected)
+        pd.testing.assert_series_equal(merged.percent_complete(), expected)
+        self.assertTrue(NullCountAccumulator().percent_complete().empty)
+
+    def test_pair_counts(self):
+        folded, merged = self.fold(lambda: PairCountAccumulator('ABNORMALFLAG', 'RESULT'))
+        expected = count_pairs(fill_na(self.df['ABNORMALFLAG']), fill_na(self.df['RESULT']))
+        # same counts in the same first-seen order as a single pass over the whole frame
+        self.assertListEqual(list(folded.pair_counts.items()), list(expected.items()))
+        self.assertListEqual(list(merged.pair_counts.items()), list(expected.items()))
+        self.assertEqual(expected[('N/A', 'NEG')], 2)
+
+    def test_value_counts(self):
+        folded, merged = self.fold(lambda: ValueCountAccumulator('RESULTTEXT', where_missing='REFERENCERANGE'))
+        expected = self.df.loc[self.df['REFERENCERANGE'].isna(), 'RESULTTEXT'].value_counts()
+        self.assertDictEqual(folded.value_counts().to_dict(), expected.to_dict())
+        self.assertListEqual(list(merged.value_counts().index), ['A', 'C'])
+
+    def test_first_missing(self):
+        folded, merged = self.fold(
+            lambda: FirstMissingAccumulator(['ABNORMALFLAG', 'RESULT', 'RESULTTEXT'], ['RESULTTEXT', 'ACCESSIONNUMBER'])
+        )
+        for accumulator in (folded, merged):
+            self.assertNotIn('RESULTTEXT', accumulator.examples)
+            self.assertEqual(accumulator.examples['ABNORMALFLAG']['ACCESSIONNUMBER'], 2)
+            self.assertEqual(accumulator.examples['RESULT']['ACCESSIONNUMBER'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from Completeness import Completeness
+from aggregate_store import AggregateStore
+from compact_dtypes import parse_dates
+
+
+class TestAggregateStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'aggregate_store.sqlite')
+        self.report_maker = Completeness(
+            lab_name='NameForFile',
+            file_name='export.accdb',
+            folder_path='.',
+            test_centers=['Palomar', 'Pomerado'],
+            snapshot_dir=None
+        )
+
+        # every raw record of the period, exports are overlapping slices of it
+        n = 10
+        lab_df = pd.DataFrame({field: [['x', None, 'y'][i % 3] for i in range(n)] for field in Completeness.LAB_FIELDS})
+        lab_df['ACCESSIONNUMBER'] = [f'A{i}' for i in range(n)]
+        lab_df['IncidentID'] = [f'I{i // 2}' for i in range(n)]
+        lab_df['ABNORMALFLAG'] = ['H', None, 'L', 'H', 'L', None, 'H', 'H', 'L', 'H']
+        lab_df['RESULT'] = ['POS', 'NEG', None, 'POS', 'NEG', 'NEG', None, 'POS', 'POS', 'NEG']
+        lab_df['RESULTTEXT'] = ['A', 'B', 'A', 'C', 'B', 'A', 'C', 'C', 'B', 'A']
+        lab_df['REFERENCERANGE'] = [None, 'r', None, None, 'r', None, 'r', None, None, 'r']
+        lab_df['SPECCOLLECTEDDATE'] = ['2023-04-20'] * 4 + ['2023-04-21'] * 6
+        lab_df['SPECRECEIVEDDATE'] = ['2023-04-19', '2023-04-21'] * 5
+        lab_df['HL7FILENAME'] = [f'{center}_{i}.hl7' for i, center in enumerate(['Palomar', 'Pomerado'] * 5)]
+        self.lab_df = self.report_maker.attribute_test_centers(lab_df)
+
+        demo_df = pd.DataFrame({field: [['a', 'b', None][i % 3] for i in range(5)] for field in Completeness.DEMO_FIELDS})
+        demo_df['Incident_ID'] = [f'I{i}' for i in range(5)]
+        demo_df['Ethnicity'] = ['Hispanic', None, 'Not Hispanic', 'Hispanic', None]
+        demo_df['Laboratory'] = ['Palomar Medical', 'Pomerado', 'Palomar Medical', 'Pomerado', 'Palomar Medical']
+        self.demo_df = self.report_maker.attribute_test_centers(demo_df)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def export(self, lab_rows, incidents):
+        lab_df = self.lab_df.iloc[lab_rows].reset_index(drop=True)
+        demo_df = self.demo_df.iloc[incidents].reset_index(drop=True)
+        return demo_df, lab_df
+
+    def ingest(self, store, demo_df, lab_df):
+        collected = parse_dates(lab_df['SPECCOLLECTEDDATE'])
+        received = parse_dates(lab_df['SPECRECEIVEDDATE'])
+        violations = pd.DataFrame({
+            'rule_id': 'collect_after_receive',
+            'row': np.flatnonzero((collected > received).to_numpy())
+        })
+        return store.ingest_export(
+            demo_df,
+            lab_df,
+            self.report_maker.report_fields(demo_df.columns),
+            self.report_maker.report_fields(lab_df.columns),
+            date_violations=violations
+        )
+
+    def assertTablesEqual(self, tables, expected):
+        for name in ['demo_completeness', 'lab_completeness']:
+            pd.testing.assert_frame_equal(tables[name], expected[name], check_dtype=False)
+        for name in ['race_ethnicity', 'resulted_organism_abflag', 'result_abflag']:
+            # stored pairs are first seen per day and center, so only the content is compared
+            pd.testing.assert_frame_equal(
+                tables[name].sort_index().sort_index(axis=1),
+                expected[name].sort_index().sort_index(axis=1),
+                check_dtype=False
+            )
+        self.assertDictEqual(
+            tables['blank_reference_range']['Frequency'].to_dict(),
+            expected['blank_reference_range']['Frequency'].to_dict()
+        )
+
+    def test_incremental_exports(self):
+        store = AggregateStore(self.path)
+        self.assertDictEqual(self.ingest(store, *self.export(range(0, 6), [0, 1, 2])), {'lab': 6, 'demo': 3})
+        # the second export overlaps the first one, only its new records are added
+        self.assertDictEqual(self.ingest(store, *self.export(range(3, 10), [1, 2, 3, 4])), {'lab': 4, 'demo': 2})
+        store.close()
+
+        # the store persists, and an export that was already seen adds nothing
+        store = AggregateStore(self.path)
+        self.assertDictEqual(self.ingest(store, *self.export(range(3, 10), [1, 2, 3, 4])), {'lab': 0, 'demo': 0})
+
+        # merging the stored aggregates gives the report card of every record at once
+        tables = self.report_maker.window_report_tables(store)
+        expected = self.report_maker.frame_report_tables(self.demo_df, self.lab_df)
+        self.assertTablesEqual(tables, expected)
+        self.assertDictEqual(tables['date_violations'].to_dict(), {'collect_after_receive': 5})
+        store.close()
+
+    def test_window(self):
+        store = AggregateStore(self.path)
+        self.ingest(store, *self.export(range(0, 6), [0, 1, 2]))
+        self.ingest(store, *self.export(range(3, 10), [1, 2, 3, 4]))
+
+        # one collection day and one center
+        tables = self.report_maker.window_report_tables(
+            store, start_day='2023-04-21', end_day='2023-04-21', test_centers=['Palomar']
+        )
+        lab_rows = (self.lab_df['SPECCOLLECTEDDATE'] == '2023-04-21') & (self.lab_df['test_center'] == 'Palomar')
+        # incidents I2..I4 are first collected on the 21st, the demographic record keeps its own center
+        demo_rows = self.demo_df['Incident_ID'].isin(['I2', 'I3', 'I4']) & (self.demo_df['test_center'] == 'Palomar')
+        expected = self.report_maker.frame_report_tables(self.demo_df[demo_rows], self.lab_df[lab_rows])
+        self.assertTablesEqual(tables, expected)
+        self.assertDictEqual(tables['date_violations'].to_dict(), {'collect_after_receive': 3})
+        store.close()
+
+    def test_new_result_for_seen_accession(self):
+        # a result added to an accession after it was first exported is still counted
+        store = AggregateStore(self.path)
+        demo_df, lab_df = self.export(range(0, 4), [0, 1])
+        self.assertEqual(self.ingest(store, demo_df, lab_df)['lab'], 4)
+        added = lab_df.iloc[[2]].assign(RESULTTEXT='D')
+        self.assertEqual(self.ingest(store, demo_df, pd.concat([lab_df, added], ignore_index=True))['lab'], 1)
+        tables = self.report_maker.window_report_tables(store)
+        self.assertEqual(tables['blank_reference_range']['Frequency'].to_dict(), {'A': 2, 'C': 1, 'D': 1})
+        store.close()
+
+    def test_mixed_date_formats(self):
+        # collection dates written differently still land on their day
+        store = AggregateStore(self.path)
+        demo_df, lab_df = self.export(range(0, 4), [0, 1])
+        lab_df['SPECCOLLECTEDDATE'] = ['2023-04-20', '04/20/2023', '4/21/2023', '2023-04-21 10:00']
+        self.ingest(store, demo_df, lab_df)
+        tables = self.report_maker.window_report_tables(store, start_day='2023-04-21', end_day='2023-04-21')
+        self.assertEqual(tables['result_abflag'].loc['Total', 'Total'], 2)
+        store.close()
+
+    def test_missing_record_keys(self):
+        # rows without an accession number are recognised by their content
+        store = AggregateStore(self.path)
+        demo_df, lab_df = self.export(range(0, 4), [0, 1])
+        lab_df.loc[1, 'ACCESSIONNUMBER'] = None
+        self.assertEqual(self.ingest(store, demo_df, lab_df)['lab'], 4)
+        self.assertEqual(self.ingest(store, demo_df, lab_df)['lab'], 0)
+        lab_df.loc[1, 'RESULTTEXT'] = 'Z'
+        self.assertEqual(self.ingest(store, demo_df, lab_df)['lab'], 1)
+        store.close()
+
+    def test_chunked_update(self):
+        # update_aggregate_store streams the export in chunks and stores the same aggregates
+        conn = sqlite3.connect(':memory:')
+        self.lab_df.drop(columns=['test_center']).to_sql(Completeness.LAB_TABLE, conn, index=False)
+        demo_df = self.demo_df.drop(columns=['test_center']).rename(columns={'Race': 'Reported_Race'})
+        demo_df.to_sql(Completeness.DEMO_TABLE, conn, index=False)
+        self.report_maker.chunksize = 3
+
+        store = AggregateStore(self.path)
+        with mock.patch.object(self.report_maker, 'database_connection', return_value=(conn, conn.cursor())), \
+                mock.patch.object(self.report_maker, 'query_chunks', wraps=self.report_maker.query_chunks) as chunks:
+            self.assertDictEqual(self.report_maker.update_aggregate_store(store), {'lab': 10, 'demo': 5})
+            self.assertDictEqual(self.report_maker.update_aggregate_store(store), {'lab': 0, 'demo': 0})
+        conn.close()
+        self.assertEqual(chunks.call_count, 4)
+
+        tables = self.report_maker.window_report_tables(store)
+        expected = self.report_maker.frame_report_tables(self.demo_df, self.lab_df)
+        self.assertTablesEqual(tables, expected)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
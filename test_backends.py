@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+import backends
+from backends import AccessBackend, DuckDBBackend, FileBackend, SQLiteBackend, backend_for
+from Completeness import Completeness
+from snapshot_cache import pa
+
+
+class TestBackends(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        n = 6
+        self.lab_df = pd.DataFrame({field: [['x', None, 'y'][i % 3] for i in range(n)] for field in Completeness.LAB_FIELDS})
+        self.lab_df['ABNORMALFLAG'] = ['H', None, 'L', 'H', 'L', None]
+        self.lab_df['RESULT'] = ['POS', 'NEG', None, 'POS', 'NEG', 'NEG']
+        self.lab_df['RESULTTEXT'] = ['A', 'B', 'A', 'C', 'B', 'A']
+        self.lab_df['HL7FILENAME'] = ['Palomar_1.hl7', 'pomerado_2.hl7', 'Other_3.hl7', 'PALOMAR_4.hl7', 'Palomar_5.hl7', 'x.hl7']
+        self.demo_df = pd.DataFrame({field: ['a', 'b', None, 'a'] for field in Completeness.DEMO_FIELDS})
+        self.demo_df = self.demo_df.rename(columns={'Race': 'Reported_Race'})
+        self.demo_df['Laboratory'] = ['Palomar Medical', 'Pomerado', 'Other', 'palomar']
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def report_tables(self, file_name, backend=None):
+        with Completeness(
+            lab_name='NameForFile',
+            file_name=file_name,
+            folder_path=self.tmp_dir.name,
+            test_centers=['Palomar', 'Pomerado'],
+            snapshot_dir=None,
+            backend=backend
+        ) as report_maker:
+            return report_maker.report_tables()
+
+    def expected_tables(self):
+        conn = sqlite3.connect(':memory:')
+        self.lab_df.to_sql(Completeness.LAB_TABLE, conn, index=False)
+        self.demo_df.to_sql(Completeness.DEMO_TABLE, conn, index=False)
+        report_maker = Completeness(
+            lab_name='NameForFile', file_name='export.accdb', folder_path='.',
+            test_centers=['Palomar', 'Pomerado'], snapshot_dir=None
+        )
+        with mock.patch.object(report_maker, 'database_connection', return_value=(conn, conn.cursor())):
+            tables = report_maker.report_tables()
+        conn.close()
+        return tables
+
+    def assertTablesEqual(self, tables, expected):
+        self.assertListEqual(list(tables), list(expected))
+        for name in expected:
+            pd.testing.assert_frame_equal(tables[name], expected[name], check_dtype=False, check_names=False)
+
+    def test_translate(self):
+        query = 'SELECT ACCESSIONNUMBER FROM [Laboratory Information (system)] WHERE HL7FILENAME LIKE \'%a%\''
+        self.assertEqual(AccessBackend('x.accdb').translate(query), query)
+        self.assertEqual(
+            SQLiteBackend('x.sqlite').translate(query),
+            'SELECT ACCESSIONNUMBER FROM "Laboratory Information (system)" WHERE HL7FILENAME LIKE \'%a%\''
+        )
+        self.assertEqual(
+            DuckDBBackend('x.duckdb').translate(query),
+            'SELECT ACCESSIONNUMBER FROM "Laboratory Information (system)" WHERE HL7FILENAME ILIKE \'%a%\''
+        )
+
+    def test_backend_for(self):
+        self.assertIsInstance(backend_for('TST_DIE.accdb'), AccessBackend)
+        self.assertIsInstance(backend_for('export.SQLITE'), SQLiteBackend)
+        self.assertIsInstance(backend_for('export.duckdb'), DuckDBBackend)
+        self.assertIsInstance(backend_for('export.csv'), FileBackend)
+        self.assertIsInstance(backend_for(self.tmp_dir.name), FileBackend)
+        self.assertIsInstance(backend_for('export.accdb', 'sqlite'), SQLiteBackend)
+        backend = SQLiteBackend('other.sqlite')
+        self.assertIs(backend_for('export.accdb', backend), backend)
+        with self.assertRaises(ValueError):
+            backend_for('export.accdb', 'oracle')
+
+    def test_incomplete_backend(self):
+        # a backend without connect() fails when it is built, not on its first query
+        class NoConnectBackend(backends.Backend):
+            extensions = ('.none',)
+
+        with self.assertRaises(TypeError):
+            NoConnectBackend('export.none')
+
+    def test_access_without_pyodbc(self):
+        with mock.patch.object(backends, 'pyodbc', None):
+            with self.assertRaises(ImportError):
+                AccessBackend('x.accdb').connect()
+
+    def test_sqlite_backend(self):
+        conn = sqlite3.connect(os.path.join(self.tmp_dir.name, 'export.sqlite'))
+        self.lab_df.to_sql(Completeness.LAB_TABLE, conn, index=False)
+        self.demo_df.to_sql(Completeness.DEMO_TABLE, conn, index=False)
+        conn.close()
+        self.assertTablesEqual(self.report_tables('export.sqlite'), self.expected_tables())
+
+    def test_csv_backend(self):
+        export_dir = os.path.join(self.tmp_dir.name, 'export')
+        os.mkdir(export_dir)
+        self.lab_df.to_csv(os.path.join(export_dir, f'{Completeness.LAB_TABLE}.csv'), index=False)
+        self.demo_df.to_csv(os.path.join(export_dir, f'{Completeness.DEMO_TABLE}.csv'), index=False)
+        self.assertTablesEqual(self.report_tables('export'), self.expected_tables())
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_parquet_backend(self):
+        export_dir = os.path.join(self.tmp_dir.name, 'export')
+        os.mkdir(export_dir)
+        self.lab_df.to_parquet(os.path.join(export_dir, f'{Completeness.LAB_TABLE}.parquet'), index=False)
+        self.demo_df.to_parquet(os.path.join(export_dir, f'{Completeness.DEMO_TABLE}.parquet'), index=False)
+        self.assertTablesEqual(self.report_tables('export', backend='files'), self.expected_tables())
+
+    @unittest.skipIf(backends.duckdb is None, 'duckdb is not installed')
+    def test_duckdb_backend(self):
+        conn = backends.duckdb.connect(os.path.join(self.tmp_dir.name, 'export.duckdb'))
+        for table, df in [(Completeness.LAB_TABLE, self.lab_df), (Completeness.DEMO_TABLE, self.demo_df)]:
+            conn.register('frame', df)
+            conn.execute(f'CREATE TABLE "{table}" AS SELECT * FROM frame')
+            conn.unregister('frame')
+        conn.close()
+        self.assertTablesEqual(self.report_tables('export.duckdb'), self.expected_tables())
+
+
+if __name__ == '__main__':
+    unittest.main()
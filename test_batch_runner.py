@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from Completeness import Completeness
+from batch_runner import process_export, run_batch, summary_tables
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.folder = self.tmp_dir.name
+        self.log_dir = os.path.join(self.folder, 'logs')
+        self.output_dir = os.path.join(self.folder, 'out')
+        os.makedirs(self.log_dir)
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_failures_are_isolated(self):
+        # neither file is a readable export, both fail without stopping the batch
+        for name in ['TST_DIE_1.accdb', 'TST_DIE_2.accdb', 'notes.txt']:
+            with open(os.path.join(self.folder, name), 'wb') as f:
+                f.write(b'not an access database')
+
+        results = run_batch(
+            self.folder, 'Palomar', ['Palomar'], max_workers=2,
+            log_dir=self.log_dir, output_dir=self.output_dir, options={'snapshot_dir': None}
+        )
+        self.assertListEqual([result['file_name'] for result in results], ['TST_DIE_1.accdb', 'TST_DIE_2.accdb'])
+        self.assertTrue(all(result['status'] == 'failed' for result in results))
+        self.assertTrue(os.path.isfile(os.path.join(self.log_dir, 'TST_DIE_1.log')))
+
+        status = pd.read_excel(os.path.join(self.output_dir, 'Palomar_batch_summary.xlsx'), sheet_name='Status')
+        self.assertListEqual(list(status['Status']), ['failed', 'failed'])
+
+    def test_process_export_and_summary(self):
+        conn = sqlite3.connect(':memory:')
+        lab_df = pd.DataFrame({field: ['x', None] for field in Completeness.LAB_FIELDS})
+        lab_df['HL7FILENAME'] = ['Palomar_1.hl7', 'Palomar_2.hl7']
+        lab_df.to_sql(Completeness.LAB_TABLE, conn, index=False)
+        demo_df = pd.DataFrame({field: ['a', 'b'] for field in Completeness.DEMO_FIELDS})
+        demo_df = demo_df.rename(columns={'Race': 'Reported_Race'})
+        demo_df['Laboratory'] = ['Palomar', 'Palomar']
+        demo_df.to_sql(Completeness.DEMO_TABLE, conn, index=False)
+
+        with mock.patch.object(Completeness, 'database_connection', return_value=(conn, conn.cursor())):
+            ok = process_export(
+                'TST_DIE_1.accdb', self.folder, 'Palomar', ['Palomar'], self.log_dir, self.output_dir,
+                options={'snapshot_dir': None}
+            )
+        conn.close()
+        self.assertEqual(ok['status'], 'ok', ok.get('traceback'))
+        self.assertTrue(os.path.isfile(ok['report']))
+        self.assertEqual(os.path.basename(ok['report']), 'Palomar_TST_DIE_1_data_quality_reports.xlsx')
+
+        failed = {'file_name': 'TST_DIE_2.accdb', 'status': 'failed', 'error': 'Error()'}
+        completeness, status = summary_tables([ok, failed])
+        self.assertListEqual(list(completeness.columns), ['TST_DIE_1.accdb'])
+        self.assertEqual(completeness.loc[('Lab', 'RESULT'), 'TST_DIE_1.accdb'], 50.0)
+        self.assertEqual(completeness.loc[('Demographic', 'Race'), 'TST_DIE_1.accdb'], 100.0)
+        self.assertListEqual(list(status['Status']), ['ok', 'failed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
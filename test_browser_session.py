@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from browser_session import BrowserSession
+
+
+class FakeDriver:
+    """
+    Stand-in for a Chrome webdriver: the login page is shown until a login or a valid session
+    cookie.
+    """
+
+    def __init__(self):
+        self.current_url = 'about:blank'
+        self.cookies = []
+        self.logged_in = False
+        self.quit_called = False
+
+    def get(self, url):
+        self.current_url = url
+        if any(cookie['name'] == 'session' and cookie['value'] == 'valid' for cookie in self.cookies):
+            self.logged_in = True
+
+    def find_elements(self, by, value):
+        return [] if self.logged_in else [mock.Mock()]
+
+    def find_element(self, by, value):
+        element = mock.Mock()
+        if value == 'txtPassword':
+            element.send_keys.side_effect = self._submit
+        return element
+
+    def _submit(self, keys):
+        # typing the password does nothing, RETURN submits the form
+        if keys != 'secret':
+            self.logged_in = True
+            self.current_url = 'https://tst/pages/home.aspx'
+            self.cookies = [{'name': 'session', 'value': 'valid', 'expiry': time.time() + 3600}]
+
+    def get_cookies(self):
+        return list(self.cookies)
+
+    def add_cookie(self, cookie):
+        self.cookies.append(cookie)
+
+    def quit(self):
+        self.quit_called = True
+
+
+class TestBrowserSession(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cookie_path = os.path.join(self.tmp_dir.name, 'cookies.json')
+        self.drivers = []
+
+        def chrome(service, options):
+            driver = FakeDriver()
+            self.drivers.append(driver)
+            return driver
+
+        patcher = mock.patch('browser_session.webdriver.Chrome', side_effect=chrome)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('browser_session.ChromeService')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def session(self):
+        return BrowserSession('https://tst/login.aspx', 'user', 'secret', headless=True, cookie_path=self.cookie_path)
+
+    def test_chrome_options(self):
+        options = self.session().chrome_options()
+        self.assertIn('--headless=new', options.arguments)
+        self.assertIn('--disable-extensions', options.arguments)
+        self.assertEqual(options.page_load_strategy, 'eager')
+        self.assertEqual(options.experimental_options['prefs']['profile.managed_default_content_settings.images'], 2)
+
+    def test_warm_driver_and_cookie_reuse(self):
+        first_run = self.session()
+        driver = first_run.get_driver()
+        # the warm driver is handed out again without another login
+        self.assertIs(first_run.get_driver(), driver)
+        self.assertEqual(first_run.logins, 1)
+        first_run.quit()
+        self.assertTrue(driver.quit_called)
+        with open(self.cookie_path) as f:
+            self.assertEqual(json.load(f)['home_url'], 'https://tst/pages/home.aspx')
+
+        # next run restores the cookies and skips the login
+        second_run = self.session()
+        second_run.get_driver()
+        self.assertEqual(second_run.logins, 0)
+        self.assertEqual(len(self.drivers), 2)
+
+    def test_expired_cookies_log_in_again(self):
+        with open(self.cookie_path, 'w') as f:
+            json.dump({'home_url': 'https://tst/pages/home.aspx',
+                       'cookies': [{'name': 'session', 'value': 'valid', 'expiry': time.time() - 10}]}, f)
+        session = self.session()
+        session.get_driver()
+        self.assertEqual(session.logins, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
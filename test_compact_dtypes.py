@@ -0,0 +1,106 @@
+import sqlite3
+import unittest
+from unittest import mock
+import pandas as pd
+from compact_dtypes import compact_frame, read_compact, string_dtype
+from Completeness import Completeness
+
+
+class TestCompactDtypes(unittest.TestCase):
+    def test_compact_frame(self):
+        df = pd.DataFrame({
+            'Sex': ['F', 'M', None, 'F'],
+            'SPECCOLLECTEDDATE': ['2023-04-20', None, '2023-04-21 10:30', '04/22/2023'],
+            'RESULTDATE': ['2023-04-20', 'not a date', None, '2023-04-22'],
+            'RESULTTEXT': ['A', None, 'B', 'C'],
+            'IncidentID': [1, 2, 3, 4]
+        })
+        compact_frame(df, category_columns=['Sex'], date_columns=['SPECCOLLECTEDDATE', 'RESULTDATE'])
+
+        self.assertIsInstance(df['Sex'].dtype, pd.CategoricalDtype)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df['SPECCOLLECTEDDATE']))
+        self.assertEqual(df['SPECCOLLECTEDDATE'].iloc[3], pd.Timestamp('2023-04-22'))
+        # a value that does not parse keeps the column as text, nothing turns missing
+        self.assertFalse(pd.api.types.is_datetime64_any_dtype(df['RESULTDATE']))
+        self.assertEqual(df['RESULTDATE'].iloc[1], 'not a date')
+        if string_dtype() is not None:
+            # newer pandas already builds the frame with its own Arrow string dtype
+            self.assertIsInstance(df['RESULTTEXT'].dtype, pd.StringDtype)
+        self.assertTrue(pd.api.types.is_integer_dtype(df['IncidentID']))
+        self.assertListEqual(list(df.isna().sum()), [1, 1, 1, 1, 0])
+
+    def test_read_compact(self):
+        # chunks are compacted one at a time and come out as one frame with the same values
+        df = pd.DataFrame({
+            'Sex': ['F', 'M', None, 'X', 'F'],
+            'SPECCOLLECTEDDATE': ['2023-04-20', None, '04/21/2023', '2023-04-22 10:00', '2023-04-23'],
+            'RESULTDATE': ['2023-04-20', '2023-04-21', '2023-04-22', 'not a date', None],
+            'RESULTTEXT': ['A', None, 'B', 'C', 'D']
+        })
+        chunks = [df.iloc[i:i + 2].copy() for i in range(0, len(df), 2)]
+        with mock.patch('compact_dtypes.compact_frame', wraps=compact_frame) as compact:
+            read, raw_bytes = read_compact(iter(chunks), category_columns=['Sex'], date_columns=['SPECCOLLECTEDDATE', 'RESULTDATE'])
+        self.assertEqual(compact.call_count, len(chunks) + 1)
+
+        self.assertIsInstance(read['Sex'].dtype, pd.CategoricalDtype)
+        self.assertListEqual(sorted(read['Sex'].cat.categories), ['F', 'M', 'X'])
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(read['SPECCOLLECTEDDATE']))
+        # 'not a date' is in the second chunk, the column stays text in every row
+        self.assertFalse(pd.api.types.is_datetime64_any_dtype(read['RESULTDATE']))
+        self.assertEqual(read['RESULTDATE'].iloc[0], '2023-04-20')
+        self.assertListEqual(list(read.isna().sum()), [1, 1, 1, 1])
+        self.assertGreater(raw_bytes, 0)
+        self.assertEqual(read_compact(iter([])), (None, 0))
+
+    def test_report_tables_unchanged(self):
+        # the report card is the same with compact dtypes, crosstabs over categoricals included
+        conn = sqlite3.connect(':memory:')
+        lab_df = pd.DataFrame({field: ['x', None, 'y', None, 'x'] for field in Completeness.LAB_FIELDS})
+        lab_df['ABNORMALFLAG'] = ['H', None, 'L', 'H', None]
+        lab_df['RESULT'] = ['POS', 'NEG', None, 'POS', 'NEG']
+        lab_df['RESULTTEXT'] = ['A', 'B', 'A', 'C', 'B']
+        lab_df['SPECCOLLECTEDDATE'] = ['2023-04-20', None, '2023-04-21', '2023-04-21', None]
+        lab_df['HL7FILENAME'] = ['Palomar_1.hl7', 'Pomerado_2.hl7', 'Palomar_3.hl7', 'Palomar_4.hl7', 'Other_5.hl7']
+        lab_df.to_sql(Completeness.LAB_TABLE, conn, index=False)
+        demo_df = pd.DataFrame({field: ['a', 'b', None] for field in Completeness.DEMO_FIELDS})
+        demo_df = demo_df.rename(columns={'Race': 'Reported_Race'})
+        demo_df['Laboratory'] = ['Palomar Medical', 'Pomerado', 'Palomar Medical']
+        demo_df.to_sql(Completeness.DEMO_TABLE, conn, index=False)
+
+        tables = {}
+        for compact in [True, False]:
+            report_maker = Completeness(
+                lab_name='NameForFile', file_name='export.accdb', folder_path='.',
+                test_centers=['Palomar', 'Pomerado'], snapshot_dir=None, compact_dtypes=compact
+            )
+            with mock.patch.object(report_maker, 'database_connection', return_value=(conn, conn.cursor())):
+                tables[compact] = report_maker.report_tables()
+                lab_query_df = report_maker.query_df(report_maker.tstRangeQuery_lab())
+                self.assertEqual(isinstance(lab_query_df['ABNORMALFLAG'].dtype, pd.CategoricalDtype), compact)
+                self.assertListEqual(list(lab_query_df['test_center'].fillna('-')), ['Palomar', 'Pomerado', 'Palomar', 'Palomar'])
+        conn.close()
+
+        for name in tables[False]:
+            pd.testing.assert_frame_equal(tables[True][name], tables[False][name], check_names=False)
+
+    def test_read_compact_empty_chunk(self):
+        # a number column with no values in one chunk keeps its number dtype, so merges on it work
+        conn = sqlite3.connect(':memory:')
+        pd.DataFrame({
+            'IncidentID': [1.0, 2.0, None, None],
+            'RESULTTEXT': ['A', 'B', None, None]
+        }).to_sql('lab', conn, index=False)
+        chunks = pd.read_sql_query('SELECT * FROM lab', conn, chunksize=2)
+        read, _ = read_compact(chunks)
+        conn.close()
+
+        self.assertTrue(pd.api.types.is_float_dtype(read['IncidentID']))
+        if string_dtype() is not None:
+            self.assertIsInstance(read['RESULTTEXT'].dtype, pd.StringDtype)
+        self.assertListEqual(list(read.isna().sum()), [2, 2])
+        merged = pd.merge(pd.DataFrame({'IncidentID': [1.0, 2.0]}), read, on='IncidentID')
+        self.assertEqual(len(merged), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
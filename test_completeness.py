@@ -1,5 +1,8 @@
 import os
 import unittest
+import tempfile
+import sqlite3
+from unittest import mock
 import pyodbc
 import pandas as pd
 import numpy as np
@@ -18,6 +21,13 @@ class TestCompletenessClass(unittest.TestCase):
         self.lab_query = self.test_instance.tstRangeQuery_lab()
         self.demographic_query = self.test_instance.tstRangeQuery_demographic()
     
+    @staticmethod
+    def read_sql(df):
+        # stands in for pandas.read_sql_query, compact reads ask for the result in chunks
+        def read_sql_query(query, conn, chunksize=None):
+            return iter([df.copy()]) if chunksize else df.copy()
+        return read_sql_query
+
     def test_database_connection(self):
         # Ensure that conn is a pyodbc Connection object
         expected_conn_type = pyodbc.Connection
@@ -44,6 +54,52 @@ class TestCompletenessClass(unittest.TestCase):
         self.assertFalse(df.empty) # checking if dataframe is empty
         self.assertFalse(df2.empty)
 
+    def test_query_df_cache(self):
+        # the same query (modulo whitespace) should only hit the database once
+        fake_df = pd.DataFrame({'ACCESSIONNUMBER': [1, 2]})
+        self.test_instance.snapshots = None # keep on-disk snapshots out of this check
+        with mock.patch.object(self.test_instance, 'database_connection', return_value=(None, None)), \
+             mock.patch('pandas.read_sql_query', side_effect=self.read_sql(fake_df)) as read_sql:
+            df = self.test_instance.query_df(self.lab_query)
+            df2 = self.test_instance.query_df('  ' + self.lab_query.replace('\n', ' \n  '))
+            self.assertIs(df, df2)
+            self.assertEqual(read_sql.call_count, 1)
+
+            # invalidation hook forces a re-read
+            self.test_instance.clear_query_cache()
+            self.test_instance.query_df(self.lab_query)
+            self.assertEqual(read_sql.call_count, 2)
+
+    def test_query_df_snapshot(self):
+        # a second run against the same export should be served from the snapshot, not ODBC
+        fake_df = pd.DataFrame({'ACCESSIONNUMBER': ['1', '2'], 'RESULTTEXT': ['A', None]})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, 'export.accdb'), 'wb') as f:
+                f.write(b'range export')
+
+            def new_run():
+                return Completeness(
+                    file_name='export.accdb',
+                    lab_name='NameForFile',
+                    folder_path=temp_dir,
+                    test_center_1='Palomar',
+                    snapshot_dir=os.path.join(temp_dir, 'snapshots')
+                )
+
+            with mock.patch.object(Completeness, 'database_connection', return_value=(None, None)), \
+                 mock.patch('pandas.read_sql_query', side_effect=self.read_sql(fake_df)) as read_sql:
+                first_run = new_run()
+                if not first_run.snapshots.available:
+                    self.skipTest('pyarrow is not installed')
+                first_df = first_run.query_df(first_run.tstRangeQuery_lab())
+                self.assertEqual(read_sql.call_count, 1)
+
+                second_run = new_run()
+                df = second_run.query_df(second_run.tstRangeQuery_lab())
+                self.assertEqual(read_sql.call_count, 1)
+                pd.testing.assert_frame_equal(df, first_df)
+                self.assertListEqual(list(df['RESULTTEXT'].isna()), [False, True])
+
     def test_range_query_df(self):
 
         # Checking that both queries produce percent complete columns that are not all null
@@ -90,6 +146,176 @@ class TestCompletenessClass(unittest.TestCase):
         self.assertFalse(lab_df.empty)
         self.assertFalse(demo_df.empty)
     
+    def test_completeness_report_pushdown(self):
+        # COUNT(*) / COUNT(col) pushdown has to give the same sheet as pulling every row,
+        # checked against a small in-memory database with the same tables
+        conn = sqlite3.connect(':memory:')
+        lab_df = pd.DataFrame({field: ['x', None, 'y', None] for field in Completeness.LAB_FIELDS})
+        lab_df['RESULT'] = [None, None, None, 'POS']
+        lab_df['HL7FILENAME'] = ['Palomar_1.hl7', 'Pomerado_2.hl7', 'Palomar_3.hl7', 'Other_4.hl7']
+        lab_df.to_sql(Completeness.LAB_TABLE, conn, index=False)
+        demo_df = pd.DataFrame({field: ['a', 'b', None] for field in Completeness.DEMO_FIELDS})
+        demo_df = demo_df.rename(columns={'Race': 'Reported_Race'})
+        demo_df['Laboratory'] = ['Palomar Medical', 'Pomerado', 'Palomar Medical']
+        demo_df.to_sql(Completeness.DEMO_TABLE, conn, index=False)
+
+        self.test_instance.snapshots = None
+        with mock.patch.object(self.test_instance, 'database_connection', return_value=(conn, conn.cursor())):
+            lab_pushdown, demo_pushdown = self.test_instance.completeness_report(pushdown=True)
+            # only the single-row count queries should have been run
+            self.assertFalse(self.test_instance.is_query_cached(self.lab_query))
+            self.assertFalse(self.test_instance.is_query_cached(self.demographic_query))
+
+            # the report card path keeps the pushdown: the other stages only query their columns
+            self.test_instance.aggregate_pushdown = True
+            tables = self.test_instance.report_tables()
+            pd.testing.assert_frame_equal(tables['lab_completeness'], lab_pushdown)
+            self.assertFalse(self.test_instance.is_query_cached(self.lab_query))
+            self.assertFalse(self.test_instance.is_query_cached(self.demographic_query))
+
+            lab_full, demo_full = self.test_instance.completeness_report(pushdown=False)
+        conn.close()
+
+        pd.testing.assert_frame_equal(lab_pushdown, lab_full)
+        pd.testing.assert_frame_equal(demo_pushdown, demo_full)
+        self.assertEqual(lab_full.loc[lab_full['Fields of Interest'] == 'RESULT', 'Percent Complete'].iloc[0], 0.0)
+        self.assertEqual(demo_full.loc[demo_full['Fields of Interest'] == 'Race', 'Percent Complete'].iloc[0], 66.67)
+
+    def test_test_centers(self):
+        # any number of centers, legacy test_center_N kwargs still work
+        many = Completeness(
+            file_name='export.accdb', lab_name='NameForFile', folder_path='.',
+            test_centers=['Palomar', 'Pomerado', 'Scripps', 'Rady', "O'Connor", 'UCSD'],
+            snapshot_dir=None
+        )
+        lab_filter = many._test_center_filter('HL7FILENAME')
+        self.assertEqual(lab_filter.count(' LIKE '), 6)
+        self.assertIn("LIKE '%O''Connor%'", lab_filter)
+        self.assertNotIn('None', self.lab_query)
+        self.assertListEqual(self.test_instance.test_centers, ['Palomar', 'Pomerado'])
+        with self.assertRaises(ValueError):
+            Completeness(file_name='export.accdb', lab_name='NameForFile', folder_path='.')
+
+    def test_attribute_test_centers(self):
+        instance = Completeness(
+            file_name='export.accdb', lab_name='NameForFile', folder_path='.',
+            test_centers=['Palomar', 'Palomar Medical', 'Pomerado'], snapshot_dir=None
+        )
+        lab_df = pd.DataFrame({
+            'ACCESSIONNUMBER': [1, 2, 3, 4, 5],
+            'HL7FILENAME': ['PALOMAR_1.hl7', 'x_Palomar Medical_2.hl7', 'pomerado_3.hl7', None, 'Other_5.hl7']
+        })
+        instance.attribute_test_centers(lab_df)
+        self.assertListEqual(
+            list(lab_df['test_center'].fillna('-')), ['Palomar', 'Palomar Medical', 'Pomerado', '-', '-']
+        )
+        # attribution columns never show up in the completeness sheet
+        self.assertListEqual(instance.report_fields(lab_df.columns), ['ACCESSIONNUMBER'])
+
+    def test_batch_report_builder(self):
+        # one load for every lab has to give each lab the tables of its own single-lab run
+        conn = sqlite3.connect(':memory:')
+        n = 9
+        lab_df = pd.DataFrame({field: [['x', None, 'y'][i % 3] for i in range(n)] for field in Completeness.LAB_FIELDS})
+        lab_df['ABNORMALFLAG'] = ['H', None, 'L', 'H', 'L', None, 'H', 'H', 'L']
+        lab_df['RESULT'] = ['POS', 'NEG', None, 'POS', 'NEG', 'NEG', None, 'POS', 'POS']
+        lab_df['RESULTTEXT'] = ['A', 'B', 'A', 'C', 'B', 'A', 'C', 'C', 'B']
+        lab_df['HL7FILENAME'] = [f'{center}_{i}.hl7' for i, center in enumerate(
+            ['Palomar', 'Scripps', 'Pomerado', 'Scripps', 'Palomar', 'Other', 'Pomerado', 'Scripps', 'Palomar'])]
+        lab_df.to_sql(Completeness.LAB_TABLE, conn, index=False)
+        demo_df = pd.DataFrame({field: ['a', 'b', None, 'a'] for field in Completeness.DEMO_FIELDS})
+        demo_df = demo_df.rename(columns={'Race': 'Reported_Race'})
+        demo_df['Laboratory'] = ['Palomar Medical', 'Scripps', 'Pomerado', 'Scripps Clinic']
+        demo_df.to_sql(Completeness.DEMO_TABLE, conn, index=False)
+
+        lab_centers = {'Palomar Health': ['Palomar', 'Pomerado'], 'Scripps': ['Scripps']}
+        batch = Completeness.for_labs(lab_centers, 'export.accdb', '.', snapshot_dir=None)
+        written = {}
+
+        def write_report(tables, file_name):
+            written[file_name] = tables
+            return file_name
+
+        with mock.patch.object(batch, 'database_connection', return_value=(conn, conn.cursor())), \
+                mock.patch.object(batch, 'write_report', side_effect=write_report), \
+                mock.patch('pandas.read_sql_query', wraps=pd.read_sql_query) as read_sql:
+            report_files = batch.batch_report_builder(lab_centers)
+            # each table is read once for every lab
+            self.assertEqual(read_sql.call_count, 2)
+        self.assertDictEqual(report_files, {
+            'Palomar Health': 'Palomar Health_data_quality_reports.xlsx',
+            'Scripps': 'Scripps_data_quality_reports.xlsx'
+        })
+
+        for lab, centers in lab_centers.items():
+            single = Completeness(lab_name=lab, file_name='export.accdb', folder_path='.', test_centers=centers, snapshot_dir=None)
+            with mock.patch.object(single, 'database_connection', return_value=(conn, conn.cursor())):
+                expected = single.report_tables()
+            tables = written[report_files[lab]]
+            for name in expected:
+                pd.testing.assert_frame_equal(tables[name], expected[name], check_dtype=False, check_names=False)
+        conn.close()
+
+    def test_stream_report_tables(self):
+        # the chunked pass has to give the same report tables as loading every row
+        conn = sqlite3.connect(':memory:')
+        lab_df = pd.DataFrame({field: ['x', None, 'y', None, 'x'] for field in Completeness.LAB_FIELDS})
+        lab_df['ABNORMALFLAG'] = ['H', None, 'L', 'H', None]
+        lab_df['RESULT'] = ['POS', 'NEG', None, 'POS', 'NEG']
+        lab_df['RESULTTEXT'] = ['A', 'B', 'A', 'C', 'B']
+        lab_df['HL7FILENAME'] = ['Palomar_1.hl7', 'Pomerado_2.hl7', 'Palomar_3.hl7', 'Palomar_4.hl7', 'Other_5.hl7']
+        lab_df.to_sql(Completeness.LAB_TABLE, conn, index=False)
+        demo_df = pd.DataFrame({field: ['a', 'b', None] for field in Completeness.DEMO_FIELDS})
+        demo_df = demo_df.rename(columns={'Race': 'Reported_Race'})
+        demo_df['Laboratory'] = ['Palomar Medical', 'Pomerado', 'Palomar Medical']
+        demo_df.to_sql(Completeness.DEMO_TABLE, conn, index=False)
+
+        self.test_instance.snapshots = None
+        self.test_instance.chunksize = 2
+        with mock.patch.object(self.test_instance, 'database_connection', return_value=(conn, conn.cursor())):
+            streamed = self.test_instance.stream_report_tables()
+            # nothing is materialized in the query cache while streaming
+            self.assertFalse(self.test_instance.is_query_cached(self.lab_query))
+            loaded = self.test_instance.report_tables()
+        conn.close()
+
+        self.assertListEqual(list(streamed), list(loaded))
+        for name in loaded:
+            # value_counts() only names its index on newer pandas
+            pd.testing.assert_frame_equal(streamed[name], loaded[name], check_dtype=False, check_names=False)
+
+    def test_projected_df(self):
+        # a stage only queries the columns it declares, or slices the full result once it is loaded
+        conn = sqlite3.connect(':memory:')
+        lab_df = pd.DataFrame({field: ['x', None, 'y'] for field in Completeness.LAB_FIELDS})
+        lab_df['RESULTTEXT'] = ['A', 'B', 'A']
+        lab_df['HL7FILENAME'] = ['Palomar_1.hl7', 'Pomerado_2.hl7', 'Other_3.hl7']
+        lab_df.to_sql(Completeness.LAB_TABLE, conn, index=False)
+
+        self.test_instance.snapshots = None
+        with mock.patch.object(self.test_instance, 'database_connection', return_value=(conn, conn.cursor())), \
+                mock.patch('pandas.read_sql_query', wraps=pd.read_sql_query) as read_sql:
+            narrow = self.test_instance.stage_df('blank_reference_range')
+            self.assertListEqual(list(narrow.columns), ['RESULTTEXT', 'REFERENCERANGE', 'HL7FILENAME', 'test_center'])
+            self.assertNotIn('ACCESSIONNUMBER', read_sql.call_args[0][0])
+            expected_freq = self.test_instance.result_test()
+            self.assertEqual(read_sql.call_count, 1)
+
+            full = self.test_instance.query_df(self.lab_query)
+            self.assertEqual(read_sql.call_count, 2)
+            sliced = self.test_instance.stage_df('blank_reference_range')
+            self.assertEqual(read_sql.call_count, 2)
+            pd.testing.assert_frame_equal(sliced, narrow)
+            with mock.patch.object(self.test_instance, 'null_mask', wraps=self.test_instance.null_mask) as null_mask:
+                pd.testing.assert_frame_equal(self.test_instance.result_test(), expected_freq)
+            # with the full table loaded the blank reference ranges come from its shared null mask
+            null_mask.assert_called_once_with(self.lab_query)
+            self.assertEqual(len(full.columns), len(Completeness.LAB_FIELDS) + 2)
+        conn.close()
+
+        with self.assertRaises(ValueError):
+            self.test_instance.tstRangeQuery_lab(['NOTAFIELD'])
+
     def test_cross_tab_df(self):
         df = pd.DataFrame(
             {
@@ -130,6 +356,55 @@ class TestCompletenessClass(unittest.TestCase):
         self.assertFalse(result.index.isnull().any())
         self.assertFalse(result.columns.isnull().any())
     
+    def test_cross_tab_df_matches_loop(self):
+        # vectorized crosstab has to give exactly what the old row-by-row loop gave,
+        # including row / column order, NaN for unseen pairs and the dtypes
+        rng = np.random.default_rng(0)
+        pools = [
+            ['hispanic or latino', 'not hispanic or latino', None, np.nan],
+            ['white', 'asian', 'black', None, 'other'],
+            ['POS', 'NEG', 'H', 'L', np.nan],
+            ['only value']
+        ]
+        for _ in range(50):
+            size = int(rng.integers(0, 60))
+            col1 = pools[rng.integers(0, len(pools))]
+            col2 = pools[rng.integers(0, len(pools))]
+            df = pd.DataFrame({
+                'Ethnicity': pd.Series([col1[i] for i in rng.integers(0, len(col1), size)], dtype=object),
+                'Race': pd.Series([col2[i] for i in rng.integers(0, len(col2), size)], dtype=object)
+            })
+            expected = self.loop_cross_tab(df, 'Ethnicity', 'Race')
+            result = self.test_instance.cross_tab_df(df, 'Ethnicity', 'Race')
+            pd.testing.assert_frame_equal(result, expected)
+
+    def loop_cross_tab(self, df, index, column):
+        '''
+        Helper for test_cross_tab_df_matches_loop(). The original iterrows implementation of
+        cross_tab_df, kept as the reference output.
+        '''
+        counts = {}
+        for _, row in df.iterrows():
+            col1_val = row[index]
+            col2_val = row[column]
+            if col1_val in (np.nan, None):
+                col1_val = 'N/A'
+            if col2_val in (np.nan, None):
+                col2_val = 'N/A'
+            if col1_val not in counts:
+                counts[col1_val] = {}
+            if col2_val in counts[col1_val]:
+                counts[col1_val][col2_val] += 1
+            else:
+                counts[col1_val][col2_val] = 1
+        new_df = pd.DataFrame(counts)
+        new_df.index = new_df.index.fillna(None)
+        new_df.columns = new_df.columns.fillna(None)
+        new_df['Total'] = new_df.sum(axis=1)
+        new_df.loc['Total'] = new_df.sum(axis=0)
+        new_df.index.name = f'{index} vs {column}'
+        return new_df
+
     def test_result_test(self):
         result_df = self.test_instance.result_test()
 
@@ -209,7 +484,10 @@ class TestCompletenessClass(unittest.TestCase):
             'Race',
             'Ethnicity',
             'Sex',
-            'Incident_ID'
+            'Incident_ID',
+            'HL7FILENAME',
+            'Laboratory',
+            'test_center'
         ]
         # testing to see if the columns are in expected columns
         self.assertTrue(all(col in expected_columns for col in combined_df.columns))
@@ -0,0 +1,60 @@
+import sqlite3
+import unittest
+from connection_manager import ConnectionManager
+
+
+class TestConnectionManager(unittest.TestCase):
+    def setUp(self):
+        self.connect_calls = 0
+
+        def connect():
+            self.connect_calls += 1
+            return sqlite3.connect(':memory:')
+
+        self.manager = ConnectionManager(
+            connect=connect,
+            health_check=lambda conn, cursor: cursor.execute('SELECT 1')
+        )
+
+    def test_lazy_connect_and_reuse(self):
+        # nothing is opened until a connection is asked for
+        self.assertEqual(self.connect_calls, 0)
+        self.assertIsNone(self.manager.conn)
+
+        conn, cursor = self.manager.get_connection()
+        conn2, cursor2 = self.manager.get_connection()
+        self.assertIs(conn, conn2)
+        self.assertIs(cursor, cursor2)
+        self.assertEqual(self.connect_calls, 1)
+        self.assertEqual(self.manager.counts['connect'], 1)
+
+    def test_reconnect_after_failed_health_check(self):
+        conn, _ = self.manager.get_connection()
+        conn.close() # simulate the share dropping out from under us
+        self.assertFalse(self.manager.is_healthy())
+
+        new_conn, _ = self.manager.get_connection()
+        self.assertIsNot(conn, new_conn)
+        self.assertEqual(self.connect_calls, 2)
+        self.assertTrue(self.manager.is_healthy())
+
+    def test_context_manager_closes(self):
+        with self.manager as manager:
+            conn, _ = manager.get_connection()
+            with manager.timer('query'):
+                conn.execute('SELECT 1')
+        self.assertIsNone(self.manager.conn)
+        self.assertIsNone(self.manager.cursor)
+        self.assertEqual(self.manager.counts['query'], 1)
+        self.assertGreaterEqual(self.manager.timings['query'], 0.0)
+
+        # closed connection cannot be used anymore
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+
+        # closing twice is fine
+        self.manager.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
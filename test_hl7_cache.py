@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from hl7_cache import HL7Cache
+
+
+class TestHL7Cache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'hl7_cache.sqlite')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hits_and_misses(self):
+        cache = HL7Cache(self.path)
+        self.assertIsNone(cache.get(123))
+        cache.put(123, 'MSH|1')
+        self.assertEqual(cache.get('123'), 'MSH|1')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.close()
+
+        # persists across runs
+        cache = HL7Cache(self.path)
+        self.assertEqual(cache.get(123), 'MSH|1')
+        cache.close()
+
+    def test_ttl(self):
+        cache = HL7Cache(self.path, ttl_seconds=60)
+        with mock.patch('hl7_cache.time.time', return_value=1000.0):
+            cache.put('A1', 'MSH|1')
+        with mock.patch('hl7_cache.time.time', return_value=1030.0):
+            self.assertEqual(cache.get('A1'), 'MSH|1')
+        with mock.patch('hl7_cache.time.time', return_value=1100.0):
+            self.assertIsNone(cache.get('A1'))
+        self.assertEqual(len(cache), 0)
+        cache.close()
+
+    def test_lru_eviction(self):
+        cache = HL7Cache(self.path, ttl_seconds=None, max_entries=2)
+        with mock.patch('hl7_cache.time.time', return_value=1.0):
+            cache.put('A1', 'MSH|1')
+        with mock.patch('hl7_cache.time.time', return_value=2.0):
+            cache.put('A2', 'MSH|2')
+        with mock.patch('hl7_cache.time.time', return_value=3.0):
+            cache.get('A1')
+        with mock.patch('hl7_cache.time.time', return_value=4.0):
+            cache.put('A3', 'MSH|3')
+        # A2 is the least recently used
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('A2'))
+        self.assertEqual(cache.get('A1'), 'MSH|1')
+        self.assertEqual(cache.get('A3'), 'MSH|3')
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
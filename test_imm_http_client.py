@@ -0,0 +1,122 @@
+import threading
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from imm_http_client import IMMHttpClient, IMMHttpError
+
+LOGIN_PAGE = '''<html><body>
+<form method="post" action="./login.aspx" id="form1">
+<input type="hidden" name="__VIEWSTATE" value="login-state" />
+<input type="hidden" name="__EVENTVALIDATION" value="login-validation" />
+<input name="txtUsername" type="text" id="txtUsername" />
+<input name="txtPassword" type="password" id="txtPassword" />
+<input type="submit" name="btnLogin" value="Login" id="btnLogin" />
+<input type="submit" name="btnForgot" value="Forgot password" />
+</form></body></html>'''
+
+IMM_PAGE = '''<html><body>
+<form method="post" action="imm.aspx" id="form1">
+<input type="hidden" name="__VIEWSTATE" value="{state}" />
+<input name="txtAccession" type="text" value="" id="txtAccession" />
+<input type="image" name="ibtnSearch" id="ibtnSearch" src="search.gif" />
+</form>
+<div id="divContentsArea">{contents}</div>
+</body></html>'''
+
+
+class StubWebCMR(BaseHTTPRequestHandler):
+    """
+    Mimics the WebCMR login page and the IMM search postback.
+    """
+
+    searches = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, html, cookie=None):
+        body = html.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if cookie:
+            self.send_header('Set-Cookie', cookie)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _logged_in(self):
+        return 'ASP.NET_SessionId=abc' in (self.headers.get('Cookie') or '')
+
+    def do_GET(self):
+        if self.path.endswith('login.aspx'):
+            self._send(LOGIN_PAGE)
+        elif self.path.endswith('imm.aspx') and self._logged_in():
+            self._send(IMM_PAGE.format(state='imm-state-0', contents=''))
+        else:
+            self._send(LOGIN_PAGE)
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+        if self.path.endswith('login.aspx'):
+            ok = (
+                form.get('txtUsername') == ['user'] and form.get('txtPassword') == ['secret']
+                and form.get('__VIEWSTATE') == ['login-state'] and form.get('btnLogin') == ['Login']
+                and 'btnForgot' not in form
+            )
+            if ok:
+                self._send('<html><body>Home</body></html>', cookie='ASP.NET_SessionId=abc; Path=/')
+            else:
+                self._send(LOGIN_PAGE)
+        elif self.path.endswith('imm.aspx') and self._logged_in():
+            # the postback has to carry the view state of the page it came from
+            state = form['__VIEWSTATE'][0]
+            n = len(type(self).searches)
+            if state != f'imm-state-{n}' or 'ibtnSearch.x' not in form:
+                self._send('<html><body>Invalid postback</body></html>')
+                return
+            acc_num = form['txtAccession'][0]
+            type(self).searches.append(acc_num)
+            contents = f'<table><tr><td>MSH|^~\\&amp;|LAB</td></tr><tr><td>OBR|1|{acc_num}</td></tr></table>'
+            self._send(IMM_PAGE.format(state=f'imm-state-{n + 1}', contents=contents))
+        else:
+            self._send(LOGIN_PAGE)
+
+
+class TestIMMHttpClient(unittest.TestCase):
+    def setUp(self):
+        StubWebCMR.searches = []
+        self.server = HTTPServer(('127.0.0.1', 0), StubWebCMR)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        base = f'http://127.0.0.1:{self.server.server_port}'
+        self.login_url = base + '/pages/login/login.aspx'
+        self.imm_url = base + '/pages/admin/imm.aspx'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_login_and_search(self):
+        client = IMMHttpClient(self.login_url, self.imm_url, 'user', 'secret').login()
+        first = client.search('ACC1')
+        second = client.search('ACC2')
+        client.quit()
+
+        self.assertEqual(first, 'MSH|^~\\&|LAB\nOBR|1|ACC1')
+        self.assertEqual(second, 'MSH|^~\\&|LAB\nOBR|1|ACC2')
+        self.assertListEqual(StubWebCMR.searches, ['ACC1', 'ACC2'])
+
+    def test_rejected_login(self):
+        client = IMMHttpClient(self.login_url, self.imm_url, 'user', 'wrong')
+        with self.assertRaises(IMMHttpError):
+            client.login()
+
+    def test_search_without_login(self):
+        client = IMMHttpClient(self.login_url, self.imm_url, 'user', 'secret')
+        with self.assertRaises(IMMHttpError):
+            client.search('ACC1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 import unittest
 from unittest import mock
 from menu import Menu
@@ -50,5 +51,12 @@ class TestGetInput(unittest.TestCase):
             self.assertListEqual(test_centers, ['test_center_1', 'test_center_2'])
 
 
+    def test_find_accdb_files(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for name in ['b.accdb', 'a.accdb', 'notes.txt']:
+                open(os.path.join(temp_dir, name), 'a').close()
+            self.assertListEqual(self.menu.find_accdb_files(temp_dir), ['a.accdb', 'b.accdb'])
+
+
 if __name__ == '__main__':
     unittest.main()
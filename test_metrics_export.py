@@ -0,0 +1,100 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+import metrics_export
+from Completeness import Completeness
+from metrics_export import crosstab_long, write_metrics
+
+
+class TestMetricsExport(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.report_maker = Completeness(
+            lab_name='Palomar Health',
+            file_name='export.accdb',
+            folder_path='.',
+            test_centers=['Palomar'],
+            snapshot_dir=None
+        )
+        n = 9
+        lab_df = pd.DataFrame({field: [['x', None, 'y'][i % 3] for i in range(n)] for field in Completeness.LAB_FIELDS})
+        lab_df['ABNORMALFLAG'] = ['H', None, 'L', 'H', 'L', None, 'H', 'H', 'L']
+        # labels mixing numbers and text
+        lab_df['RESULT'] = [1.5, 'NEG', None, 1.5, 'NEG', 'NEG', None, 'POS', 'POS']
+        lab_df['RESULTTEXT'] = ['A', 'B', 'A', 'C', 'B', 'A', 'C', 'C', 'B']
+        demo_df = pd.DataFrame({field: ['a', 'b', None, 'a'] for field in Completeness.DEMO_FIELDS})
+        self.tables = self.report_maker.frame_report_tables(demo_df, lab_df)
+        self.violations = pd.DataFrame({
+            'rule_id': ['collect_after_receive', 'receive_after_result'],
+            'row': [1, 4],
+            'ACCESSIONNUMBER': ['A1', 'A4'],
+            'RESULTTEXT': ['B', 'B']
+        })
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_crosstab_long(self):
+        crosstab = self.tables['result_abflag']
+        long_df = crosstab_long(crosstab)
+        self.assertListEqual(list(long_df.columns), ['ABNORMALFLAG', 'RESULT', 'count'])
+        self.assertEqual(long_df['count'].sum(), crosstab.loc['Total', 'Total'])
+        counts = long_df.set_index(['ABNORMALFLAG', 'RESULT'])['count']
+        self.assertEqual(counts[('H', 1.5)], 2)
+        self.assertEqual(counts[('N/A', 'NEG')], 2)
+
+    def check_export(self, fmt, read):
+        output_dir = os.path.join(self.tmp_dir.name, fmt)
+        tables = dict(self.tables, date_violations=self.violations)
+        manifest_path = write_metrics(tables, output_dir, fmt, run_info={'lab_name': 'Palomar Health'})
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['format'], fmt)
+        self.assertEqual(manifest['run']['lab_name'], 'Palomar Health')
+        self.assertListEqual([entry['table'] for entry in manifest['tables']], list(tables))
+
+        files = {entry['table']: read(os.path.join(output_dir, entry['file'])) for entry in manifest['tables']}
+        for entry in manifest['tables']:
+            self.assertEqual(len(files[entry['table']]), entry['rows'])
+            self.assertListEqual(list(files[entry['table']].columns), entry['columns'])
+        pd.testing.assert_frame_equal(files['lab_completeness'], self.tables['lab_completeness'], check_dtype=False)
+        self.assertEqual(files['race_ethnicity']['count'].sum(), self.tables['race_ethnicity'].loc['Total', 'Total'])
+        self.assertListEqual(list(files['blank_reference_range']['Frequency']),
+                             list(self.tables['blank_reference_range']['Frequency']))
+        self.assertListEqual(list(files['date_violations']['rule_id']), list(self.violations['rule_id']))
+
+    def test_ndjson(self):
+        self.check_export('ndjson', lambda path: pd.read_json(path, orient='records', lines=True, dtype=False))
+
+    @unittest.skipIf(metrics_export.pyarrow is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        self.check_export('parquet', pd.read_parquet)
+
+    def test_report_builder_without_excel(self):
+        self.report_maker = Completeness(
+            lab_name='Palomar Health',
+            file_name='export.accdb',
+            folder_path='.',
+            test_centers=['Palomar'],
+            snapshot_dir=None,
+            metrics_format='ndjson',
+            metrics_dir=os.path.join(self.tmp_dir.name, 'metrics'),
+            write_excel=False
+        )
+        with mock.patch.object(self.report_maker, 'compute_report_tables', return_value=self.tables), \
+                mock.patch.object(self.report_maker, 'write_report') as write_report:
+            self.report_maker.report_builder()
+        write_report.assert_not_called()
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir.name, 'metrics', 'manifest.json')))
+        self.assertEqual(self.report_maker.metrics_dir_name(), 'Palomar Health_data_quality_metrics')
+
+        with self.assertRaises(ValueError):
+            Completeness(lab_name='x', file_name='export.accdb', folder_path='.', test_centers=['Palomar'], write_excel=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import pandas as pd
+import numpy as np
+from null_mask import NullMaskIndex
+
+
+class TestNullMaskIndex(unittest.TestCase):
+    def setUp(self):
+        # 11 rows so the packed mask has a partially filled last byte
+        self.df = pd.DataFrame({
+            'ACCESSIONNUMBER': ['A' + str(i) for i in range(11)],
+            'REFERENCERANGE': [None, 'x', 'x', np.nan, 'x', 'x', 'x', 'x', 'x', None, 'x'],
+            'RESULT': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, np.nan, np.nan],
+        })
+        self.index = NullMaskIndex(self.df)
+
+    def test_counts_match_pandas(self):
+        pd.testing.assert_series_equal(self.index.null_counts(), self.df.isna().sum(), check_dtype=False)
+        pd.testing.assert_series_equal(self.index.non_null_counts(), self.df.count(), check_dtype=False)
+        expected = self.df.count() / len(self.df) * 100
+        pd.testing.assert_series_equal(self.index.percent_complete(), expected)
+
+    def test_first_missing(self):
+        self.assertIsNone(self.index.first_missing('ACCESSIONNUMBER'))
+        self.assertEqual(self.index.first_missing('REFERENCERANGE'), 0)
+        self.assertEqual(self.index.first_missing('RESULT'), 9)
+
+    def test_missing_rows(self):
+        missing = self.index.missing_rows('REFERENCERANGE')
+        self.assertEqual(len(missing), len(self.df))
+        self.assertListEqual(list(np.flatnonzero(missing)), [0, 3, 9])
+
+    def test_take(self):
+        positions = np.array([9, 0, 3, 10, 4])
+        taken = self.index.take(positions)
+        expected = NullMaskIndex(self.df.take(positions))
+        self.assertListEqual(taken.columns, expected.columns)
+        np.testing.assert_array_equal(taken.bits, expected.bits)
+        self.assertEqual(taken.first_missing('RESULT'), 0)
+        self.assertEqual(self.index.take(np.array([], dtype=np.intp)).n_rows, 0)
+
+    def test_from_missing(self):
+        index = NullMaskIndex.from_missing(self.index.missing_matrix(['RESULT', 'REFERENCERANGE']), ['RESULT', 'REFERENCERANGE'])
+        expected = NullMaskIndex(self.df[['RESULT', 'REFERENCERANGE']])
+        np.testing.assert_array_equal(index.bits, expected.bits)
+        pd.testing.assert_series_equal(index.null_counts(), expected.null_counts())
+
+    def test_empty_frame(self):
+        index = NullMaskIndex(self.df.iloc[:0])
+        self.assertTrue((index.null_counts() == 0).all())
+        self.assertTrue(index.percent_complete().isna().all())
+        self.assertIsNone(index.first_missing('RESULT'))
+
+
+if __name__ == '__main__':
+    unittest.main()
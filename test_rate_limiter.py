@@ -0,0 +1,37 @@
+import threading
+import time
+import unittest
+from rate_limiter import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_permits_are_spaced_across_threads(self):
+        limiter = RateLimiter(min_interval=0.05)
+        permits = []
+        lock = threading.Lock()
+
+        def take():
+            limiter.wait()
+            with lock:
+                permits.append(time.monotonic())
+
+        threads = [threading.Thread(target=take) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        permits.sort()
+        gaps = [later - earlier for earlier, later in zip(permits, permits[1:])]
+        self.assertEqual(len(permits), 4)
+        # small tolerance for timer resolution
+        self.assertTrue(all(gap >= 0.04 for gap in gaps), gaps)
+
+    def test_disabled(self):
+        limiter = RateLimiter(min_interval=0)
+        self.assertEqual(limiter.wait(), 0)
+        self.assertEqual(limiter.wait(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+import openpyxl
+import pandas as pd
+from Completeness import Completeness
+from report_writer import StreamingReportWriter
+
+
+class TestStreamingReportWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.report_maker = Completeness(
+            lab_name='NameForFile',
+            file_name='export.accdb',
+            folder_path='.',
+            test_centers=['Palomar'],
+            snapshot_dir=None
+        )
+        n = 12
+        lab_df = pd.DataFrame({field: [['x', None, 'y'][i % 3] for i in range(n)] for field in Completeness.LAB_FIELDS})
+        lab_df['ABNORMALFLAG'] = [['H', None, 'L'][i % 3] for i in range(n)]
+        # a wide crosstab, every result is its own column
+        lab_df['RESULT'] = [f'R{i}' for i in range(n)]
+        lab_df['RESULTTEXT'] = [['A', 'B', 'C', 'D'][i % 4] for i in range(n)]
+        demo_df = pd.DataFrame({field: ['a', 'b', None, 'a'] for field in Completeness.DEMO_FIELDS})
+        self.tables = self.report_maker.frame_report_tables(demo_df, lab_df)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def sheet_values(file_name):
+        workbook = openpyxl.load_workbook(file_name)
+        values = {
+            sheet.title: [[cell for cell in row] for row in sheet.iter_rows(values_only=True)]
+            for sheet in workbook.worksheets
+        }
+        workbook.close()
+        return values
+
+    def test_same_workbook_as_pandas(self):
+        pandas_file = os.path.join(self.tmp_dir.name, 'pandas.xlsx')
+        streaming_file = os.path.join(self.tmp_dir.name, 'streaming.xlsx')
+        self.report_maker.write_report(self.tables, file_name=pandas_file)
+        self.report_maker.streaming_excel = True
+        with self.assertLogs(level='INFO') as logs:
+            self.assertEqual(self.report_maker.write_report(self.tables, file_name=streaming_file), streaming_file)
+
+        expected = self.sheet_values(pandas_file)
+        written = self.sheet_values(streaming_file)
+        self.assertListEqual(list(written), list(expected))
+        for sheet_name in expected:
+            self.assertListEqual(written[sheet_name], expected[sheet_name], sheet_name)
+        for sheet_name in expected:
+            self.assertTrue(any(f'Wrote sheet {sheet_name}' in line for line in logs.output), sheet_name)
+
+    def test_sheet_stats(self):
+        file_name = os.path.join(self.tmp_dir.name, 'streaming.xlsx')
+        with StreamingReportWriter(file_name) as writer:
+            self.assertTrue(writer.workbook.constant_memory)
+            writer.write_frame('Result_AbFlag', self.tables['result_abflag'])
+        self.assertListEqual(list(writer.sheet_stats), ['Result_AbFlag'])
+        self.assertGreater(writer.sheet_stats['Result_AbFlag']['peak_bytes'], 0)
+        self.assertNotIn('traced_peak_bytes', writer.sheet_stats['Result_AbFlag'])
+        self.assertTrue(os.path.isfile(file_name))
+
+        # tracemalloc only runs when asked for
+        with StreamingReportWriter(file_name, trace_memory=True) as writer:
+            writer.write_frame('Result_AbFlag', self.tables['result_abflag'])
+        self.assertGreater(writer.sheet_stats['Result_AbFlag']['traced_peak_bytes'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import pandas as pd
+import numpy as np
+from snapshot_cache import SnapshotCache, file_content_hash, pa
+
+
+@unittest.skipIf(pa is None, 'pyarrow is not installed')
+class TestSnapshotCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = SnapshotCache(os.path.join(self.temp_dir.name, 'snapshots'))
+        self.df = pd.DataFrame({
+            'ACCESSIONNUMBER': ['A1', 'A2', None],
+            'RESULTTEXT': ['COVID', None, 'FLU'],
+            'IncidentID': [1.0, 2.0, np.nan]
+        })
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        key = self.cache.key('abc', 'SELECT * FROM x')
+        self.assertIsNone(self.cache.load(key))
+
+        self.cache.save(key, self.df)
+        pd.testing.assert_frame_equal(self.cache.load(key), self.df)
+
+    def test_key(self):
+        # whitespace does not matter, export content and query do
+        key = self.cache.key('abc', 'SELECT *\n   FROM x')
+        self.assertEqual(key, self.cache.key('abc', ' SELECT * FROM x '))
+        self.assertNotEqual(key, self.cache.key('abd', 'SELECT * FROM x'))
+        self.assertNotEqual(key, self.cache.key('abc', "SELECT * FROM x WHERE y LIKE '%Palomar%'"))
+
+    def test_file_content_hash(self):
+        path = os.path.join(self.temp_dir.name, 'export.accdb')
+        with open(path, 'wb') as f:
+            f.write(b'range export')
+        first = file_content_hash(path, chunk_size=4)
+        with open(path, 'wb') as f:
+            f.write(b'range export 2')
+        self.assertNotEqual(first, file_content_hash(path, chunk_size=4))
+
+    def test_lru_eviction(self):
+        keys = [self.cache.key('abc', f'query {i}') for i in range(3)]
+        self.cache.save(keys[0], self.df)
+        self.cache.max_bytes = 2 * os.path.getsize(self.cache.path(keys[0]))
+        self.cache.save(keys[1], self.df)
+
+        # touch the first snapshot so the second becomes the least recently used
+        time.sleep(0.05)
+        self.cache.load(keys[0])
+        time.sleep(0.05)
+        self.cache.save(keys[2], self.df)
+
+        self.assertTrue(os.path.isfile(self.cache.path(keys[0])))
+        self.assertFalse(os.path.isfile(self.cache.path(keys[1])))
+        self.assertTrue(os.path.isfile(self.cache.path(keys[2])))
+
+    def test_concurrent_eviction(self):
+        # another process sharing the folder removes snapshots while this one evicts
+        keys = [self.cache.key('abc', f'query {i}') for i in range(3)]
+        for key in keys:
+            self.cache.save(key, self.df)
+            time.sleep(0.05)
+        self.cache.max_bytes = os.path.getsize(self.cache.path(keys[0]))
+        stat = os.stat
+
+        def gone_stat(path, *args, **kwargs):
+            if path == self.cache.path(keys[1]):
+                raise FileNotFoundError(path)
+            return stat(path, *args, **kwargs)
+
+        with mock.patch('snapshot_cache.os.stat', side_effect=gone_stat), \
+                mock.patch('snapshot_cache.os.remove', side_effect=FileNotFoundError):
+            self.cache.evict()
+        with mock.patch('snapshot_cache.os.utime', side_effect=FileNotFoundError):
+            pd.testing.assert_frame_equal(self.cache.load(keys[2]), self.df)
+
+
+if __name__ == '__main__':
+    unittest.main()